@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark log extraction, recording results as JSON so they can be compared between commits.
+
+The compression benchmark parses and exports a log through each compression codec and through
+plain files, measuring wall and CPU time along with the bytes read and written on disk.
+
+The throughput benchmark measures lines per second for each stage: reading, parsing entries,
+annotating segments and exporting to each output format, plus the peak memory of loading a log.
+Without a log to benchmark with, it generates a synthetic one of the requested size.
+"""
+
+import os
+import json
+import time
+import shutil
+import tempfile
+import statistics
+import tracemalloc
+from typing import Any, Dict, List, Optional, Tuple
+
+from extract_ride_data import ZeroLogFile, ZeroLogHeader, open_log_file, COMPRESSION_OPENERS
+from generate_logs import write_log
+
+PROC_IO_FILEPATH = '/proc/self/io'
+
+
+def read_process_io() -> Optional[Dict[str, int]]:
+    """I/O counters of this process where the platform provides them (Linux)."""
+    if not os.path.exists(PROC_IO_FILEPATH):
+        return None
+    with open(PROC_IO_FILEPATH) as io_file:
+        return {name: int(value) for name, value in (line.split(':') for line in io_file)}
+
+
+def measure(function, *args, **kwargs) -> Dict[str, float]:
+    """Time one call, with the process I/O it caused."""
+    return measure_call(function, *args, **kwargs)[1]
+
+
+def measure_call(function, *args, **kwargs) -> Tuple[Any, Dict[str, float]]:
+    """Time one call, with the process I/O it caused, and return what it returned too."""
+    io_before = read_process_io()
+    cpu_before = time.process_time()
+    wall_before = time.perf_counter()
+    returned = function(*args, **kwargs)
+    result = {'wall_seconds': time.perf_counter() - wall_before,
+              'cpu_seconds': time.process_time() - cpu_before}
+    io_after = read_process_io()
+    if io_before and io_after:
+        for counter in ['rchar', 'wchar', 'read_bytes', 'write_bytes']:
+            result[counter] = io_after[counter] - io_before[counter]
+    return returned, result
+
+
+def summarize(runs: List[Dict[str, float]]) -> Dict[str, float]:
+    """Median of each measurement across repeated runs."""
+    return {key: statistics.median(run[key] for run in runs) for key in runs[0]}
+
+
+def parse_and_export(log_filepath: str, output_filepath: str, output_format: str, compresslevel=None):
+    """The measured workload: parse a log and export it in one format."""
+    log_file = ZeroLogFile(log_filepath, verbose=-1)
+    log_file.output_to_file(output_filepath, output_format, compresslevel=compresslevel, verbose=-1)
+
+
+def benchmark_compression(log_filepath: str, output_format='csv', compresslevel=None, repeat=3,
+                          work_dir=None) -> Dict[str, Dict[str, float]]:
+    """Compare parsing and exporting through each codec against plain files."""
+    results = {}
+    with tempfile.TemporaryDirectory(dir=work_dir) as temp_dir:
+        with open_log_file(log_filepath) as log_file:
+            plain_filepath = os.path.join(temp_dir, 'log.txt')
+            with open(plain_filepath, 'w') as plain_file:
+                shutil.copyfileobj(log_file, plain_file)
+        for suffix in [''] + list(COMPRESSION_OPENERS):
+            input_filepath = plain_filepath + suffix
+            if suffix:
+                with open(plain_filepath) as plain_file, \
+                        open_log_file(input_filepath, 'w', compresslevel=compresslevel) as compressed_file:
+                    shutil.copyfileobj(plain_file, compressed_file)
+            output_filepath = os.path.join(temp_dir, 'output.' + output_format + suffix)
+            runs = [measure(parse_and_export, input_filepath, output_filepath, output_format,
+                            compresslevel=compresslevel)
+                    for _ in range(repeat)]
+            result = summarize(runs)
+            result['input_bytes'] = os.path.getsize(input_filepath)
+            result['output_bytes'] = os.path.getsize(output_filepath)
+            results[suffix.lstrip('.') or 'plain'] = result
+    return results
+
+
+def read_log_lines(log_filepath: str) -> List[str]:
+    """The first stage: read the lines of a log."""
+    with open_log_file(log_filepath) as log_file:
+        return log_file.readlines()
+
+
+def parse_entries(log_lines: List[str]) -> list:
+    """The second stage: decode the header and each entry."""
+    header = ZeroLogHeader(log_lines)
+    start_index = header.index_of_divider_line(log_lines) + 1
+    return list(ZeroLogFile.read_entries(log_lines[start_index:], start_index=start_index, verbose=-1))
+
+
+def annotate_entries(entries: list) -> list:
+    """The third stage: annotate ride and charge segments."""
+    return list(ZeroLogFile.annotate_segments(entries))
+
+
+def peak_memory_of(function, *args, **kwargs) -> int:
+    """The peak bytes allocated by Python during one call."""
+    tracemalloc.start()
+    try:
+        function(*args, **kwargs)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def benchmark_throughput(log_filepath: str, output_formats=('csv', 'tsv', 'json', 'jsonl', 'sqlite'), repeat=3,
+                         work_dir=None) -> Dict[str, Dict[str, float]]:
+    """Measure each stage of extraction, in lines per second, and the peak memory of loading the log."""
+    stage_runs = {}
+
+    def run_stage(stage, function, *args, **kwargs):
+        returned, result = measure_call(function, *args, **kwargs)
+        stage_runs.setdefault(stage, []).append(result)
+        return returned
+
+    for _ in range(repeat):
+        log_lines = run_stage('read', read_log_lines, log_filepath)
+        entries = run_stage('parse', parse_entries, log_lines)
+        run_stage('annotate', annotate_entries, entries)
+    log_file = ZeroLogFile(log_filepath, verbose=-1)
+    with tempfile.TemporaryDirectory(dir=work_dir) as temp_dir:
+        for output_format in output_formats:
+            output_filepath = os.path.join(temp_dir, 'output.' + output_format)
+            for _ in range(repeat):
+                run_stage('export_' + output_format, log_file.output_to_file, output_filepath, output_format,
+                          verbose=-1)
+    results = {}
+    for stage, runs in stage_runs.items():
+        result = summarize(runs)
+        result['lines_per_second'] = len(log_file.entries) / result['wall_seconds'] if result['wall_seconds'] else 0.0
+        results[stage] = result
+    results['memory'] = {'entries': len(log_file.entries),
+                         'input_bytes': os.path.getsize(log_filepath),
+                         'peak_bytes': peak_memory_of(ZeroLogFile, log_filepath, verbose=-1)}
+    return results
+
+
+def print_results_table(results: Dict[str, Dict[str, float]]):
+    """Print one line per benchmark case."""
+    for case, result in results.items():
+        if 'peak_bytes' in result:
+            print('{:14} {:>12,} entries  peak {:>14,} B'.format(case, result['entries'], result['peak_bytes']))
+            continue
+        line = '{:14} wall {:8.3f}s  cpu {:8.3f}s'.format(case, result['wall_seconds'], result['cpu_seconds'])
+        if 'lines_per_second' in result:
+            line += '  {:>12,.0f} lines/s'.format(result['lines_per_second'])
+        if 'input_bytes' in result:
+            line += '  in {:>12,} B  out {:>12,} B'.format(result['input_bytes'], result['output_bytes'])
+        print(line)
+
+
+if __name__ == "__main__":
+    import sys
+    import argparse
+    import platform
+
+    ARGS_PARSER = argparse.ArgumentParser()
+    SUBCOMMANDS = ARGS_PARSER.add_subparsers(dest='benchmark')
+    COMPRESSION_ARGS = SUBCOMMANDS.add_parser('compression',
+                                              help="compare parsing and exporting through compression codecs")
+    COMPRESSION_ARGS.add_argument("logfile",
+                                  help="the parsed log file to benchmark with")
+    COMPRESSION_ARGS.add_argument("--format", default='csv',
+                                  choices=['csv', 'tsv', 'json', 'jsonl'],
+                                  help="the output format to export")
+    COMPRESSION_ARGS.add_argument("--compress-level", type=int, dest='compress_level',
+                                  help="the compression level for inputs and outputs")
+    COMPRESSION_ARGS.add_argument("--repeat", type=int, default=3,
+                                  help="how many times to run each case; the median is reported")
+    COMPRESSION_ARGS.add_argument("--work-dir", dest='work_dir',
+                                  help="where to write temporary files (default: system temp dir)")
+    THROUGHPUT_ARGS = SUBCOMMANDS.add_parser('throughput',
+                                             help="measure lines per second of each stage, and peak memory")
+    THROUGHPUT_ARGS.add_argument("logfile", nargs='?',
+                                 help="the parsed log file to benchmark with (default: generate one)")
+    THROUGHPUT_ARGS.add_argument("--generate", type=int, default=100000,
+                                 help="how many entries to generate when no log file is given")
+    THROUGHPUT_ARGS.add_argument("--source", default='MBB', choices=['MBB', 'BMS'],
+                                 help="which kind of log to generate")
+    THROUGHPUT_ARGS.add_argument("--seed", type=int, default=0,
+                                 help="the random seed of the generated log")
+    THROUGHPUT_ARGS.add_argument("--formats", default='csv,tsv,json,jsonl,sqlite',
+                                 type=lambda formats: [out_format.strip() for out_format in formats.split(',')],
+                                 help="the comma-separated output formats to export")
+    THROUGHPUT_ARGS.add_argument("--repeat", type=int, default=3,
+                                 help="how many times to run each stage; the median is reported")
+    THROUGHPUT_ARGS.add_argument("--work-dir", dest='work_dir',
+                                 help="where to write temporary files (default: system temp dir)")
+    ARGS_PARSER.add_argument("--results",
+                             help="the JSON file to record results in")
+
+    CLI_ARGS = ARGS_PARSER.parse_args()
+    if CLI_ARGS.benchmark == 'compression':
+        RESULTS = benchmark_compression(CLI_ARGS.logfile, output_format=CLI_ARGS.format,
+                                        compresslevel=CLI_ARGS.compress_level, repeat=CLI_ARGS.repeat,
+                                        work_dir=CLI_ARGS.work_dir)
+    elif CLI_ARGS.benchmark == 'throughput':
+        with tempfile.TemporaryDirectory(dir=CLI_ARGS.work_dir) as GENERATED_DIR:
+            LOG_FILEPATH = CLI_ARGS.logfile or write_log(os.path.join(GENERATED_DIR, 'generated.txt'),
+                                                         source=CLI_ARGS.source, entries_count=CLI_ARGS.generate,
+                                                         seed=CLI_ARGS.seed)
+            RESULTS = benchmark_throughput(LOG_FILEPATH, output_formats=CLI_ARGS.formats, repeat=CLI_ARGS.repeat,
+                                           work_dir=CLI_ARGS.work_dir)
+    else:
+        ARGS_PARSER.print_help()
+        sys.exit(1)
+    print_results_table(RESULTS)
+    if CLI_ARGS.results:
+        with open(CLI_ARGS.results, 'w') as results_file:
+            json.dump({'benchmark': CLI_ARGS.benchmark,
+                       'python': platform.python_version(),
+                       'results': RESULTS}, results_file, indent=2)
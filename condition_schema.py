@@ -0,0 +1,167 @@
+"""
+Registry of the condition keys found in decoded Zero logs, with their units and value types.
+
+Knowing the condition keys up front lets tabular output headers be written before a log is
+parsed, instead of after a pass over every entry. Keys outside the registry are gathered into
+an overflow column.
+"""
+
+import re
+from collections import namedtuple
+from typing import Dict, List, Optional, Union
+
+ConditionType = namedtuple('ConditionType', ['unit', 'kind'])
+
+NUMBER = 'number'
+TEXT = 'text'
+
+OVERFLOW_CONDITIONS_LABEL = 'other_conditions'
+
+# In the order they first appear in a typical MBB log, which is the tabular column order.
+MBB_CONDITION_TYPES = {
+    'vmod': ConditionType('V', NUMBER),
+    'maxsys': ConditionType('V', NUMBER),
+    'minsys': ConditionType('V', NUMBER),
+    'diff': ConditionType('V', NUMBER),
+    'vcap': ConditionType('V', NUMBER),
+    'prechg': ConditionType('%', NUMBER),
+    'Module': ConditionType(None, NUMBER),
+    'PackTemp (h)': ConditionType('C', NUMBER),
+    'PackTemp (l)': ConditionType('C', NUMBER),
+    'PackSOC': ConditionType('%', NUMBER),
+    'Vpack': ConditionType('V', NUMBER),
+    'MotAmps': ConditionType('A', NUMBER),
+    'BattAmps': ConditionType('A', NUMBER),
+    'Mods': ConditionType(None, TEXT),
+    'MotTemp': ConditionType('C', NUMBER),
+    'CtrlTemp': ConditionType('C', NUMBER),
+    'AmbTemp': ConditionType('C', NUMBER),
+    'MotRPM': ConditionType('rpm', NUMBER),
+    'Odo': ConditionType('km', NUMBER),
+    'MinCell': ConditionType('mV', NUMBER),
+    'MaxPackTemp': ConditionType('C', NUMBER),
+    'MbbChgEn': ConditionType(None, TEXT),
+    'BmsChgEn': ConditionType(None, TEXT),
+    'batt curr': ConditionType('A', NUMBER),
+    'Reset': ConditionType(None, TEXT),
+    'serial': ConditionType(None, TEXT),
+    'ImpedanceKOhms': ConditionType('KOhms', NUMBER),
+    'Cell': ConditionType(None, NUMBER),
+    'PV': ConditionType('mV', NUMBER),
+    'Allowed diff': ConditionType('mV', NUMBER),
+    'pack cap': ConditionType('Ah', NUMBER),
+    'PackTemp h': ConditionType('C', NUMBER),
+    'l': ConditionType('C', NUMBER),
+    'lcell': ConditionType('mV', NUMBER),
+    'Max charge': ConditionType(None, TEXT),
+    'max discharge': ConditionType(None, TEXT),
+    'Code': ConditionType(None, TEXT),
+    'Error Reg': ConditionType(None, TEXT),
+    'Error Code': ConditionType(None, TEXT),
+    'Data': ConditionType(None, TEXT),
+    'Bmvolts': ConditionType('mV', NUMBER),
+    'Cmvolts': ConditionType('mV', NUMBER),
+    'Amps': ConditionType('A', NUMBER),
+    'RPM': ConditionType('rpm', NUMBER),
+    'CapV': ConditionType('V', NUMBER),
+    'SN': ConditionType(None, TEXT),
+    'SW': ConditionType(None, TEXT),
+    'EVSE Voltage': ConditionType('Vac', NUMBER),
+    'EVSE Frequency': ConditionType('Hz', NUMBER),
+    'EVSE Amps': ConditionType('A', NUMBER),
+}
+
+# BMS logs report charge/discharge level snapshots with terse keys.
+BMS_CONDITION_TYPES = {
+    'AH': ConditionType('Ah', NUMBER),
+    'SOC': ConditionType('%', NUMBER),
+    'I': ConditionType('A', NUMBER),
+    'L': ConditionType('mV', NUMBER),
+    'l': ConditionType('mV', NUMBER),
+    'H': ConditionType('mV', NUMBER),
+    'B': ConditionType(None, NUMBER),
+    'PT': ConditionType('C', NUMBER),
+    'BT': ConditionType('C', NUMBER),
+    'PV': ConditionType('mV', NUMBER),
+    'M': ConditionType(None, TEXT),
+    'Module': ConditionType(None, NUMBER),
+    'PackTemp (h)': ConditionType('C', NUMBER),
+    'PackTemp (l)': ConditionType('C', NUMBER),
+    'PackSOC': ConditionType('%', NUMBER),
+    'Vpack': ConditionType('V', NUMBER),
+    'MinCell': ConditionType('mV', NUMBER),
+    'MaxPackTemp': ConditionType('C', NUMBER),
+}
+
+CONDITION_TYPES_BY_SOURCE = {
+    'MBB': MBB_CONDITION_TYPES,
+    'BMS': BMS_CONDITION_TYPES,
+}
+
+# Firmware revisions whose condition keys differ from the source's default, by (source, revision).
+CONDITION_TYPES_BY_FIRMWARE_REV: Dict[tuple, Dict[str, ConditionType]] = {}
+
+# How to convert a value given in one unit to the unit registered for its key.
+UNIT_SCALES = {
+    ('mV', 'V'): 0.001,
+    ('V', 'mV'): 1000.0,
+}
+
+NUMBER_WITH_UNIT = re.compile(r"^\s*(-?\d*\.?\d+)\s*([A-Za-z%]*)\s*$")
+
+
+class ConditionSchema:
+    """The known condition keys of one kind of log, in tabular column order."""
+    condition_types: Dict[str, ConditionType]
+
+    def __init__(self, condition_types: Dict[str, ConditionType]):
+        self.condition_types = condition_types
+        self.keys = list(condition_types)
+        self.key_set = frozenset(condition_types)
+
+    @classmethod
+    def for_source(cls, log_source: Optional[str], firmware_rev: Optional[str] = None) -> 'ConditionSchema':
+        """The schema for MBB or BMS logs, specialized to the firmware revision if registered."""
+        condition_types = CONDITION_TYPES_BY_FIRMWARE_REV.get((log_source, firmware_rev)) or \
+            CONDITION_TYPES_BY_SOURCE.get(log_source, MBB_CONDITION_TYPES)
+        return cls(condition_types)
+
+    def overflow_conditions(self, conditions: Dict[str, str]) -> Dict[str, str]:
+        """The conditions whose keys are not in the schema."""
+        return {key: value for key, value in conditions.items() if key not in self.key_set}
+
+    @staticmethod
+    def overflow_text(overflow: Dict[str, str]) -> str:
+        """Render overflow conditions into a single tabular value."""
+        return '; '.join('{}={}'.format(key, value) for key, value in overflow.items())
+
+    def typed_value(self, key: str, value: str) -> Union[float, str, None]:
+        """Parse a condition value as its registered type, converting to its registered unit.
+        Numbers that do not parse are returned as None; unknown keys are parsed as numbers if they look like one."""
+        condition_type = self.condition_types.get(key)
+        if condition_type is not None and condition_type.kind == TEXT:
+            return value
+        return parse_number(value, condition_type.unit if condition_type else None,
+                            strict=condition_type is not None)
+
+
+def parse_number(value: str, unit: Optional[str] = None, strict=True) -> Union[float, str, None]:
+    """Strip the unit from a value like '93.175V' and return the number, scaled to the given unit."""
+    matches = NUMBER_WITH_UNIT.match(value)
+    if not matches:
+        return None if strict else value
+    number = float(matches.group(1))
+    value_unit = matches.group(2)
+    if unit and value_unit and value_unit != unit:
+        number *= UNIT_SCALES.get((value_unit, unit), 1.0)
+    return number
+
+
+def discover_conditions_keys(conditions_dicts) -> List[str]:
+    """All condition keys used, in order of first use, with a set-based membership check."""
+    keys = {}
+    for conditions in conditions_dicts:
+        for key in conditions:
+            if key not in keys:
+                keys[key] = None
+    return list(keys)
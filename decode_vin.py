@@ -2,6 +2,13 @@
 
 """Decode a Zero Motorcycles VIN into usable attributes."""
 
+import csv
+import sys
+import json
+import argparse
+from functools import lru_cache
+from typing import Any, Dict, Iterable, Iterator, Optional, TextIO
+
 YEARS_BY_CODE = {
     '9': 2009,
     'A': 2010,
@@ -110,77 +117,198 @@ MODELS_BY_CODE = {
 }
 
 
+# The model line and motor descriptions split into their parts once, rather than for every VIN.
+MODEL_LINE_PARTS_BY_CODE = {
+    code: tuple((model_line.split(' ') + [None, None])[:3]) for code, model_line in MODEL_LINES_BY_CODE.items()
+}
+MOTOR_PARTS_BY_CODE = {
+    code: tuple((motor.split(' ', 2) + [None])[:2]) for code, motor in MOTORS_BY_CODE.items()
+}
+
+# The coded fields of a VIN: (start, end, values by code, label for errors).
+VIN_CODE_FIELDS = {
+    'model_year': (9, 10, YEARS_BY_CODE, 'model year'),
+    'model_line': (4, 6, MODEL_LINE_PARTS_BY_CODE, 'model line'),
+    'motor': (6, 8, MOTOR_PARTS_BY_CODE, 'motor'),
+    'model': (11, 12, MODELS_BY_CODE, 'model'),
+}
+VIN_CODES_LENGTH = max(end for _, end, _, _ in VIN_CODE_FIELDS.values())
+
+DECODED_VINS_CACHE_SIZE = 4096
+CSV_COLUMNS = ['vin', 'manufacturer', 'plant_location', 'year', 'platform', 'model', 'motor_power', 'motor_size',
+               'pack_capacity', 'error']
+
+
+class VinDecodeError(KeyError):
+    """A VIN too short to decode, or with a code that is not known."""
+
+    def __str__(self):
+        return self.args[0]
+
+
+def lookup_codes(vin: str) -> Dict[str, Any]:
+    """The values of the coded fields of the VIN, by field name."""
+    if len(vin) < VIN_CODES_LENGTH:
+        raise VinDecodeError('VIN is too short: {!r}'.format(vin))
+    values = {}
+    for field, (start, end, codes, label) in VIN_CODE_FIELDS.items():
+        code = vin[start:end]
+        try:
+            values[field] = codes[code]
+        except KeyError:
+            raise VinDecodeError('Unknown {} code: {!r}'.format(label, code)) from None
+    return values
+
+
+def decode_platform(platform_code: str, model_year: int) -> Optional[str]:
+    """The platform name, which the X and S platforms took from the 2013 model year."""
+    if platform_code == 'X':
+        return 'XMX' if model_year > 2012 else platform_code
+    if platform_code == 'S':
+        return 'SDS' if model_year > 2012 else platform_code
+    if platform_code == 'Z':
+        return 'FST'
+    return None
+
+
+def decode_model(model: str, model_year: int, model_from_line: str, motor_size: Optional[str]) -> str:
+    """Tell apart the models that share a model code, by model year, model line and motor."""
+    if '/' not in model:
+        return model
+    # if model_from_line and '/' not in model_from_line.group(0):
+    #     model = model_from_line.group(0)
+    if model == 'SR/DSR':
+        if 2013 < model_year < 2016:
+            model = 'SR'
+        else:
+            model = 'DSR' if 'DS' in model_from_line else 'SR'
+    if motor_size:
+        if 'DS/DSR' in model:
+            model = 'DSR' if motor_size == '75-7R' else 'DS'
+        elif 'S/SR' in model:
+            model = 'SR' if motor_size == '75-7R' else 'S'
+    return model
+
+
 def decode_vin(vin: str) -> {}:
     """The metadata about the bike decoded from the VIN."""
-    model_year = YEARS_BY_CODE[vin[9]]
-    platform_code = vin[3]
-    if platform_code == 'X':
-        platform = 'XMX' if model_year > 2012 else platform_code
-    elif platform_code == 'S':
-        platform = 'SDS' if model_year > 2012 else platform_code
-    elif platform_code == 'Z':
-        platform = 'FST'
-    else:
-        platform = None
-    model_line_parts = MODEL_LINES_BY_CODE[vin[4:6]].split(' ')
-    model_from_line = model_line_parts[0]
-    model_line_capacity = model_line_parts[1] if len(model_line_parts) > 1 else None
-    model_line_power = model_line_parts[2] if len(model_line_parts) > 2 else None
-    motor_parts = MOTORS_BY_CODE[vin[6:8]].split(' ', 2)
-    motor_power = motor_parts[0] or model_line_power
-    motor_size = motor_parts[1] if len(motor_parts) > 1 else None
-    model = MODELS_BY_CODE[vin[11]]
-    if '/' in model:
-        # if model_from_line and '/' not in model_from_line.group(0):
-        #     model = model_from_line.group(0)
-        if model == 'SR/DSR':
-            if 2013 < model_year < 2016:
-                model = 'SR'
-            else:
-                model = 'DSR' if 'DS' in model_from_line else 'SR'
-        if motor_size:
-            if 'DS/DSR' in model:
-                model = 'DSR' if motor_size == '75-7R' else 'DS'
-            elif 'S/SR' in model:
-                model = 'SR' if motor_size == '75-7R' else 'S'
+    codes = lookup_codes(vin)
+    model_year = codes['model_year']
+    model_from_line, model_line_capacity, model_line_power = codes['model_line']
+    motor_power, motor_size = codes['motor']
     return {
         'manufacturer': 'Zero Motorcycles' if vin[:3] == '538' else None,
         'plant_location': 'Santa Cruz, CA' if vin[10] == 'C' else None,
         'year': model_year,
-        'platform': platform,
-        'model': model,
+        'platform': decode_platform(vin[3], model_year),
+        'model': decode_model(codes['model'], model_year, model_from_line, motor_size),
         'motor': {
-            'power': motor_power,
+            'power': motor_power or model_line_power,
             'size': motor_size
         },
         'pack_capacity': model_line_capacity
     }
 
 
-if __name__ == '__main__':
-    import argparse
+@lru_cache(maxsize=DECODED_VINS_CACHE_SIZE)
+def decoded_vin_row(vin: str) -> Dict[str, Any]:
+    """The VIN decoded into a flat row, or the reason it could not be, as the error. Cached, so do not modify it."""
+    row = dict.fromkeys(CSV_COLUMNS)
+    row['vin'] = vin
+    try:
+        decoded = decode_vin(vin)
+    except VinDecodeError as error:
+        row['error'] = str(error)
+        return row
+    for key, value in decoded.items():
+        if isinstance(value, dict):
+            row.update(('{}_{}'.format(key, sub_key), sub_value) for sub_key, sub_value in value.items())
+        else:
+            row[key] = value
+    return row
+
+
+def decode_vins(vin_lines: Iterable[str]) -> Iterator[Dict[str, Any]]:
+    """Decode a VIN per line, skipping blank lines, with an error in the row of each VIN that could not be decoded."""
+    for line in vin_lines:
+        vin = line.strip().upper()
+        if vin:
+            yield decoded_vin_row(vin)
 
-    ARGS_PARSER = argparse.ArgumentParser()
-    ARGS_PARSER.add_argument('vin',
+
+def write_decoded_vins(vin_lines: Iterable[str], output: TextIO, output_format='jsonl') -> int:
+    """Stream the decoded VINs out as JSON lines or CSV. Returns how many VINs could not be decoded."""
+    errors_count = 0
+    if output_format == 'csv':
+        writer = csv.DictWriter(output, CSV_COLUMNS, lineterminator='\n')
+        writer.writeheader()
+    for row in decode_vins(vin_lines):
+        if row['error']:
+            errors_count += 1
+        if output_format == 'csv':
+            writer.writerow(row)
+        else:
+            output.write(json.dumps(row) + '\n')
+    return errors_count
+
+
+def vin_args_parser() -> argparse.ArgumentParser:
+    """The command line arguments."""
+    args_parser = argparse.ArgumentParser()
+    args_parser.add_argument('vin', nargs='?',
                              help="the VIN to process")
-    ARGS_PARSER.add_argument('--format', default='text',
-                             choices=['json', 'text'],
-                             help="the format to print the output")
-
-    CLI_ARGS = ARGS_PARSER.parse_args()
-    DECODED = decode_vin(CLI_ARGS.vin)
-    FORMAT = CLI_ARGS.format
-    if FORMAT == 'json':
-        import json
-        print(json.dumps(DECODED))
-    elif FORMAT == 'text':
+    args_parser.add_argument('--batch', metavar='FILE',
+                             help="decode a VIN per line of the file ('-' for stdin), streaming a row per VIN")
+    args_parser.add_argument('--format',
+                             choices=['json', 'text', 'jsonl', 'csv'],
+                             help="the format to print the output (default: text, or jsonl with --batch)")
+    return args_parser
+
+
+def print_decoded_vins(args_parser: argparse.ArgumentParser, cli_args: argparse.Namespace):
+    """Decode the VINs of the --batch file, reporting how many could not be."""
+    if cli_args.vin:
+        args_parser.error('give either a VIN or --batch, not both')
+    output_format = cli_args.format or 'jsonl'
+    if output_format not in ('jsonl', 'csv'):
+        args_parser.error('--batch prints jsonl or csv')
+    if cli_args.batch == '-':
+        errors_count = write_decoded_vins(sys.stdin, sys.stdout, output_format)
+    else:
+        with open(cli_args.batch) as vin_file:
+            errors_count = write_decoded_vins(vin_file, sys.stdout, output_format)
+    if errors_count:
+        print('{} VINs could not be decoded'.format(errors_count), file=sys.stderr)
+
+
+def print_decoded_vin(decoded: Dict[str, Any], output_format: str):
+    """Print a decoded VIN as JSON, or as a line of text per field."""
+    if output_format in ('json', 'jsonl'):
+        print(json.dumps(decoded))
+    elif output_format == 'text':
         def print_kv(label, value):
             """nicer print"""
             human_key = ' '.join(map(lambda x: x.capitalize(), label.split('_')))
             print('{}:\t{}'.format(human_key, value))
-        for k, v in DECODED.items():
+        for k, v in decoded.items():
             if isinstance(v, dict):
                 for k1, v1 in v.items():
                     print_kv(k.upper() + '_' + k1.upper(), v1)
             else:
                 print_kv(k, v)
+
+
+def main():
+    """Decode a VIN, or a file of them, from the command line."""
+    args_parser = vin_args_parser()
+    cli_args = args_parser.parse_args()
+    if cli_args.batch:
+        print_decoded_vins(args_parser, cli_args)
+        sys.exit(0)
+    if not cli_args.vin:
+        args_parser.error('a VIN or --batch is required')
+    print_decoded_vin(decode_vin(cli_args.vin), cli_args.format or 'text')
+
+
+if __name__ == '__main__':
+    main()
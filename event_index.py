@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+
+"""
+Keep a persistent inverted index of the events in an archive of decoded logs, and search it.
+
+Indexing parses each log once and records, for every entry, a posting under each of its
+normalized event text, component, event type and event level. A posting gives the file,
+entry number, timestamp and byte offset of the entry's line, and is keyed by the offset, since
+entry numbers repeat within a log once its counter wraps around. The index lives in SQLite.
+Files already indexed are skipped unless their size or modification time changed, so new
+logs can be added as they arrive. Searches intersect the postings of the terms asked for,
+then read each matching entry by seeking to its line in the source log.
+"""
+
+import os
+import re
+import sqlite3
+from datetime import datetime, timedelta
+from typing import Dict, IO, Iterator, List, Optional, Tuple
+
+from extract_ride_data import ZeroLogHeader, ZeroLogEntry, is_log_divider_line, compression_suffix, \
+    COMPRESSION_OPENERS
+
+INDEXED_FIELDS = ['event', 'component', 'event_type', 'event_level']
+EPOCH = datetime(1970, 1, 1)
+LOG_ENCODING = 'utf-8'
+# Bumped when the tables change; an index of another version is dropped and rebuilt.
+INDEX_SCHEMA_VERSION = 1
+
+Posting = Tuple[str, int, Optional[datetime], int]
+
+
+def normalize_term(value: str) -> str:
+    """Fold case and whitespace, so searches need not match the log's exact spacing or capitalization."""
+    return re.sub(r"\s+", ' ', value).strip().lower()
+
+
+def open_binary_log_file(filepath: str) -> IO:
+    """Open a log for reading bytes, through its compression codec if any, so line offsets can be kept."""
+    suffix = compression_suffix(filepath)
+    if suffix is None:
+        return open(filepath, 'rb')
+    return COMPRESSION_OPENERS[suffix](filepath, 'rb')
+
+
+def read_entry_lines(log_file: IO) -> Iterator[Tuple[int, str]]:
+    """Yield the byte offset and text of each entry line after the header divider."""
+    offset = 0
+    in_header = True
+    for raw_line in log_file:
+        line = raw_line.decode(LOG_ENCODING, errors='replace')
+        if in_header:
+            in_header = not is_log_divider_line(line)
+        elif len(line.strip()) > 5:
+            yield offset, line
+        offset += len(raw_line)
+
+
+class EventIndex:
+    """An inverted index from event terms to entry postings, kept in a SQLite database."""
+
+    def __init__(self, db_filepath: str):
+        self.connection = sqlite3.connect(db_filepath)
+        if self.connection.execute('PRAGMA user_version').fetchone()[0] != INDEX_SCHEMA_VERSION:
+            self.connection.executescript('''
+                DROP TABLE IF EXISTS postings;
+                DROP TABLE IF EXISTS terms;
+                DROP TABLE IF EXISTS files;
+                PRAGMA user_version = {};'''.format(INDEX_SCHEMA_VERSION))
+        self.connection.executescript('''
+            CREATE TABLE IF NOT EXISTS files (
+                file_id INTEGER PRIMARY KEY, path TEXT UNIQUE, size INTEGER, mtime REAL,
+                log_source TEXT, serial_no TEXT, vin TEXT, entries INTEGER);
+            CREATE TABLE IF NOT EXISTS terms (
+                term_id INTEGER PRIMARY KEY, field TEXT, value TEXT, UNIQUE (field, value));
+            CREATE TABLE IF NOT EXISTS postings (
+                term_id INTEGER, file_id INTEGER, entry INTEGER, timestamp INTEGER, offset INTEGER,
+                PRIMARY KEY (term_id, file_id, offset)) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS postings_by_file ON postings (file_id);''')
+        self.term_ids = {}
+
+    def close(self):
+        """Close the database."""
+        self.connection.close()
+
+    def term_id(self, field: str, value: str) -> int:
+        """The ID of a term, adding it to the index if new."""
+        term_key = (field, value)
+        term_id = self.term_ids.get(term_key)
+        if term_id is None:
+            self.connection.execute('INSERT OR IGNORE INTO terms (field, value) VALUES (?, ?)', term_key)
+            term_id = self.connection.execute('SELECT term_id FROM terms WHERE field = ? AND value = ?',
+                                              term_key).fetchone()[0]
+            self.term_ids[term_key] = term_id
+        return term_id
+
+    def is_indexed(self, log_filepath: str) -> bool:
+        """Whether this version of the file is already indexed."""
+        stat = os.stat(log_filepath)
+        row = self.connection.execute('SELECT size, mtime FROM files WHERE path = ?', (log_filepath,)).fetchone()
+        return row is not None and tuple(row) == (stat.st_size, stat.st_mtime)
+
+    def index_file(self, log_filepath: str, verbose=0) -> int:
+        """Index the entries of a log, replacing what was indexed for an earlier version of the file.
+        Returns how many entries were indexed, or 0 if the file was already up to date."""
+        log_filepath = os.path.abspath(log_filepath)
+        if self.is_indexed(log_filepath):
+            return 0
+        if verbose > 0:
+            print('Indexing: {}'.format(log_filepath))
+        stat = os.stat(log_filepath)
+        with open_binary_log_file(log_filepath) as log_file:
+            header_lines = []
+            for raw_line in log_file:
+                header_lines.append(raw_line.decode(LOG_ENCODING, errors='replace').strip())
+                if is_log_divider_line(header_lines[-1]):
+                    break
+            header = ZeroLogHeader(header_lines)
+        with self.connection:
+            self.remove_file(log_filepath)
+            file_id = self.connection.execute(
+                'INSERT INTO files (path, size, mtime, log_source, serial_no, vin) VALUES (?, ?, ?, ?, ?, ?)',
+                (log_filepath, stat.st_size, stat.st_mtime, header.log_source) + self.header_identity(header)).lastrowid
+            entries_count = 0
+            with open_binary_log_file(log_filepath) as log_file:
+                for offset, line in read_entry_lines(log_file):
+                    log_entry = ZeroLogEntry(line, verbose=-1)
+                    timestamp = getattr(log_entry, 'timestamp', None)
+                    seconds = int((timestamp - EPOCH).total_seconds()) if timestamp else None
+                    self.connection.executemany(
+                        'INSERT INTO postings VALUES (?, ?, ?, ?, ?)',
+                        [(self.term_id(field, normalize_term(getattr(log_entry, field))), file_id,
+                          log_entry.entry, seconds, offset)
+                         for field in INDEXED_FIELDS if getattr(log_entry, field)])
+                    entries_count += 1
+            self.connection.execute('UPDATE files SET entries = ? WHERE file_id = ?', (entries_count, file_id))
+        return entries_count
+
+    @staticmethod
+    def header_identity(header: ZeroLogHeader) -> Tuple[Optional[str], Optional[str]]:
+        """The serial number and VIN of the bike or pack a log came from, where its header has them."""
+        if header.log_source == 'MBB':
+            return header.mbb_metadata.serial_no, header.mbb_metadata.vin
+        if header.log_source == 'BMS':
+            return header.bms_metadata.serial_no, None
+        return None, None
+
+    def remove_file(self, log_filepath: str):
+        """Drop the postings of a file from the index."""
+        row = self.connection.execute('SELECT file_id FROM files WHERE path = ?', (log_filepath,)).fetchone()
+        if row is not None:
+            self.connection.execute('DELETE FROM postings WHERE file_id = ?', row)
+            self.connection.execute('DELETE FROM files WHERE file_id = ?', row)
+
+    def index_paths(self, paths: List[str], pattern=r".*\.txt(\.(gz|bz2|xz))?$", verbose=0) -> Dict[str, int]:
+        """Index log files, and the log files in directories, that are new or changed.
+        Returns how many entries were indexed from each."""
+        indexed = {}
+        for path in paths:
+            if os.path.isdir(path):
+                log_filepaths = sorted(os.path.join(dir_path, filename)
+                                       for dir_path, _, filenames in os.walk(path)
+                                       for filename in filenames if re.match(pattern, filename))
+            else:
+                log_filepaths = [path]
+            for log_filepath in log_filepaths:
+                entries_count = self.index_file(log_filepath, verbose=verbose)
+                if entries_count:
+                    indexed[log_filepath] = entries_count
+        return indexed
+
+    def search(self, event=None, component=None, event_type=None, event_level=None, vin=None,
+               since: Optional[datetime] = None, until: Optional[datetime] = None) -> List[Posting]:
+        """Find the entries having all the given terms, as (file, entry, timestamp, byte offset).
+        An event ending in '*' matches events starting with the rest of it."""
+        term_clauses = []
+        parameters = []
+        for field, value in zip(INDEXED_FIELDS, [event, component, event_type, event_level]):
+            if value is None:
+                continue
+            value = normalize_term(value)
+            if value.endswith('*'):
+                term_clauses.append('SELECT term_id FROM terms WHERE field = ? AND substr(value, 1, ?) = ?')
+                parameters.extend([field, len(value) - 1, value[:-1]])
+            else:
+                term_clauses.append('SELECT term_id FROM terms WHERE field = ? AND value = ?')
+                parameters.extend([field, value])
+        if not term_clauses:
+            raise ValueError('Give at least one of event, component, event_type or event_level to search for')
+        # Postings of the first term, kept if the same entry line has a posting for each other term too.
+        conditions = ['postings.term_id IN ({})'.format(term_clauses[0])]
+        conditions.extend('EXISTS (SELECT 1 FROM postings AS other WHERE other.term_id IN ({}) AND '
+                          'other.file_id = postings.file_id AND other.offset = postings.offset)'.format(clause)
+                          for clause in term_clauses[1:])
+        if vin:
+            conditions.append('files.vin = ?')
+            parameters.append(vin)
+        if since:
+            conditions.append('postings.timestamp >= ?')
+            parameters.append(int((since - EPOCH).total_seconds()))
+        if until:
+            conditions.append('postings.timestamp <= ?')
+            parameters.append(int((until - EPOCH).total_seconds()))
+        query = 'SELECT DISTINCT files.path, postings.entry, postings.timestamp, postings.offset ' \
+                'FROM postings JOIN files USING (file_id) WHERE ' + ' AND '.join(conditions)
+        query += ' ORDER BY files.path, postings.offset'
+        return [(path, entry, EPOCH + timedelta(seconds=seconds) if seconds is not None else None, offset)
+                for path, entry, seconds, offset in self.connection.execute(query, parameters)]
+
+    @staticmethod
+    def read_postings(postings: List[Posting]) -> Iterator[Tuple[str, ZeroLogEntry]]:
+        """Read the entry of each posting by seeking to its line, opening each source log once."""
+        log_file = None
+        log_filepath = None
+        try:
+            for path, _, _, offset in postings:
+                if path != log_filepath:
+                    if log_file:
+                        log_file.close()
+                    log_filepath = path
+                    log_file = open_binary_log_file(path)
+                log_file.seek(offset)
+                yield path, ZeroLogEntry(log_file.readline().decode(LOG_ENCODING, errors='replace'), verbose=-1)
+        finally:
+            if log_file:
+                log_file.close()
+
+
+if __name__ == "__main__":
+    import sys
+    import json
+    import argparse
+
+    ARGS_PARSER = argparse.ArgumentParser()
+    ARGS_PARSER.add_argument("--db", default='event_index.sqlite',
+                             help="the SQLite index database")
+    SUBCOMMANDS = ARGS_PARSER.add_subparsers(dest='command')
+    INDEX_ARGS = SUBCOMMANDS.add_parser('index',
+                                        help="index new and changed logs")
+    INDEX_ARGS.add_argument("paths", nargs='+',
+                            help="parsed log files, or directories of them")
+    INDEX_ARGS.add_argument("--verbose", "-v",
+                            action='count', default=0,
+                            help="show more processing details")
+    SEARCH_ARGS = SUBCOMMANDS.add_parser('search',
+                                         help="find entries by event, component, type or level")
+    SEARCH_ARGS.add_argument("--event",
+                             help="the event text, case-insensitive; end with * to match a prefix")
+    SEARCH_ARGS.add_argument("--component",
+                             help="the component, e.g. Battery")
+    SEARCH_ARGS.add_argument("--type", dest='event_type',
+                             help="the event type, e.g. LIMIT")
+    SEARCH_ARGS.add_argument("--level", dest='event_level', choices=['INFO', 'DEBUG', 'WARNING', 'ERROR'],
+                             help="the event level")
+    SEARCH_ARGS.add_argument("--vin",
+                             help="only logs of the bike with this VIN")
+    SEARCH_ARGS.add_argument("--since", type=datetime.fromisoformat,
+                             help="only entries at or after this time (YYYY-MM-DD[ HH:MM:SS])")
+    SEARCH_ARGS.add_argument("--until", type=datetime.fromisoformat,
+                             help="only entries at or before this time (YYYY-MM-DD[ HH:MM:SS])")
+    SEARCH_ARGS.add_argument("--postings-only", action='store_true', dest='postings_only',
+                             help="list where the entries are without reading them from the logs")
+
+    CLI_ARGS = ARGS_PARSER.parse_args()
+    INDEX = EventIndex(CLI_ARGS.db)
+    try:
+        if CLI_ARGS.command == 'index':
+            INDEXED = INDEX.index_paths(CLI_ARGS.paths, verbose=CLI_ARGS.verbose)
+            print('Indexed {} entries from {} new or changed logs'.format(sum(INDEXED.values()), len(INDEXED)))
+        elif CLI_ARGS.command == 'search':
+            try:
+                POSTINGS = INDEX.search(event=CLI_ARGS.event, component=CLI_ARGS.component,
+                                        event_type=CLI_ARGS.event_type, event_level=CLI_ARGS.event_level,
+                                        vin=CLI_ARGS.vin, since=CLI_ARGS.since, until=CLI_ARGS.until)
+            except ValueError as error:
+                SEARCH_ARGS.error(str(error))
+            if CLI_ARGS.postings_only:
+                for PATH, ENTRY, TIMESTAMP, OFFSET in POSTINGS:
+                    print('{}\t{}\t{}\t{}'.format(PATH, ENTRY, TIMESTAMP or '', OFFSET))
+            else:
+                for PATH, LOG_ENTRY in INDEX.read_postings(POSTINGS):
+                    OUTPUT = {'file': PATH}
+                    OUTPUT.update(LOG_ENTRY.to_json())
+                    print(json.dumps(OUTPUT))
+        else:
+            ARGS_PARSER.print_help()
+            sys.exit(1)
+    finally:
+        INDEX.close()
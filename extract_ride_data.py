@@ -7,19 +7,71 @@ It supports CSV/TSV tabular formats as well as JSON.
 """
 
 import os
+import bz2
+import copy
+import gzip
+import lzma
 from collections import namedtuple
 from datetime import datetime
 import string
 import re
+import sys
+import math
 import json
+import sqlite3
+import time
 from bisect import bisect_right
-from typing import List, Tuple, Dict, IO, Optional, Any
+from contextlib import nullcontext
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import List, Tuple, Dict, IO, Optional, Any, Iterable, Iterator
 
 from decode_vin import decode_vin
+from condition_schema import ConditionSchema, OVERFLOW_CONDITIONS_LABEL, NUMBER, TEXT, discover_conditions_keys
+from stage_profiler import StageProfiler
 
 
 EMPTY_CSV_VALUE = ''
 
+TABULAR_FIELD_SEPARATORS = {
+    'csv': ',',
+    'tsv': '\t'
+}
+
+COMPRESSION_OPENERS = {
+    '.gz': gzip.open,
+    '.bz2': bz2.open,
+    '.xz': lzma.open
+}
+
+# The entry properties given typed columns. The text ones have few distinct values, so are made categorical.
+TYPED_NUMBER_LABELS = ['entry', 'segment_id']
+TYPED_CATEGORY_LABELS = ['segment_activity', 'component', 'event_type', 'event_level', 'event']
+TIMESTAMP_LABEL = 'timestamp'
+LOG_TAG_LABEL = 'log_tag'
+EPOCH = datetime(1970, 1, 1)
+
+
+def compression_suffix(filepath: str) -> Optional[str]:
+    """The compression codec suffix of the filepath, if it names a compressed file."""
+    suffix = os.path.splitext(filepath)[1].lower()
+    return suffix if suffix in COMPRESSION_OPENERS else None
+
+
+def strip_compression_suffix(filepath: str) -> str:
+    """The filepath without any compression codec suffix."""
+    return filepath[:-len(compression_suffix(filepath))] if compression_suffix(filepath) else filepath
+
+
+def open_log_file(filepath: str, mode='r', compresslevel: Optional[int] = None) -> IO:
+    """Open a file as text, streaming through a gzip/bz2/xz codec chosen by its extension."""
+    suffix = compression_suffix(filepath)
+    if suffix is None:
+        return open(filepath, mode)
+    options = {}
+    if compresslevel is not None and mode != 'r':
+        options['preset' if suffix == '.xz' else 'compresslevel'] = compresslevel
+    return COMPRESSION_OPENERS[suffix](filepath, mode + 't', **options)
+
 
 def print_value_tabular(value, omit_units=False):
     """Stringify the value for CSV/TSV; treat None as empty text."""
@@ -41,7 +93,7 @@ class LogHeader:
 class LogEntry:
     """Parse and represent the metadata, message, and data in a log entry."""
     timestamp: datetime
-    log_tag: Optional[str]
+    log_tag: Optional[str] = None
     field_values: Optional[List[str]]
     conditions: Dict[str, str] = {}
 
@@ -108,6 +160,11 @@ class Log:
     """Represent a log as a list of entries."""
     entries: List[LogEntry] = []
     tabular_header_labels: List[str] = []
+    profiler: Optional[StageProfiler] = None
+
+    def profile_stage(self, name: str):
+        """Measure a stage with the profiler, if there is one."""
+        return self.profiler.stage(name) if self.profiler else nullcontext({})
 
     def to_json(self) -> Dict[str, Any]:
         """Convert to JSON-serializable data structure."""
@@ -115,39 +172,261 @@ class Log:
             'entries': [entry_data.to_json() for entry_data in self.entries]
         }
 
+    def typed_condition_schema(self) -> ConditionSchema:
+        """The condition schema that parses condition values for typed columns."""
+        return ConditionSchema.for_source(None)
+
+    def typed_columns(self) -> Tuple[Dict[str, str], Dict[str, list]]:
+        """The kind and the values of each typed column of the entries."""
+        return typed_entry_columns(self.entries, self.typed_condition_schema())
+
+    def to_numpy(self) -> Dict[str, Any]:
+        """Convert to NumPy arrays by column: datetime64 timestamps, float numbers (NaN if missing)
+        and object text (None if missing). Requires NumPy."""
+        import numpy
+        kinds, values = self.typed_columns()
+        arrays = {}
+        for label, kind in kinds.items():
+            if kind == TIMESTAMP_LABEL:
+                seconds = numpy.array(values[label], dtype=numpy.float64)
+                missing = numpy.isnan(seconds)
+                microseconds = numpy.round(numpy.where(missing, 0, seconds) * 1e6).astype(numpy.int64)
+                arrays[label] = microseconds.astype('datetime64[us]')
+                arrays[label][missing] = numpy.datetime64('NaT')
+            else:
+                arrays[label] = numpy.array(values[label], dtype=numpy.float64 if kind == NUMBER else object)
+        return arrays
+
+    def to_dataframe(self):
+        """Convert to a pandas DataFrame of the NumPy columns, without copying them,
+        with the entry properties and log tag as categoricals. Requires pandas."""
+        import pandas
+        arrays = self.to_numpy()
+        for label in TYPED_CATEGORY_LABELS + [LOG_TAG_LABEL]:
+            if label in arrays:
+                arrays[label] = pandas.Categorical(arrays[label])
+        return pandas.DataFrame(arrays, copy=False)
+
     def output_to_file(self, output_filepath, output_format,
-                       omit_units=False, line_sep=os.linesep, verbose=0):
-        """Emit output to the filepath in the given format."""
-        if verbose >= 0:
-            print('Emitting {} output to: {}'.format(output_format.upper(), output_filepath))
+                       omit_units=False, line_sep=os.linesep, append=False, compresslevel=None, verbose=0):
+        """Emit output to the filepath in the given format.
+        When appending, entries are added to an existing output of the same format.
+        Outputs named with a .gz, .bz2 or .xz extension are compressed at the given level."""
+        with self.profile_stage('write_' + output_format) as stage:
+            stage['entries'] = len(self.entries)
+            append = append and os.path.exists(output_filepath)
+            if verbose >= 0:
+                print('{} {} output to: {}'.format('Appending' if append else 'Emitting',
+                                                   output_format.upper(), output_filepath))
+            log_headers = self.tabular_header_labels
+            if output_format == 'sqlite':
+                if compression_suffix(output_filepath):
+                    raise ValueError('SQLite output cannot be compressed: {}'.format(output_filepath))
+                self.output_to_sqlite(output_filepath, omit_units=omit_units, append=append)
+                return
+            if output_format == 'json' and append:
+                with open_log_file(output_filepath) as existing_output:
+                    existing_entries = json.load(existing_output)['entries']
+                output_json = self.to_json()
+                output_json['entries'] = existing_entries + output_json['entries']
+                with open_log_file(output_filepath, 'w', compresslevel=compresslevel) as output:
+                    output.write(json.dumps(output_json, indent=2))
+                return
+            with open_log_file(output_filepath, 'a' if append else 'w', compresslevel=compresslevel) as output:
+                if output_format == 'csv':
+                    if not append:
+                        output.write(','.join(log_headers) + line_sep)  # Write header
+                    for log_entry in self.entries:  # Write entries:
+                        output.write(log_entry.to_csv(log_headers, omit_units=omit_units) + line_sep)
+                elif output_format == 'tsv':
+                    if not append:
+                        output.write('\t'.join(log_headers) + line_sep)  # Write header
+                    for log_entry in self.entries:  # Write entries:
+                        output.write(log_entry.to_tsv(log_headers, omit_units=omit_units) + line_sep)
+                elif output_format == 'jsonl':
+                    for log_entry in self.entries:
+                        output.write(json.dumps(log_entry.to_json()) + line_sep)
+                elif output_format == 'json':
+                    output.write(json.dumps(self.to_json(), indent=2))
+
+    sqlite_table_name = 'entries'
+
+    def output_to_sqlite(self, output_filepath, omit_units=False, append=False):
+        """Emit entries as rows of a SQLite table, with a column per tabular header label.
+        When appending, columns for new condition keys are added to the existing table."""
         log_headers = self.tabular_header_labels
-        with open(output_filepath, 'w') as output:
-            if output_format == 'csv':
-                output.write(','.join(log_headers) + line_sep)  # Write header
-                for log_entry in self.entries:  # Write entries:
-                    output.write(log_entry.to_csv(log_headers, omit_units=omit_units) + line_sep)
-            elif output_format == 'tsv':
-                output.write('\t'.join(log_headers) + line_sep)  # Write header
-                for log_entry in self.entries:  # Write entries:
-                    output.write(log_entry.to_tsv(log_headers, omit_units=omit_units) + line_sep)
-            elif output_format == 'json':
-                output.write(json.dumps(self.to_json(), indent=2))
+        connection = sqlite3.connect(output_filepath)
+        try:
+            if not append:
+                connection.execute('DROP TABLE IF EXISTS {}'.format(self.sqlite_table_name))
+            connection.execute('CREATE TABLE IF NOT EXISTS {} ({})'.format(
+                self.sqlite_table_name, ', '.join(sqlite_quote(label) for label in log_headers)))
+            existing_columns = [row[1] for row in connection.execute(
+                'PRAGMA table_info({})'.format(self.sqlite_table_name))]
+            for label in log_headers:
+                if label not in existing_columns:
+                    connection.execute('ALTER TABLE {} ADD COLUMN {}'.format(
+                        self.sqlite_table_name, sqlite_quote(label)))
+            connection.executemany(
+                'INSERT INTO {} ({}) VALUES ({})'.format(
+                    self.sqlite_table_name,
+                    ', '.join(sqlite_quote(label) for label in log_headers),
+                    ', '.join('?' for _ in log_headers)),
+                ([log_entry.print_property_tabular(index, key, omit_units=omit_units) or None
+                  for index, key in enumerate(log_headers)]
+                 for log_entry in self.entries))
+            connection.commit()
+        finally:
+            connection.close()
+
+
+def typed_entry_columns(entries: Iterable[LogEntry], condition_schema: ConditionSchema,
+                        tag_schemas: Optional[Dict[str, ConditionSchema]] = None) \
+        -> Tuple[Dict[str, str], Dict[str, list]]:
+    """Gather entries into typed columns in one pass, returning the kind and the values of each column.
+    Timestamps are seconds since the epoch. A condition key is a number column, with units stripped and converted
+    by the schema, when each of its values parses as a number; otherwise it is a text column.
+    Missing numbers and timestamps are NaN, and missing text is None.
+    Given schemas by log tag, as for a joined log, conditions are parsed by the schema of their log,
+    and the log tag is a column too."""
+    labels = TYPED_NUMBER_LABELS + TYPED_CATEGORY_LABELS + ([LOG_TAG_LABEL] if tag_schemas is not None else [])
+    values = {label: [] for label in labels + [TIMESTAMP_LABEL]}
+    conditions = {}
+    for index, log_entry in enumerate(entries):
+        for label in TYPED_NUMBER_LABELS:
+            values[label].append(getattr(log_entry, label, math.nan))
+        for label in labels[len(TYPED_NUMBER_LABELS):]:
+            values[label].append(getattr(log_entry, label, None) or None)
+        timestamp = getattr(log_entry, 'timestamp', None)
+        values[TIMESTAMP_LABEL].append((timestamp - EPOCH).total_seconds() if timestamp else math.nan)
+        for key, value in log_entry.conditions.items():
+            conditions.setdefault(key, {})[index] = value
+    length = len(values[TIMESTAMP_LABEL])
+    kinds = dict.fromkeys(TYPED_NUMBER_LABELS, NUMBER)
+    kinds.update((label, TEXT) for label in labels[len(TYPED_NUMBER_LABELS):])
+    # The timestamp column is the one column of its kind, which is named after it.
+    kinds[TIMESTAMP_LABEL] = TIMESTAMP_LABEL
+    log_tags = values.get(LOG_TAG_LABEL)
+    for key, texts_by_index in conditions.items():
+        numbers = [math.nan] * length
+        numbers_by_text = {}  # Values repeat a lot, so each is parsed once per log.
+        for index, text in texts_by_index.items():
+            log_tag = log_tags[index] if log_tags else None
+            try:
+                number = numbers_by_text[log_tag, text]
+            except KeyError:
+                schema = tag_schemas.get(log_tag, condition_schema) if log_tags else condition_schema
+                number = numbers_by_text[log_tag, text] = schema.typed_value(key, text)
+            if number is None:
+                continue
+            if not isinstance(number, float):
+                texts = [None] * length
+                for text_index, text_value in texts_by_index.items():
+                    texts[text_index] = text_value
+                kinds[key], values[key] = TEXT, texts
+                break
+            numbers[index] = number
+        else:
+            kinds[key], values[key] = NUMBER, numbers
+    return kinds, values
+
+
+def write_entries_file(output_filepath: str, output_format: str, log_headers: List[str], entries: List[LogEntry],
+                       omit_units=False, line_sep=os.linesep, compresslevel=None) -> str:
+    """Write the entries to one CSV, TSV or JSONL file, returning its filepath."""
+    field_sep = TABULAR_FIELD_SEPARATORS.get(output_format)
+    with open_log_file(output_filepath, 'w', compresslevel=compresslevel) as output:
+        if field_sep:
+            output.write(field_sep.join(log_headers) + line_sep)
+        for log_entry in entries:
+            if field_sep:
+                output.write(log_entry.to_csv(log_headers, field_sep=field_sep, omit_units=omit_units) + line_sep)
+            else:
+                output.write(json.dumps(log_entry.to_json()) + line_sep)
+    return output_filepath
+
+
+def write_entries_files(output_jobs: List[Tuple[str, List[LogEntry]]], output_format: str, log_headers: List[str],
+                        omit_units=False, line_sep=os.linesep, compresslevel=None) -> List[str]:
+    """Write a batch of files one after another, so a worker has only one open at a time."""
+    return [write_entries_file(output_filepath, output_format, log_headers, entries, omit_units=omit_units,
+                               line_sep=line_sep, compresslevel=compresslevel)
+            for output_filepath, entries in output_jobs]
+
+
+def load_log_file(log_class: type, input_filepath: str, log_kwargs: Dict[str, Any]) -> 'LogFile':
+    """Parse a log file; run in worker processes, which send the parsed log back pickled.
+    A profiler in the keyword arguments traces allocations in the worker while it parses."""
+    profiler = log_kwargs.get('profiler')
+    if profiler is None:
+        return log_class(input_filepath, **log_kwargs)
+    with profiler:
+        return log_class(input_filepath, **log_kwargs)
+
+
+def reload_log_file(log_file: 'LogFile', verbose=0) -> 'LogFile':
+    """Reparse an unloaded copy of a log file; run in worker processes like load_log_file."""
+    log_file.reload(verbose=verbose)
+    return log_file
+
+
+def run_log_workers(function, arguments: List[tuple], max_workers=None) -> List['LogFile']:
+    """Run the loading function over each tuple of arguments in a process pool, or in-process for just one."""
+    max_workers = min(max_workers or os.cpu_count() or 1, len(arguments))
+    if max_workers < 2:
+        return [function(*function_args) for function_args in arguments]
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(function, *zip(*arguments)))
+
+
+def sqlite_quote(identifier: str) -> str:
+    """Quote a column name, since condition keys may contain spaces and parentheses."""
+    return '"{}"'.format(identifier.replace('"', '""'))
 
 
 class LogFile(Log):
     """Parse and represent an entire log file."""
     input_filepath: str
     header: LogHeader = None
+    source_signature: Optional[Tuple[int, int]] = None
 
     def __init__(self, input_filepath: str, tabular_header_labels=None, verbose=0):
         self.input_filepath = input_filepath
         if tabular_header_labels:
             self.tabular_header_labels = tabular_header_labels
+        self.reload(verbose=verbose)
+
+    def reload(self, verbose=0):
+        """Parse the input file into state, noting its modification time and size to tell later if it changed."""
+        self.source_signature = self.read_source_signature()
         self.refresh(verbose=verbose)
 
+    def read_source_signature(self) -> Tuple[int, int]:
+        """The modification time and size of the input file."""
+        stat = os.stat(self.input_filepath)
+        return stat.st_mtime_ns, stat.st_size
+
+    @property
+    def is_changed_on_disk(self) -> bool:
+        """Whether the input file changed since it was last parsed."""
+        return self.read_source_signature() != self.source_signature
+
+    def unloaded_copy(self) -> 'LogFile':
+        """A copy without entries or profiler, cheap to send to a worker process to reload."""
+        unloaded = copy.copy(self)
+        unloaded.entries = []
+        unloaded.profiler = None
+        return unloaded
+
+    def update_from(self, reloaded: 'LogFile'):
+        """Take on the parsed state of a copy reloaded elsewhere, keeping this log's profiler."""
+        state = dict(vars(reloaded))
+        state.pop('profiler', None)
+        vars(self).update(state)
+
     def refresh(self, verbose=0):
         """Parse the input file into state."""
-        with open(self.input_filepath) as log_file:
+        with open_log_file(self.input_filepath) as log_file:
             if verbose > 0:
                 print("Reading log entries from: {}".format(self.input_filepath))
             self.entries = [LogEntry(line, index=index, verbose=verbose)
@@ -169,6 +448,22 @@ ZeroHeaderBMSMetadata = namedtuple('ZeroHeaderBMSMetadata',
                                    ['serial_no', 'pack_serial_no', 'initial_date'])
 
 
+# Width of the entry number column, including the leading space, in a decoded log line.
+ENTRY_COLUMN_WIDTH = 9
+# How many of the last entry lines a checkpoint keeps, to find its place again in a later dump.
+CHECKPOINT_SIGNATURES_COUNT = 3
+
+
+def entry_signature(log_line: str) -> str:
+    """What identifies an entry across dumps: everything after the entry number."""
+    return log_line[ENTRY_COLUMN_WIDTH:].rstrip()
+
+
+def is_entry_line(log_line: str) -> bool:
+    """Whether a line after the log divider holds an entry."""
+    return bool(log_line) and len(log_line) > 5
+
+
 def is_log_divider_line(log_line: str) -> bool:
     """The log divider line immediately precedes the log entries."""
     return log_line.startswith('+-----')
@@ -274,6 +569,9 @@ class ZeroLogHeader(LogHeader):
         return output
 
 
+ZERO_TIMESTAMP_FORMAT = '%m/%d/%Y %H:%M:%S'
+
+
 class ZeroLogEntry(LogEntry):
     """Parse and represent the metadata, message, and data in a Zero Motorcycles log entry."""
     entry: int = 0
@@ -284,29 +582,75 @@ class ZeroLogEntry(LogEntry):
     event_type: str = EMPTY_CSV_VALUE
     component: str = EMPTY_CSV_VALUE
 
+    is_selected: bool = True
+    other_conditions: str = EMPTY_CSV_VALUE
+    special_condition: Optional[str] = None
+    # How long decode_special_message_conditions took, only measured for profiling.
+    special_condition_seconds = 0.0
+
     curr_limited_message = 'Batt Dischg Cur Limited'
     low_chassis_isolation_message = 'Low Chassis Isolation'
 
-    def __init__(self, log_text, index=None, verbose=0):
+    # The attributes an entry may set on itself, in the order they are pickled.
+    state_attributes = ('entry', 'timestamp', 'segment_id', 'segment_activity', 'component', 'event_type',
+                        'event_level', 'event', 'conditions', 'is_selected', 'other_conditions', 'special_condition',
+                        'log_tag')
+    interned_state_attributes = frozenset(['segment_activity', 'component', 'event_type', 'event_level', 'event'])
+
+    def __init__(self, log_text, index=None, verbose=0, entry_filter: Optional['ZeroLogFilter'] = None,
+                 timed=False):
         super().__init__(log_text, index=index, verbose=verbose)
         try:
             self.entry = int(log_text[:9].strip())
             timestamp_text = log_text[10:32].strip()
-            if timestamp_text:
+            if entry_filter is not None:
+                self.is_selected = entry_filter.accepts_timestamp_text(timestamp_text)
+            if timestamp_text and self.is_selected:
                 try:
                     self.timestamp = self.decode_timestamp(timestamp_text)
                 except ValueError:
                     if verbose > 0:
                         print("Unable to parse timestamp: {}".format(timestamp_text))
             message = log_text[33:].strip()
-            self.decode_message(message)
+            self.decode_message(message, entry_filter=entry_filter, timed=timed)
         except ValueError:
             print("Decoding line #{} failed from content: {}".format(index, log_text))
 
+    @classmethod
+    def from_decoded(cls, entry_number: int, timestamp: Optional[datetime], message: str,
+                     entry_filter: Optional['ZeroLogFilter'] = None) -> 'ZeroLogEntry':
+        """Build an entry from fields already decoded, e.g. from a binary log, without fixed-width text."""
+        log_entry = cls.__new__(cls)
+        log_entry.entry = entry_number
+        if entry_filter is not None and timestamp is not None:
+            log_entry.is_selected = entry_filter.accepts_timestamp_text(timestamp.strftime(ZERO_TIMESTAMP_FORMAT))
+        if timestamp is not None and log_entry.is_selected:
+            log_entry.timestamp = timestamp
+        log_entry.decode_message(message, entry_filter=entry_filter)
+        return log_entry
+
+    def __getstate__(self):
+        """Pickle as a tuple rather than a dict, so entries parsed in worker processes come back compactly.
+        Repeated labels and condition keys are interned so the pickle stores each only once."""
+        state = []
+        for name in self.state_attributes:
+            value = self.__dict__.get(name)
+            if name in self.interned_state_attributes and value is not None:
+                value = sys.intern(value)
+            elif name == 'conditions' and value:
+                value = {sys.intern(key): condition_value for key, condition_value in value.items()}
+            state.append(value)
+        return tuple(state)
+
+    def __setstate__(self, state):
+        for name, value in zip(self.state_attributes, state):
+            if value is not None:
+                setattr(self, name, value)
+
     @classmethod
     def decode_timestamp(cls, timestamp_text):
         """Parse a timestamp the way a Zero Motorcycles log formats it."""
-        return datetime.strptime(timestamp_text, '%m/%d/%Y %H:%M:%S')
+        return datetime.strptime(timestamp_text, ZERO_TIMESTAMP_FORMAT)
 
     @classmethod
     def decode_level_from_message(cls, message: str) -> Tuple[str, str]:
@@ -395,6 +739,8 @@ class ZeroLogEntry(LogEntry):
         return component
 
     module_no_condition_key = 'Module'
+    # Condition keys split out of another condition by decode_special_message_conditions.
+    derived_condition_sources = {'EVSE Voltage': 'SW', 'EVSE Frequency': 'SW', 'EVSE Amps': 'SW'}
 
     def decode_special_message_conditions(self, event_contents: str) -> str:
         """Identify special conditions in the event contents"""
@@ -404,12 +750,14 @@ class ZeroLogEntry(LogEntry):
                 self.conditions['BattAmps'] = matches.group(1)
                 self.conditions['PackSOC'] = matches.group(2)
                 event_contents = self.curr_limited_message
+                self.special_condition = 'current_limited'
         elif event_contents.startswith(self.low_chassis_isolation_message):
             matches = re.search(r"(\d+ KOhms) to cell (\d+)", event_contents)
             if matches:
                 self.conditions['ImpedanceKOhms'] = matches.group(1)
                 self.conditions['Cell'] = matches.group(2)
                 event_contents = self.low_chassis_isolation_message
+                self.special_condition = 'low_chassis_isolation'
         elif re.match(r'Module \d not connected', event_contents):
             module_no = re.findall(r"\d+", event_contents)[0]
             self.conditions[self.module_no_condition_key] = module_no
@@ -419,14 +767,17 @@ class ZeroLogEntry(LogEntry):
                 if matches:
                     self.conditions[matches.group(1).strip()] = matches.group(2)
             event_contents = 'Module not connected'
+            self.special_condition = 'module_not_connected'
         elif re.match(r'Battery module \d+ contactor closed', event_contents):
             module_no = re.findall(r"\d+", event_contents)[0]
             self.conditions[self.module_no_condition_key] = module_no
             event_contents = 'Battery module contactor closed'
+            self.special_condition = 'module_contactor_closed'
         elif re.match(r'Module \d\d', event_contents):
             module_no = re.findall(r"\d+", event_contents)[0]
             self.conditions[self.module_no_condition_key] = module_no
             event_contents = event_contents[:7] + event_contents[10:]
+            self.special_condition = 'module_number'
         elif self.component == 'Charge Tank':
             if self.conditions.get('SW') and ' ' in self.conditions['SW']:
                 # Example entry for "Charger 6": 'SN:1838032 SW:206 247Vac  62Hz EVSE 41A'
@@ -435,10 +786,13 @@ class ZeroLogEntry(LogEntry):
                 self.conditions['EVSE Voltage'] = sw_conditions[1]
                 self.conditions['EVSE Frequency'] = sw_conditions[2]
                 self.conditions['EVSE Amps'] = sw_conditions[4]
+                self.special_condition = 'charge_tank'
         return event_contents
 
-    def decode_message(self, message: str):
-        """Extract LogEntry properties from the log text after the timestamp."""
+    def decode_message(self, message: str, entry_filter: Optional['ZeroLogFilter'] = None, timed=False):
+        """Extract LogEntry properties from the log text after the timestamp.
+        Conditions are only decoded for entries the filter selects and has columns for.
+        When timed, the special-condition decoding time is kept in special_condition_seconds."""
         self.event_level, event_contents = self.decode_level_from_message(message)
 
         self.event_type = self.decode_type_from_message(event_contents)
@@ -447,17 +801,28 @@ class ZeroLogEntry(LogEntry):
 
         self.component = self.decode_component_from_message(event_contents)
 
+        if entry_filter is not None and self.is_selected:
+            self.is_selected = entry_filter.accepts_event(self.component, self.event_level)
+
         # Identify and parse out conditions data:
         first_keyword_match = re.search(r"[A-Za-z]+:", event_contents)
         if first_keyword_match:
             idx = first_keyword_match.start(0)
             conditions_field = event_contents[idx:].strip()
             event_contents = event_contents[:idx].strip()
-            self.conditions = self.conditions_to_dict(conditions_field)
+            if self.is_selected and (entry_filter is None or entry_filter.wants_conditions(conditions_field)):
+                self.conditions = self.conditions_to_dict(conditions_field)
+            else:
+                self.conditions = {}
         else:
             self.conditions = {}
 
-        event_contents = self.decode_special_message_conditions(event_contents)
+        if timed:
+            special_started = time.perf_counter()
+            event_contents = self.decode_special_message_conditions(event_contents)
+            self.special_condition_seconds = time.perf_counter() - special_started
+        else:
+            event_contents = self.decode_special_message_conditions(event_contents)
 
         self.event = event_contents
 
@@ -546,10 +911,171 @@ class ZeroLogEntry(LogEntry):
         }
 
 
+class ZeroLogFilter:
+    """Select which entries and columns of a log to decode.
+    Each check runs as early in decoding as it can, so rejected entries and unwanted
+    conditions skip the more expensive stages."""
+    since_text: Optional[str] = None
+    until_text: Optional[str] = None
+    components: Optional[List[str]] = None
+    event_levels: Optional[List[str]] = None
+    columns: Optional[List[str]] = None
+
+    def __init__(self, since: Optional[datetime] = None, until: Optional[datetime] = None,
+                 components: Optional[List[str]] = None, event_levels: Optional[List[str]] = None,
+                 columns: Optional[List[str]] = None):
+        if since:
+            self.since_text = self.sortable_timestamp_text(since.strftime(ZERO_TIMESTAMP_FORMAT))
+        if until:
+            self.until_text = self.sortable_timestamp_text(until.strftime(ZERO_TIMESTAMP_FORMAT))
+        if components:
+            self.components = [component.lower() for component in components]
+        if event_levels:
+            self.event_levels = [event_level.upper() for event_level in event_levels]
+        if columns:
+            self.columns = columns
+            self.condition_columns = [column for column in columns if column not in ZeroLogFile.common_headers]
+            condition_keys = {column.split(' (')[0] for column in self.condition_columns}
+            # Derived keys only appear once their source condition is decoded, so look for the source instead.
+            self.condition_column_prefixes = {ZeroLogEntry.derived_condition_sources.get(key, key)
+                                              for key in condition_keys}
+
+    @staticmethod
+    def sortable_timestamp_text(timestamp_text: str) -> str:
+        """Reorder a fixed-width MM/DD/YYYY HH:MM:SS timestamp so that text order is time order."""
+        return timestamp_text[6:10] + timestamp_text[0:5] + timestamp_text[10:]
+
+    def accepts_timestamp_text(self, timestamp_text: str) -> bool:
+        """Check the time window against the timestamp text, without parsing it."""
+        if self.since_text is None and self.until_text is None:
+            return True
+        if not timestamp_text:
+            return False
+        sortable_text = self.sortable_timestamp_text(timestamp_text)
+        return (self.since_text is None or sortable_text >= self.since_text) and \
+            (self.until_text is None or sortable_text <= self.until_text)
+
+    def accepts_event(self, component: str, event_level: str) -> bool:
+        """Check the component and level, decoded from the message before its conditions."""
+        return (self.components is None or component.lower() in self.components) and \
+            (self.event_levels is None or event_level in self.event_levels)
+
+    def wants_conditions(self, conditions_field: str) -> bool:
+        """Whether the conditions text may hold any projected condition column."""
+        if self.columns is None:
+            return True
+        return any(prefix in conditions_field for prefix in self.condition_column_prefixes)
+
+    def project_conditions(self, conditions: Dict[str, str]) -> Dict[str, str]:
+        """Keep only the projected condition columns."""
+        if self.columns is None:
+            return conditions
+        return {key: value for key, value in conditions.items() if key in self.condition_columns}
+
+
+class ZeroLogCheckpoint:
+    """Record how far a log has been processed into its outputs, so a rerun resumes from there."""
+    entry: int = 0
+    timestamp: Optional[datetime] = None
+    segment_id: int = 0
+    segment_activity: str = 'STOPPED'
+    conditions_keys: List[str]
+    output_filepaths: List[str]
+    signatures: List[str]
+
+    def __init__(self, entry=0, timestamp=None, segment_id=0, segment_activity='STOPPED',
+                 conditions_keys=None, output_filepaths=None, signatures=None):
+        self.entry = entry
+        self.timestamp = timestamp
+        self.segment_id = segment_id
+        self.segment_activity = segment_activity
+        self.conditions_keys = conditions_keys or []
+        self.output_filepaths = output_filepaths or []
+        self.signatures = signatures or []
+
+    @staticmethod
+    def filepath_for(base_filepath: str) -> str:
+        """The checkpoint file lives next to the outputs sharing its base filepath."""
+        return base_filepath + '.checkpoint.json'
+
+    @classmethod
+    def load(cls, checkpoint_filepath: str) -> Optional['ZeroLogCheckpoint']:
+        """Read a checkpoint file, if there is one."""
+        if not os.path.exists(checkpoint_filepath):
+            return None
+        with open(checkpoint_filepath) as checkpoint_file:
+            data = json.load(checkpoint_file)
+        return cls(entry=data['entry'],
+                   timestamp=data['timestamp'] and datetime.fromisoformat(data['timestamp']),
+                   segment_id=data['segment_id'],
+                   segment_activity=data['segment_activity'],
+                   conditions_keys=data['conditions_keys'],
+                   output_filepaths=data['output_filepaths'],
+                   signatures=data.get('signatures'))
+
+    def save(self, checkpoint_filepath: str):
+        """Write the checkpoint file."""
+        with open(checkpoint_filepath, 'w') as checkpoint_file:
+            json.dump(self.to_json(), checkpoint_file, indent=2)
+
+    @classmethod
+    def for_log(cls, log: 'ZeroLogFile', output_filepaths: List[str],
+                previous: Optional['ZeroLogCheckpoint'] = None) -> 'ZeroLogCheckpoint':
+        """Checkpoint the last entry line of the log, whether or not the filter selected it, or keep the
+        previous checkpoint if the log had no new lines."""
+        last_entry = log.last_parsed_entry
+        if last_entry is None:
+            return previous or cls(output_filepaths=output_filepaths)
+        return cls(entry=last_entry.entry,
+                   timestamp=getattr(last_entry, 'timestamp', None),
+                   segment_id=last_entry.segment_id,
+                   segment_activity=last_entry.segment_activity,
+                   conditions_keys=log.tabular_conditions_keys,
+                   output_filepaths=output_filepaths,
+                   signatures=log.last_line_signatures)
+
+    def covers_outputs(self, output_filepaths: List[str]) -> bool:
+        """Whether all the outputs exist and were written up to this checkpoint."""
+        return all(filepath in self.output_filepaths and os.path.exists(filepath)
+                   for filepath in output_filepaths)
+
+    def index_after_signatures(self, log_lines: List[str], start_index: int) -> Optional[int]:
+        """Find the checkpointed entry lines by their content, as entry numbers shift between dumps,
+        and return the index of the line after them, or None if they are not in the log."""
+        if not self.signatures:
+            return None
+        entry_indexes = [index for index in range(start_index, len(log_lines)) if is_entry_line(log_lines[index])]
+        count = len(self.signatures)
+        for position in range(len(entry_indexes) - count, -1, -1):
+            if all(entry_signature(log_lines[entry_indexes[position + offset]]) == signature
+                   for offset, signature in enumerate(self.signatures)):
+                return entry_indexes[position + count - 1] + 1
+        return None
+
+    def to_json(self):
+        """Convert to JSON-serializable data structure."""
+        return {
+            'entry': self.entry,
+            'timestamp': self.timestamp and self.timestamp.isoformat(),
+            'segment_id': self.segment_id,
+            'segment_activity': self.segment_activity,
+            'conditions_keys': self.conditions_keys,
+            'output_filepaths': self.output_filepaths,
+            'signatures': self.signatures
+        }
+
+
 class ZeroLogFile(LogFile):
     """Parse and represent an entire Zero Motorcycles log file."""
     header: ZeroLogHeader
     entries: List[ZeroLogEntry] = []
+    checkpoint: Optional[ZeroLogCheckpoint] = None
+    last_line_signatures: List[str] = []
+    # The last entry decoded, before the filter dropped any: where the segment state was left.
+    last_parsed_entry: Optional[ZeroLogEntry] = None
+    entry_filter: Optional[ZeroLogFilter] = None
+    schema_registry: bool = False
+    condition_schema: Optional[ConditionSchema] = None
 
     common_headers = ['entry',
                       'segment_id',
@@ -560,11 +1086,25 @@ class ZeroLogFile(LogFile):
                       'event_level',
                       'event']
 
-    def annotate_entry_segment_info(self):
-        """Auto-increment a numeric ID for each sequence of entries for a closed contactor."""
-        current_segment_id = 0
-        current_activity = 'STOPPED'
-        for entry in self.entries:
+    def __init__(self, input_filepath: str, tabular_header_labels=None, checkpoint=None, entry_filter=None,
+                 schema_registry=False, profiler=None, verbose=0):
+        self.checkpoint = checkpoint
+        self.entry_filter = entry_filter
+        self.schema_registry = schema_registry
+        self.profiler = profiler
+        super().__init__(input_filepath, tabular_header_labels=tabular_header_labels, verbose=verbose)
+
+    def annotate_entry_segment_info(self, current_segment_id=0, current_activity='STOPPED'):
+        """Auto-increment a numeric ID for each sequence of entries for a closed contactor.
+        The starting segment state can be given to continue from earlier entries."""
+        for _ in self.annotate_segments(self.entries, current_segment_id, current_activity):
+            pass
+
+    @staticmethod
+    def annotate_segments(entries: Iterable[ZeroLogEntry], current_segment_id=0,
+                          current_activity='STOPPED') -> Iterator[ZeroLogEntry]:
+        """Annotate segment info on each entry in turn, as the entries are decoded."""
+        for entry in entries:
             if entry.is_contactor_close_entry():
                 current_activity = 'STARTED'
                 current_segment_id += 1
@@ -579,32 +1119,265 @@ class ZeroLogFile(LogFile):
                 current_segment_id += 1
             entry.segment_id = current_segment_id
             entry.segment_activity = current_activity
+            yield entry
+
+    @staticmethod
+    def select_entries(entries: Iterable[ZeroLogEntry], entry_filter: Optional[ZeroLogFilter] = None,
+                       condition_schema: Optional[ConditionSchema] = None) -> Iterator[ZeroLogEntry]:
+        """Drop entries the filter rejects, and fit the conditions of the rest to the output columns."""
+        for entry in entries:
+            if not entry.is_selected:
+                continue
+            if entry_filter:
+                entry.conditions = entry_filter.project_conditions(entry.conditions)
+            if condition_schema:
+                overflow = condition_schema.overflow_conditions(entry.conditions)
+                if overflow:
+                    entry.other_conditions = condition_schema.overflow_text(overflow)
+            yield entry
+
+    @classmethod
+    def read_entries(cls, log_lines: Iterable[str], start_index=0, entry_filter=None, profiler=None,
+                     verbose=0) -> Iterator[ZeroLogEntry]:
+        """Lazily decode the entry lines following the header divider.
+        With a profiler, each entry's decoding is timed and counted by message family,
+        and its special-condition branch is timed on its own."""
+        for index, line in enumerate(log_lines, start_index):
+            if is_entry_line(line):
+                if profiler is None:
+                    yield ZeroLogEntry(line, index=index, verbose=verbose, entry_filter=entry_filter)
+                    continue
+                decode_started = time.perf_counter()
+                log_entry = ZeroLogEntry(line, index=index, verbose=verbose, entry_filter=entry_filter, timed=True)
+                profiler.count_entry(cls.entry_family(log_entry), time.perf_counter() - decode_started,
+                                     log_entry.special_condition, log_entry.special_condition_seconds)
+                yield log_entry
 
     def refresh(self, verbose=0):
         """Parse the input file into state."""
-        with open(self.input_filepath) as log_file:
+        with self.profile_stage('read'), open_log_file(self.input_filepath) as log_file:
             if verbose > 0:
                 print("Reading log header from: {}".format(self.input_filepath))
             log_lines = log_file.readlines()
+        with self.profile_stage('header'):
             self.header = ZeroLogHeader(log_lines, verbose=verbose)
         if verbose > 0:
             print("Reading log entries from: {}".format(self.input_filepath))
-        divider_index = self.header.index_of_divider_line(log_lines)
-        self.entries = [ZeroLogEntry(line, index=index, verbose=verbose)
-                        for index, line in enumerate(log_lines)
-                        if index > divider_index and line and len(line) > 5]
-        self.annotate_entry_segment_info()
-        self.tabular_header_labels = self.common_headers + self.all_conditions_keys
+        start_index = self.header.index_of_divider_line(log_lines) + 1
+        self.last_line_signatures = self.read_last_line_signatures(log_lines, start_index)
+        if self.checkpoint:
+            resume_index = self.checkpoint.index_after_signatures(log_lines, start_index)
+            if resume_index is None:
+                if verbose > 0:
+                    print("Checkpointed entries are not in the log; reading all of it")
+                self.checkpoint = None
+            else:
+                start_index = resume_index
+                if verbose > 0:
+                    print("Resuming after entry #{} at line {}".format(self.checkpoint.entry, start_index))
+        with self.profile_stage('decode') as stage:
+            self.entries = list(self.read_entries(log_lines[start_index:], start_index=start_index,
+                                                  entry_filter=self.entry_filter, profiler=self.profiler,
+                                                  verbose=verbose))
+            stage['entries'] = len(self.entries)
+        self.process_entries()
+
+    def process_entries(self):
+        """Annotate segments on the decoded entries, select them, and settle the tabular output columns."""
+        with self.profile_stage('annotate') as stage:
+            if self.checkpoint:
+                self.annotate_entry_segment_info(self.checkpoint.segment_id, self.checkpoint.segment_activity)
+            else:
+                self.annotate_entry_segment_info()
+            stage['entries'] = len(self.entries)
+        self.last_parsed_entry = self.entries[-1] if self.entries else None
+        with self.profile_stage('select') as stage:
+            if self.schema_registry:
+                self.condition_schema = self.schema_for_header(self.header)
+            # Entries the filter rejects were still needed above to track segments.
+            self.entries = list(self.select_entries(self.entries, self.entry_filter, self.condition_schema))
+            stage['entries'] = len(self.entries)
+        with self.profile_stage('conditions_keys') as stage:
+            if self.entry_filter and self.entry_filter.columns:
+                self.tabular_header_labels = list(self.entry_filter.columns)
+            elif self.condition_schema:
+                self.tabular_header_labels = self.schema_header_labels(self.condition_schema)
+            elif self.checkpoint:
+                checkpoint_keys = self.checkpoint.conditions_keys
+                self.tabular_header_labels = self.common_headers + checkpoint_keys + \
+                    [k for k in self.all_conditions_keys if k not in checkpoint_keys]
+            else:
+                self.tabular_header_labels = self.common_headers + self.all_conditions_keys
+            stage['entries'] = len(self.entries)
+
+    @staticmethod
+    def read_last_line_signatures(log_lines: List[str], start_index: int) -> List[str]:
+        """The content signatures of the last entry lines, for a checkpoint to find its place in a later dump."""
+        signatures = []
+        for line in reversed(log_lines[start_index:]):
+            if len(signatures) == CHECKPOINT_SIGNATURES_COUNT:
+                break
+            if is_entry_line(line):
+                signatures.insert(0, entry_signature(line))
+        return signatures
+
+    @property
+    def has_new_conditions_keys(self) -> bool:
+        """Whether entries read after the checkpoint have condition keys the outputs lack."""
+        return bool(self.checkpoint) and self.tabular_conditions_keys != self.checkpoint.conditions_keys
+
+    @property
+    def tabular_conditions_keys(self) -> List[str]:
+        """The condition keys among the tabular output columns."""
+        return [label for label in self.tabular_header_labels if label not in self.common_headers]
 
     @property
     def all_conditions_keys(self):
         """Return data labels used across all log entries for tabular output."""
-        conditions_keys = []
-        for entry in self.entries:
-            for k in entry.conditions.keys():
-                if k not in conditions_keys:
-                    conditions_keys.append(k)
-        return conditions_keys
+        return discover_conditions_keys(entry.conditions for entry in self.entries)
+
+    def typed_condition_schema(self) -> ConditionSchema:
+        """The condition schema that parses condition values for typed columns."""
+        return self.condition_schema or self.schema_for_header(self.header)
+
+    @staticmethod
+    def schema_for_header(header: ZeroLogHeader) -> ConditionSchema:
+        """The registered condition schema for the kind of log and firmware the header describes."""
+        firmware_rev = header.mbb_metadata.firmware_rev if header.log_source == 'MBB' else None
+        return ConditionSchema.for_source(header.log_source, firmware_rev)
+
+    @classmethod
+    def schema_header_labels(cls, condition_schema: ConditionSchema) -> List[str]:
+        """Tabular output labels known before parsing, with an overflow column for unregistered keys."""
+        return cls.common_headers + condition_schema.keys + [OVERFLOW_CONDITIONS_LABEL]
+
+    @classmethod
+    def stream_to_file(cls, input_filepath: str, output_filepath: str, output_format: str,
+                       entry_filter: Optional[ZeroLogFilter] = None, omit_units=False,
+                       line_sep=os.linesep, compresslevel=None, profiler=None, verbose=0) -> int:
+        """Decode and emit entries one at a time, with tabular headers from the condition schema registry.
+        Only CSV, TSV and JSONL can be streamed. Returns how many entries were emitted."""
+        field_sep = TABULAR_FIELD_SEPARATORS.get(output_format)
+        if verbose >= 0:
+            print('Streaming {} output to: {}'.format(output_format.upper(), output_filepath))
+        entries_count = 0
+        with open_log_file(input_filepath) as log_file, \
+                open_log_file(output_filepath, 'w', compresslevel=compresslevel) as output:
+            header = ZeroLogHeader(ZeroLogHeader.read_header_lines(log_file), verbose=verbose)
+            condition_schema = cls.schema_for_header(header)
+            log_headers = entry_filter.columns if entry_filter and entry_filter.columns else \
+                cls.schema_header_labels(condition_schema)
+            if field_sep:
+                output.write(field_sep.join(log_headers) + line_sep)
+            entries = cls.read_entries(log_file, entry_filter=entry_filter, profiler=profiler, verbose=verbose)
+            for log_entry in cls.select_entries(cls.annotate_segments(entries), entry_filter, condition_schema):
+                if field_sep:
+                    output.write(log_entry.to_csv(log_headers, field_sep=field_sep, omit_units=omit_units) + line_sep)
+                else:
+                    output.write(json.dumps(log_entry.to_json()) + line_sep)
+                entries_count += 1
+        return entries_count
+
+    @property
+    def entry_header_labels(self) -> List[str]:
+        """The tabular output columns that are entry properties rather than condition keys."""
+        return [label for label in self.tabular_header_labels if label in self.common_headers]
+
+    def output_to_long_file(self, output_filepath, output_format, omit_units=False, line_sep=os.linesep,
+                            append=False, compresslevel=None, verbose=0):
+        """Emit a narrow CSV/TSV table with one row per entry and condition key.
+        Entries without conditions get a single row with an empty condition."""
+        field_sep = TABULAR_FIELD_SEPARATORS[output_format]
+        append = append and os.path.exists(output_filepath)
+        if verbose >= 0:
+            print('{} long {} output to: {}'.format('Appending' if append else 'Emitting',
+                                                    output_format.upper(), output_filepath))
+        entry_headers = self.entry_header_labels
+        with open_log_file(output_filepath, 'a' if append else 'w', compresslevel=compresslevel) as output:
+            if not append:
+                output.write(field_sep.join(entry_headers + ['condition', 'value']) + line_sep)
+            for log_entry in self.entries:
+                entry_values = [log_entry.print_property_tabular(index, key, omit_units=omit_units)
+                                for index, key in enumerate(entry_headers)]
+                for key in log_entry.conditions or [EMPTY_CSV_VALUE]:
+                    value = log_entry.print_property_tabular(len(entry_headers), key, omit_units=omit_units)
+                    output.write(field_sep.join(entry_values + [key, value]) + line_sep)
+
+    @staticmethod
+    def entry_family(log_entry: ZeroLogEntry) -> str:
+        """Name the table an entry goes to when splitting by component and event type."""
+        family = '_'.join(part for part in [log_entry.component, log_entry.event_type] if part)
+        return re.sub(r"[^A-Za-z0-9]+", '_', family).strip('_') or 'other'
+
+    def output_split_files(self, base_filepath, output_format, omit_units=False, line_sep=os.linesep,
+                           suffix='', compresslevel=None, verbose=0) -> Dict[str, str]:
+        """Emit a CSV/TSV table per component and event type, with only the condition columns it uses.
+        Tables are named like <base>.<family>.<format><suffix>; returns the filepath of each family."""
+        field_sep = TABULAR_FIELD_SEPARATORS[output_format]
+        entry_headers = self.entry_header_labels
+        families = {}
+        for log_entry in self.entries:
+            family_entries, family_keys = families.setdefault(self.entry_family(log_entry), ([], {}))
+            family_entries.append(log_entry)
+            family_keys.update(dict.fromkeys(log_entry.conditions))
+        output_filepaths = {}
+        for family, (family_entries, family_keys) in families.items():
+            output_filepath = '{}.{}.{}{}'.format(base_filepath, family, output_format, suffix)
+            if verbose >= 0:
+                print('Emitting {} output to: {}'.format(output_format.upper(), output_filepath))
+            log_headers = entry_headers + list(family_keys)
+            with open_log_file(output_filepath, 'w', compresslevel=compresslevel) as output:
+                output.write(field_sep.join(log_headers) + line_sep)
+                for log_entry in family_entries:
+                    output.write(log_entry.to_csv(log_headers, field_sep=field_sep, omit_units=omit_units) + line_sep)
+            output_filepaths[family] = output_filepath
+        return output_filepaths
+
+    def segments(self) -> List[List[ZeroLogEntry]]:
+        """The entries grouped into runs of the same segment ID."""
+        segments = []
+        for log_entry in self.entries:
+            if not segments or segments[-1][0].segment_id != log_entry.segment_id:
+                segments.append([])
+            segments[-1].append(log_entry)
+        return segments
+
+    @staticmethod
+    def segment_filepath(base_filepath: str, segment_entries: List[ZeroLogEntry], output_format: str,
+                         suffix='', id_width=4) -> str:
+        """Name a segment's output by its ID, activity and start time."""
+        first_entry = segment_entries[0]
+        start_time = first_entry.timestamp.strftime('%Y%m%dT%H%M%S') \
+            if getattr(first_entry, 'timestamp', None) else 'unknown'
+        return '{}.segment-{:0{}d}-{}-{}.{}{}'.format(
+            base_filepath, first_entry.segment_id, id_width, first_entry.segment_activity, start_time,
+            output_format, suffix)
+
+    def output_segment_files(self, base_filepath, output_format, omit_units=False, line_sep=os.linesep,
+                             suffix='', compresslevel=None, max_workers=None, use_processes=True,
+                             verbose=0) -> List[str]:
+        """Emit a CSV, TSV or JSONL file per ride/charge segment, rendered in parallel workers.
+        Each worker writes its batch of segments one file at a time, so at most max_workers files are open."""
+        segments = self.segments()
+        if not segments:
+            return []
+        max_workers = max_workers or os.cpu_count() or 1
+        id_width = max(4, len(str(segments[-1][0].segment_id)))
+        output_jobs = [(self.segment_filepath(base_filepath, segment_entries, output_format, suffix, id_width),
+                        segment_entries)
+                       for segment_entries in segments]
+        if verbose >= 0:
+            print('Emitting {} {} outputs to: {}.segment-*'.format(
+                len(output_jobs), output_format.upper(), base_filepath))
+        # A few batches per worker keeps them busy without pickling a task per segment.
+        batch_size = max(1, len(output_jobs) // (max_workers * 4))
+        batches = [output_jobs[start:start + batch_size] for start in range(0, len(output_jobs), batch_size)]
+        executor_class = ProcessPoolExecutor if use_processes and len(batches) > 1 else ThreadPoolExecutor
+        with executor_class(max_workers=min(max_workers, len(batches))) as executor:
+            futures = [executor.submit(write_entries_files, batch, output_format, self.tabular_header_labels,
+                                       omit_units=omit_units, line_sep=line_sep, compresslevel=compresslevel)
+                       for batch in batches]
+            return [output_filepath for future in futures for output_filepath in future.result()]
 
     def to_json(self):
         """Convert to JSON-serializable data structure."""
@@ -619,15 +1392,43 @@ class JoinedLog(Log):
     primary_log: LogFile
     sorted_entries: List[LogEntry]
 
-    def __init__(self, primary_log: LogFile, secondary_logs: Dict[str, LogFile]):
+    def __init__(self, primary_log: LogFile, secondary_logs: Dict[str, LogFile], max_workers=None):
         self.primary_log = primary_log
         self.secondary_logs = secondary_logs
+        self.max_workers = max_workers
         self.refresh()
 
+    @classmethod
+    def load(cls, primary_filepath: str, secondary_filepaths: Dict[str, str], log_class=None, max_workers=None,
+             **log_kwargs) -> 'JoinedLog':
+        """Parse the primary and secondary log files concurrently in worker processes, then join them.
+        The log class defaults to ZeroLogFile, and is given the other keyword arguments. A profiler
+        is given the measurements of every log, each taken by its own profiler in its worker."""
+        log_class = log_class or ZeroLogFile
+        profiler = log_kwargs.pop('profiler', None)
+        arguments = []
+        for input_filepath in [primary_filepath] + list(secondary_filepaths.values()):
+            if profiler:
+                worker_kwargs = dict(log_kwargs, profiler=StageProfiler(trace_allocations=profiler.trace_allocations))
+            else:
+                worker_kwargs = log_kwargs
+            arguments.append((log_class, input_filepath, worker_kwargs))
+        log_files = run_log_workers(load_log_file, arguments, max_workers=max_workers)
+        if profiler:
+            for log_file in log_files:
+                profiler.merge(log_file.profiler)
+                log_file.profiler = profiler
+        return cls(log_files[0], dict(zip(secondary_filepaths, log_files[1:])), max_workers=max_workers)
+
+    @property
+    def source_logs(self) -> List[LogFile]:
+        """The primary log, then each secondary log."""
+        return [self.primary_log] + list(self.secondary_logs.values())
+
     @property
     def all_entries_by_timestamp(self) -> List[LogEntry]:
         """Return each LogEntry in turn, by timestamp order."""
-        all_entries = self.primary_log.entries
+        all_entries = list(self.primary_log.entries)
         for key, log in self.secondary_logs.items():
             for entry in log.entries:
                 entry.log_tag = key
@@ -645,11 +1446,26 @@ class JoinedLog(Log):
         if verbose > 0:
             print("Refreshing joined log")
         if deep:
-            self.primary_log.refresh(verbose=verbose)
-            for log in self.secondary_logs.values():
-                log.refresh(verbose=verbose)
+            self.reload_changed_logs(verbose=verbose)
         self.sorted_entries = self.all_entries_by_timestamp
 
+    def reload_changed_logs(self, verbose=0) -> List[LogFile]:
+        """Reparse the source logs whose files changed on disk, concurrently, and return them."""
+        changed_logs = [log for log in self.source_logs if log.is_changed_on_disk]
+        if verbose > 0:
+            print("Reloading {} of {} logs".format(len(changed_logs), len(self.source_logs)))
+        reloaded_logs = run_log_workers(reload_log_file, [(log.unloaded_copy(), verbose) for log in changed_logs],
+                                        max_workers=self.max_workers)
+        for log, reloaded_log in zip(changed_logs, reloaded_logs):
+            log.update_from(reloaded_log)
+        return changed_logs
+
+    def typed_columns(self) -> Tuple[Dict[str, str], Dict[str, list]]:
+        """The kind and the values of each typed column of the entries, parsing conditions by the schema of
+        their log, and with a log tag column."""
+        tag_schemas = {log_tag: log.typed_condition_schema() for log_tag, log in self.secondary_logs.items()}
+        return typed_entry_columns(self.entries, self.primary_log.typed_condition_schema(), tag_schemas)
+
     def entry_for_timestamp(self, when: datetime) -> LogEntry:
         """Synthesize a merged log entry for the given timestamp."""
         dummy_entry = LogEntry('')
@@ -678,16 +1494,16 @@ class JoinedLog(Log):
         :returns JoinedLog"""
         secondary_logs = self.secondary_logs.copy()
         secondary_logs[prefix] = another_log
-        return self.__class__(self.primary_log, secondary_logs)
+        return self.__class__(self.primary_log, secondary_logs, max_workers=self.max_workers)
 
 
 if __name__ == "__main__":
-    import sys
+    import cProfile
     import argparse
 
     ARGS_PARSER = argparse.ArgumentParser()
     ARGS_PARSER.add_argument("--format", default='all',
-                             choices=['csv', 'tsv', 'json', 'all'],
+                             choices=['csv', 'tsv', 'json', 'jsonl', 'sqlite', 'all'],
                              help="the output format desired")
     ARGS_PARSER.add_argument("--verbose", "-v",
                              action='count', default=0,
@@ -695,8 +1511,41 @@ if __name__ == "__main__":
     ARGS_PARSER.add_argument("--omit-units",
                              action='store_true', dest='omit_units',
                              help="omit units from the data values")
+    ARGS_PARSER.add_argument("--incremental",
+                             action='store_true',
+                             help="only decode entries after the last run's checkpoint, appending them to its outputs")
+    ARGS_PARSER.add_argument("--compress", choices=['gz', 'bz2', 'xz'],
+                             help="compress the outputs with this codec")
+    ARGS_PARSER.add_argument("--compress-level", type=int, dest='compress_level',
+                             help="the compression level (gz/bz2: 1-9, xz: 0-9)")
+    ARGS_PARSER.add_argument("--since", type=datetime.fromisoformat,
+                             help="only entries at or after this time (YYYY-MM-DD[ HH:MM:SS])")
+    ARGS_PARSER.add_argument("--until", type=datetime.fromisoformat,
+                             help="only entries at or before this time (YYYY-MM-DD[ HH:MM:SS])")
+    ARGS_PARSER.add_argument("--component", action='append', dest='components',
+                             help="only entries for this component, e.g. Battery; may be repeated")
+    ARGS_PARSER.add_argument("--level", action='append', dest='event_levels',
+                             choices=['INFO', 'DEBUG', 'WARNING', 'ERROR'],
+                             help="only entries with this event level; may be repeated")
+    ARGS_PARSER.add_argument("--columns", type=lambda columns: [column.strip() for column in columns.split(',')],
+                             help="only these comma-separated columns, e.g. timestamp,event,PackSOC")
+    ARGS_PARSER.add_argument("--schema", default='discover', choices=['discover', 'registry'],
+                             help="take tabular data columns from all entries, or from the registry of known keys"
+                                  " (unknown keys go to an other_conditions column; CSV/TSV/JSONL are streamed)")
+    ARGS_PARSER.add_argument("--layout", default='wide', choices=['wide', 'long', 'split'],
+                             help="for CSV/TSV: one column per data key, one row per entry and data key,"
+                                  " or one table per component and event type")
+    ARGS_PARSER.add_argument("--split-by", dest='split_by', choices=['segment'],
+                             help="emit a CSV/TSV/JSONL file per ride or charge segment")
+    ARGS_PARSER.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                             help="how many segment files to render at once with --split-by")
+    ARGS_PARSER.add_argument("--profile", metavar='REPORT',
+                             help="write a JSON report of the time, CPU and allocations of each processing stage")
+    ARGS_PARSER.add_argument("--profile-dump", dest='profile_dump', metavar='PSTATS',
+                             help="write cProfile stats of the whole run to this file")
     ARGS_PARSER.add_argument("logfile",
-                             help="the parsed log file to process")
+                             help="the parsed log file to process (may be .gz, .bz2 or .xz compressed),"
+                                  " or a raw .bin log dump")
     ARGS_PARSER.add_argument("--outfile",
                              help="the name of output file to emit")
 
@@ -705,8 +1554,6 @@ if __name__ == "__main__":
     if not os.path.exists(LOG_FILEPATH):
         print("Log file does not exist: ", LOG_FILEPATH)
         sys.exit(1)
-    print('Reading log: {}'.format(LOG_FILEPATH))
-    LOG_FILE = ZeroLogFile(LOG_FILEPATH, verbose=CLI_ARGS.verbose)
 
     OUTPUT_FORMAT = CLI_ARGS.format
 
@@ -714,14 +1561,113 @@ if __name__ == "__main__":
 
     OUTPUT_FILEPATH = CLI_ARGS.outfile
     if OUTPUT_FILEPATH:
-        BASE_FILEPATH = os.path.splitext(OUTPUT_FILEPATH)[0]
+        COMPRESSION_SUFFIX = compression_suffix(OUTPUT_FILEPATH) or \
+            (CLI_ARGS.compress and '.' + CLI_ARGS.compress) or ''
+        BASE_FILEPATH = os.path.splitext(strip_compression_suffix(OUTPUT_FILEPATH))[0]
     else:
-        BASE_FILEPATH = os.path.splitext(LOG_FILEPATH)[0]
+        COMPRESSION_SUFFIX = CLI_ARGS.compress and '.' + CLI_ARGS.compress or ''
+        BASE_FILEPATH = os.path.splitext(strip_compression_suffix(LOG_FILEPATH))[0]
         OUTPUT_FILEPATH = BASE_FILEPATH + '.' + OUTPUT_FORMAT
+    if OUTPUT_FORMAT != 'all':
+        OUTPUT_FILEPATH = strip_compression_suffix(OUTPUT_FILEPATH)
+    if OUTPUT_FORMAT == 'sqlite':
+        COMPRESSION_SUFFIX = ''
 
     if OUTPUT_FORMAT == 'all':
-        for out_format in ['csv', 'tsv', 'json']:
-            out_filepath = BASE_FILEPATH + '.' + out_format
-            LOG_FILE.output_to_file(out_filepath, out_format, omit_units=OMIT_UNITS)
+        OUTPUT_FILEPATHS_BY_FORMAT = {out_format: BASE_FILEPATH + '.' + out_format + COMPRESSION_SUFFIX
+                                      for out_format in ['csv', 'tsv', 'json']}
     else:
-        LOG_FILE.output_to_file(OUTPUT_FILEPATH, OUTPUT_FORMAT, omit_units=OMIT_UNITS)
+        OUTPUT_FILEPATHS_BY_FORMAT = {OUTPUT_FORMAT: OUTPUT_FILEPATH + COMPRESSION_SUFFIX}
+    LAYOUT = CLI_ARGS.layout
+    if LAYOUT != 'wide' and not set(TABULAR_FIELD_SEPARATORS) & set(OUTPUT_FILEPATHS_BY_FORMAT):
+        ARGS_PARSER.error('--layout {} needs CSV or TSV output'.format(LAYOUT))
+    if LAYOUT == 'split' and CLI_ARGS.incremental:
+        ARGS_PARSER.error('--layout split cannot be combined with --incremental')
+    if LAYOUT == 'long' and not (CLI_ARGS.outfile and OUTPUT_FORMAT != 'all'):
+        for out_format in set(TABULAR_FIELD_SEPARATORS) & set(OUTPUT_FILEPATHS_BY_FORMAT):
+            OUTPUT_FILEPATHS_BY_FORMAT[out_format] = BASE_FILEPATH + '.long.' + out_format + COMPRESSION_SUFFIX
+    OUTPUT_FILEPATHS = list(OUTPUT_FILEPATHS_BY_FORMAT.values())
+    if CLI_ARGS.split_by:
+        if LAYOUT != 'wide' or CLI_ARGS.incremental:
+            ARGS_PARSER.error('--split-by cannot be combined with --layout or --incremental')
+        if not set(OUTPUT_FILEPATHS_BY_FORMAT) <= {'csv', 'tsv', 'jsonl'}:
+            ARGS_PARSER.error('--split-by needs --format csv, tsv or jsonl')
+
+    BINARY_INPUT = LOG_FILEPATH.lower().endswith('.bin')
+    if BINARY_INPUT and CLI_ARGS.incremental:
+        ARGS_PARSER.error('--incremental needs a parsed text log, not a .bin dump')
+
+    CHECKPOINT_FILEPATH = ZeroLogCheckpoint.filepath_for(BASE_FILEPATH)
+    CHECKPOINT = ZeroLogCheckpoint.load(CHECKPOINT_FILEPATH) if CLI_ARGS.incremental else None
+    if CHECKPOINT and not CHECKPOINT.covers_outputs(OUTPUT_FILEPATHS):
+        print('Checkpoint does not cover all outputs; processing the whole log')
+        CHECKPOINT = None
+
+    ENTRY_FILTER = None
+    if CLI_ARGS.since or CLI_ARGS.until or CLI_ARGS.components or CLI_ARGS.event_levels or CLI_ARGS.columns:
+        ENTRY_FILTER = ZeroLogFilter(since=CLI_ARGS.since, until=CLI_ARGS.until, components=CLI_ARGS.components,
+                                     event_levels=CLI_ARGS.event_levels, columns=CLI_ARGS.columns)
+
+    PROFILER = StageProfiler() if CLI_ARGS.profile else None
+    if PROFILER:
+        PROFILER.start()
+    C_PROFILER = cProfile.Profile() if CLI_ARGS.profile_dump else None
+    if C_PROFILER:
+        C_PROFILER.enable()
+
+    SCHEMA_REGISTRY = CLI_ARGS.schema == 'registry'
+    if SCHEMA_REGISTRY and LAYOUT == 'wide' and not CLI_ARGS.incremental and not BINARY_INPUT and \
+            set(OUTPUT_FILEPATHS_BY_FORMAT) <= {'csv', 'tsv', 'jsonl'}:
+        for out_format, out_filepath in OUTPUT_FILEPATHS_BY_FORMAT.items():
+            with PROFILER.stage('stream_' + out_format) if PROFILER else nullcontext({}) as STAGE:
+                STAGE['entries'] = ZeroLogFile.stream_to_file(
+                    LOG_FILEPATH, out_filepath, out_format, entry_filter=ENTRY_FILTER, omit_units=OMIT_UNITS,
+                    compresslevel=CLI_ARGS.compress_level, profiler=PROFILER, verbose=CLI_ARGS.verbose)
+    else:
+        print('Reading log: {}'.format(LOG_FILEPATH))
+        if BINARY_INPUT:
+            from read_binary_log import ZeroBinaryLogFile
+            LOG_FILE = ZeroBinaryLogFile(LOG_FILEPATH, entry_filter=ENTRY_FILTER, schema_registry=SCHEMA_REGISTRY,
+                                         profiler=PROFILER, verbose=CLI_ARGS.verbose)
+        else:
+            LOG_FILE = ZeroLogFile(LOG_FILEPATH, checkpoint=CHECKPOINT, entry_filter=ENTRY_FILTER,
+                                   schema_registry=SCHEMA_REGISTRY, profiler=PROFILER, verbose=CLI_ARGS.verbose)
+            if CHECKPOINT and not LOG_FILE.checkpoint:
+                print('Checkpointed entries are not in the new dump; processing the whole log')
+                CHECKPOINT = None
+        if LOG_FILE.has_new_conditions_keys and LAYOUT == 'wide' and \
+                (set(TABULAR_FIELD_SEPARATORS) & set(OUTPUT_FILEPATHS_BY_FORMAT)):
+            print('New entries have data columns the outputs lack; processing the whole log')
+            CHECKPOINT = None
+            LOG_FILE = ZeroLogFile(LOG_FILEPATH, entry_filter=ENTRY_FILTER, schema_registry=SCHEMA_REGISTRY,
+                                   profiler=PROFILER, verbose=CLI_ARGS.verbose)
+        for out_format, out_filepath in OUTPUT_FILEPATHS_BY_FORMAT.items():
+            if CLI_ARGS.split_by == 'segment':
+                with LOG_FILE.profile_stage('write_segments_' + out_format):
+                    LOG_FILE.output_segment_files(BASE_FILEPATH, out_format, omit_units=OMIT_UNITS,
+                                                  suffix=COMPRESSION_SUFFIX, compresslevel=CLI_ARGS.compress_level,
+                                                  max_workers=CLI_ARGS.workers)
+            elif LAYOUT == 'long' and out_format in TABULAR_FIELD_SEPARATORS:
+                with LOG_FILE.profile_stage('write_long_' + out_format):
+                    LOG_FILE.output_to_long_file(out_filepath, out_format, omit_units=OMIT_UNITS,
+                                                 append=bool(CHECKPOINT), compresslevel=CLI_ARGS.compress_level)
+            elif LAYOUT == 'split' and out_format in TABULAR_FIELD_SEPARATORS:
+                with LOG_FILE.profile_stage('write_split_' + out_format):
+                    LOG_FILE.output_split_files(BASE_FILEPATH, out_format, omit_units=OMIT_UNITS,
+                                                suffix=COMPRESSION_SUFFIX, compresslevel=CLI_ARGS.compress_level)
+            else:
+                LOG_FILE.output_to_file(out_filepath, out_format, omit_units=OMIT_UNITS, append=bool(CHECKPOINT),
+                                        compresslevel=CLI_ARGS.compress_level)
+
+    if C_PROFILER:
+        C_PROFILER.disable()
+        C_PROFILER.dump_stats(CLI_ARGS.profile_dump)
+        print('Wrote cProfile stats to: {}'.format(CLI_ARGS.profile_dump))
+    if PROFILER:
+        PROFILER.stop()
+        PROFILER.print_summary()
+        PROFILER.save(CLI_ARGS.profile)
+        print('Wrote profile report to: {}'.format(CLI_ARGS.profile))
+
+    if CLI_ARGS.incremental:
+        ZeroLogCheckpoint.for_log(LOG_FILE, OUTPUT_FILEPATHS, previous=CHECKPOINT).save(CHECKPOINT_FILEPATH)
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+
+"""
+Generate synthetic decoded Zero MBB and BMS logs, for tests and benchmarks.
+
+The logs have the header block, divider and fixed-width entries of real decoded logs.
+MBB logs cycle through key on, riding, key off and charging, with the message families
+that ZeroLogEntry decodes specially: current limits, chassis isolation, module contactors,
+disconnected modules and charge tank readings. BMS logs report charge/discharge levels.
+Output is reproducible for a given seed.
+"""
+
+import random
+from datetime import datetime, timedelta
+from typing import Iterator, Tuple
+
+from extract_ride_data import ZERO_TIMESTAMP_FORMAT, open_log_file
+
+MBB_HEADER_TEMPLATE = '''Zero MBB log
+
+Serial number      2015_mbb_48e0f7_00720
+VIN                538SD9Z37GCG06073
+Firmware rev.      51
+Board rev.         3
+Model              DSR
+
+Printing {count} of {count} log entries..
+
+ Entry    Time of Log            Event                      Conditions
++--------+----------------------+--------------------------+----------------------------------
+'''
+
+BMS_HEADER_TEMPLATE = '''Zero BMS log
+
+BMS serial number  2015_bms_17a0b3_00421
+Pack serial number 2015_pack_00345
+Initial date       May 01 2016 09:12:40
+
+Printing {count} of {count} log entries..
+
+ Entry    Time of Log            Event                      Conditions
++--------+----------------------+--------------------------+----------------------------------
+'''
+
+HEADER_TEMPLATES_BY_SOURCE = {
+    'MBB': MBB_HEADER_TEMPLATE,
+    'BMS': BMS_HEADER_TEMPLATE,
+}
+
+GeneratedEntry = Tuple[datetime, str]
+
+
+def format_entry_line(entry_number: int, timestamp: datetime, message: str) -> str:
+    """Lay out an entry in the fixed-width columns of a decoded log."""
+    return ' {:05d}     {}   {}'.format(entry_number, timestamp.strftime(ZERO_TIMESTAMP_FORMAT), message)
+
+
+def mbb_entries(rng: random.Random, start_time: datetime) -> Iterator[GeneratedEntry]:
+    """Endless MBB events for alternating rides and charges."""
+    now = start_time
+    soc = 90
+    odometer = 46213
+    while True:
+        pack_temp = rng.randint(18, 30)
+        vpack = 90 + soc * 0.25
+        yield now, 'DEBUG: Sevcon Contactor Drive ON.'
+        yield now, 'Module 00 Closing Contactor vmod: {:.3f}V, maxsys: {:.3f}V, minsys: {:.3f}V, diff: 0.000V,' \
+                   ' vcap: {:.3f}V, prechg: {}%'.format(vpack, vpack + 0.02, vpack + 0.02, vpack - 6.4,
+                                                        rng.randint(90, 99))
+        yield now, 'Battery module 0 contactor closed'
+        yield now, 'DEBUG: Module 00 Contactor is now Closed'
+        yield now, 'Key On'
+        for _ in range(rng.randint(20, 200)):
+            now += timedelta(seconds=rng.randint(1, 10))
+            mot_amps = rng.randint(0, 250)
+            mot_temp = rng.randint(30, 95)
+            soc = max(soc - rng.random() * 0.3, 2)
+            vpack = 90 + soc * 0.25
+            yield now, 'Riding                     PackTemp: h {}C, l {}C, PackSOC: {:2d}%, Vpack: {:.3f}V,' \
+                       ' MotAmps: {}, BattAmps: {}, Mods: 10, MotTemp: {}C, CtrlTemp: {}C, AmbTemp: {}C,' \
+                       ' MotRPM: {}, Odo:{:6d}km'.format(pack_temp + 1, pack_temp, int(soc), vpack, mot_amps,
+                                                         mot_amps // 2, mot_temp, mot_temp - 10,
+                                                         rng.randint(10, 30), mot_amps * 20, odometer)
+            family = rng.random()
+            if family < 0.05:
+                yield now, 'Batt Dischg Cur Limited    {} A ({}%), MinCell: {}mV, MaxPackTemp: {}C'.format(
+                    rng.randint(80, 160), rng.random() * 100, rng.randint(3100, 3600), pack_temp + 1)
+            elif family < 0.07:
+                yield now, 'INFO: Low Chassis Isolation {} KOhms to cell {}'.format(
+                    rng.randint(1, 5000), rng.randint(1, 116))
+            elif family < 0.08:
+                yield now, 'Module 1 not connected, PV {}mV, vmod {}mV, Allowed diff {}mV'.format(
+                    rng.randint(100000, 116000), rng.randint(100000, 116000), rng.randint(1000, 9000))
+            pack_temp = min(pack_temp + rng.randint(0, 1), 50)
+            odometer += rng.randint(0, 1)
+        now += timedelta(seconds=rng.randint(5, 60))
+        yield now, 'Disarmed                   PackTemp: h {}C, l {}C, PackSOC: {:2d}%, Vpack: {:.3f}V,' \
+                   ' MotAmps: 0, BattAmps: 0, Mods: 01, MotTemp: 29C, CtrlTemp: 20C, AmbTemp: 22C, MotRPM: 0,' \
+                   ' Odo:{:6d}km'.format(pack_temp, pack_temp, int(soc), vpack, odometer)
+        yield now, 'Key Off'
+        yield now, 'Module 00 Opening Contactor vmod: {:.3f}V, batt curr: 0A'.format(vpack)
+        now += timedelta(minutes=rng.randint(1, 600))
+        yield now, 'External Chg 0 Charger 2 Connected'
+        yield now, 'Module 00 Closing Contactor vmod: {:.3f}V, maxsys: {:.3f}V, minsys: {:.3f}V, diff: 0.000V,' \
+                   ' vcap: {:.3f}V, prechg: {}%'.format(vpack, vpack + 0.02, vpack + 0.02, vpack - 6.4,
+                                                        rng.randint(90, 99))
+        yield now, 'DEBUG: Module scheme changed from Stopped mode to Charging mode'
+        yield now, 'Charger 6 Charging SN:1838032 SW:206 {}Vac  {}Hz EVSE {}A'.format(
+            rng.randint(200, 250), rng.choice([50, 60]), rng.randint(16, 48))
+        while soc < 95:
+            now += timedelta(minutes=10)
+            soc = min(soc + rng.randint(5, 12), 100)
+            vpack = 90 + soc * 0.25
+            yield now, 'Charging                   PackTemp: h {}C, l {}C, PackSOC: {:2d}%, Vpack: {:.3f}V,' \
+                       ' BattAmps: -{}, Mods: 01, MbbChgEn: Yes, BmsChgEn: No'.format(
+                           pack_temp + 1, pack_temp, int(soc), vpack, rng.randint(60, 90))
+        yield now, 'External Chg 0 Charger 2 Disconnected'
+        yield now, 'Module 00 Opening Contactor vmod: {:.3f}V, batt curr: 0A'.format(vpack)
+        if rng.random() < 0.05:
+            yield now, 'ERROR: Charger fault {}'.format(rng.randint(1, 9))
+        if rng.random() < 0.05:
+            yield now, '0x{:02x} 0x{:02x} 0x{:02x}'.format(
+                rng.randint(0, 255), rng.randint(0, 255), rng.randint(0, 255))
+        now += timedelta(minutes=rng.randint(1, 600))
+
+
+def bms_entries(rng: random.Random, start_time: datetime) -> Iterator[GeneratedEntry]:
+    """Endless BMS charge and discharge level snapshots."""
+    now = start_time
+    soc = 90
+    amp_hours = 28
+    while True:
+        discharging = rng.random() < 0.6
+        for _ in range(rng.randint(5, 50)):
+            now += timedelta(minutes=rng.randint(1, 15))
+            soc = max(soc - rng.randint(0, 3), 2) if discharging else min(soc + rng.randint(0, 5), 100)
+            amp_hours = max(1, min(40, amp_hours + (-1 if discharging else 1)))
+            low_cell = 3100 + soc * 9
+            yield now, '{:26} AH: {}, SOC: {:3d}%, I: {}A, L: {}, l: {}, H: {}, B: {:03d}, PT: {}C,' \
+                       ' BT: {}C, PV: {}, M: {}'.format(
+                           'Discharge level' if discharging else 'Charge level', amp_hours, soc,
+                           rng.randint(1, 200) * (1 if discharging else -1), low_cell, low_cell + rng.randint(0, 9),
+                           low_cell + rng.randint(5, 30), rng.randint(0, 40), rng.randint(18, 45),
+                           rng.randint(18, 45), low_cell * 28 + rng.randint(0, 999),
+                           'Running' if discharging else 'Charging')
+        now += timedelta(minutes=rng.randint(1, 600))
+        yield now, 'Contactor was Opened'
+
+
+ENTRY_GENERATORS_BY_SOURCE = {
+    'MBB': mbb_entries,
+    'BMS': bms_entries,
+}
+
+
+def generate_log_lines(source='MBB', entries_count=1000, seed=0,
+                       start_time=datetime(2018, 5, 13, 10, 6, 43)) -> Iterator[str]:
+    """Yield the lines of a synthetic decoded log, header first."""
+    rng = random.Random(seed)
+    yield HEADER_TEMPLATES_BY_SOURCE[source].format(count=entries_count)
+    entries = ENTRY_GENERATORS_BY_SOURCE[source](rng, start_time)
+    for entry_number in range(1, entries_count + 1):
+        timestamp, message = next(entries)
+        yield format_entry_line(entry_number, timestamp, message) + '\n'
+
+
+def write_log(output_filepath: str, source='MBB', entries_count=1000, seed=0) -> str:
+    """Write a synthetic decoded log, compressed if the filepath has a .gz, .bz2 or .xz extension."""
+    with open_log_file(output_filepath, 'w') as output:
+        output.writelines(generate_log_lines(source=source, entries_count=entries_count, seed=seed))
+    return output_filepath
+
+
+if __name__ == "__main__":
+    import argparse
+
+    ARGS_PARSER = argparse.ArgumentParser()
+    ARGS_PARSER.add_argument("outfile",
+                             help="the log file to write (may end in .gz, .bz2 or .xz)")
+    ARGS_PARSER.add_argument("--source", default='MBB', choices=list(HEADER_TEMPLATES_BY_SOURCE),
+                             help="which kind of log to generate")
+    ARGS_PARSER.add_argument("--entries", type=int, default=10000,
+                             help="how many log entries to generate")
+    ARGS_PARSER.add_argument("--seed", type=int, default=0,
+                             help="the random seed; the same seed gives the same log")
+
+    CLI_ARGS = ARGS_PARSER.parse_args()
+    write_log(CLI_ARGS.outfile, source=CLI_ARGS.source, entries_count=CLI_ARGS.entries, seed=CLI_ARGS.seed)
+    print('Generated {} {} log entries in: {}'.format(CLI_ARGS.entries, CLI_ARGS.source, CLI_ARGS.outfile))
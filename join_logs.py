@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+
+"""
+Join decoded logs by timestamp without holding them in memory, for logs too large for JoinedLog.
+
+Each input is decoded one entry at a time. Entries are packed into compact marshal records and
+buffered until the memory budget is used up; the buffer is then sorted by timestamp and spilled
+to a run file in the temp directory. Once every input is spilled, the runs are merged at most
+fan_in at a time, each read sequentially through a share of the memory budget; while there are
+more runs than that, each pass merges groups of them into fewer, longer runs on disk. The last
+pass streams the merged entries into the output writers.
+Entries with the same timestamp keep JoinedLog's order: the primary log first, then each
+secondary log in the order given.
+"""
+
+import os
+import json
+import heapq
+import marshal
+import struct
+import tempfile
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from extract_ride_data import ZeroLogFile, ZeroLogEntry, ZeroLogHeader, ZeroLogFilter, JoinedLog, \
+    TABULAR_FIELD_SEPARATORS, open_log_file
+
+DEFAULT_MEMORY_BUDGET = 64 * 1024 * 1024
+# What a buffered record costs beyond its encoded bytes: its sort key tuple and list slot.
+RECORD_OVERHEAD_BYTES = 160
+# How many runs a merge pass reads at once, each through memory_budget // fan_in bytes of read buffer.
+DEFAULT_MERGE_FAN_IN = 16
+MIN_RUN_READ_BUFFER_SIZE = 4096
+RECORD_LENGTH = struct.Struct('<I')
+EPOCH = datetime(1970, 1, 1)
+# Entries without a timestamp sort first, as they cannot be placed in time.
+NO_TIMESTAMP = float('-inf')
+
+LOG_TAG_LABEL = 'log_tag'
+
+RunKey = Tuple[float, int, int]
+
+
+def entry_record(log_entry: ZeroLogEntry, source_index: int, sequence: int) -> tuple:
+    """Pack an entry into a tuple of plain values, led by its sort key."""
+    timestamp = getattr(log_entry, 'timestamp', None)
+    return ((timestamp - EPOCH).total_seconds() if timestamp else NO_TIMESTAMP, source_index, sequence,
+            log_entry.entry, log_entry.segment_id, log_entry.segment_activity, log_entry.component,
+            log_entry.event_type, log_entry.event_level, log_entry.event, log_entry.conditions)
+
+
+def record_entry(record: tuple, log_tag: Optional[str]) -> ZeroLogEntry:
+    """Unpack a record into an entry for the output writers."""
+    log_entry = ZeroLogEntry.__new__(ZeroLogEntry)
+    seconds, _, _, log_entry.entry, log_entry.segment_id, log_entry.segment_activity, log_entry.component, \
+        log_entry.event_type, log_entry.event_level, log_entry.event, log_entry.conditions = record
+    log_entry.timestamp = EPOCH + timedelta(seconds=seconds) if seconds != NO_TIMESTAMP else None
+    log_entry.log_tag = log_tag
+    return log_entry
+
+
+def record_key(record: tuple) -> RunKey:
+    """The sort key that leads a record."""
+    return record[:3]
+
+
+def write_records(run_filepath: str, encoded_records: Iterable[bytes], buffer_size=-1) -> str:
+    """Write encoded records in order as length-prefixed marshal data."""
+    with open(run_filepath, 'wb', buffering=buffer_size) as run_file:
+        for encoded in encoded_records:
+            run_file.write(RECORD_LENGTH.pack(len(encoded)))
+            run_file.write(encoded)
+    return run_filepath
+
+
+def write_run(run_filepath: str, buffered: List[Tuple[RunKey, bytes]]) -> str:
+    """Sort the buffered records and write them as a run."""
+    buffered.sort(key=lambda keyed_record: keyed_record[0])
+    return write_records(run_filepath, (encoded for _, encoded in buffered))
+
+
+def read_run(run_filepath: str, buffer_size: int) -> Iterator[tuple]:
+    """Read back the records of a run in order, holding one read buffer of it in memory."""
+    with open(run_filepath, 'rb', buffering=buffer_size) as run_file:
+        while True:
+            length_bytes = run_file.read(RECORD_LENGTH.size)
+            if not length_bytes:
+                return
+            yield marshal.loads(run_file.read(RECORD_LENGTH.unpack(length_bytes)[0]))
+
+
+def merge_runs(run_filepaths: List[str], buffer_size: int) -> Iterator[tuple]:
+    """Merge sorted runs into one sequence of records, reading each through its own buffer."""
+    return heapq.merge(*[read_run(run_filepath, buffer_size) for run_filepath in run_filepaths], key=record_key)
+
+
+class ExternalJoin:
+    """Join a primary decoded log with tagged secondary logs by timestamp, spilling sorted runs to disk."""
+    primary_filepath: str
+    secondary_filepaths: Dict[str, str]
+    conditions_keys: List[str]
+    run_filepaths: List[str]
+    merge_passes: int = 0
+
+    def __init__(self, primary_filepath: str, secondary_filepaths: Dict[str, str],
+                 memory_budget=DEFAULT_MEMORY_BUDGET, temp_dir=None, entry_filter: Optional[ZeroLogFilter] = None,
+                 fan_in=DEFAULT_MERGE_FAN_IN):
+        if fan_in < 2:
+            raise ValueError('A merge needs a fan-in of at least 2 runs: {}'.format(fan_in))
+        self.primary_filepath = primary_filepath
+        self.secondary_filepaths = secondary_filepaths
+        self.memory_budget = memory_budget
+        self.temp_dir = temp_dir
+        self.entry_filter = entry_filter
+        self.fan_in = fan_in
+        self.conditions_keys = []
+        self.run_filepaths = []
+
+    @property
+    def log_tags(self) -> List[Optional[str]]:
+        """The tag of each source, by source index; the primary log is untagged, as in JoinedLog."""
+        return [None] + list(self.secondary_filepaths)
+
+    @property
+    def run_buffer_size(self) -> int:
+        """The read buffer of each run in a merge pass, so that a pass stays within the memory budget."""
+        return max(MIN_RUN_READ_BUFFER_SIZE, self.memory_budget // self.fan_in)
+
+    @property
+    def tabular_header_labels(self) -> List[str]:
+        """The tabular output columns, once the runs are spilled."""
+        return ZeroLogFile.common_headers + [LOG_TAG_LABEL] + self.conditions_keys
+
+    def source_entries(self, input_filepath: str, verbose=0) -> Iterator[ZeroLogEntry]:
+        """Decode one input lazily, annotating its segments and applying the filter."""
+        with open_log_file(input_filepath) as log_file:
+            ZeroLogHeader.read_header_lines(log_file)
+            entries = ZeroLogFile.read_entries(log_file, entry_filter=self.entry_filter, verbose=verbose)
+            yield from ZeroLogFile.select_entries(ZeroLogFile.annotate_segments(entries), self.entry_filter)
+
+    def spill_runs(self, run_dir: str, verbose=0) -> List[str]:
+        """Decode every input into sorted runs in the directory, within the memory budget."""
+        buffered = []
+        buffered_bytes = 0
+        conditions_keys = {}
+        self.run_filepaths = []
+        for source_index, input_filepath in enumerate([self.primary_filepath] + list(self.secondary_filepaths.values())):
+            if verbose > 0:
+                print('Spilling entries from: {}'.format(input_filepath))
+            for sequence, log_entry in enumerate(self.source_entries(input_filepath, verbose=verbose)):
+                for key in log_entry.conditions:
+                    conditions_keys.setdefault(key, None)
+                record = entry_record(log_entry, source_index, sequence)
+                encoded = marshal.dumps(record)
+                buffered.append((record[:3], encoded))
+                buffered_bytes += len(encoded) + RECORD_OVERHEAD_BYTES
+                if buffered_bytes >= self.memory_budget:
+                    self.spill(run_dir, buffered)
+                    buffered, buffered_bytes = [], 0
+        if buffered:
+            self.spill(run_dir, buffered)
+        self.conditions_keys = list(conditions_keys)
+        return self.run_filepaths
+
+    def spill(self, run_dir: str, buffered: List[Tuple[RunKey, bytes]]):
+        """Write the buffered records out as the next run."""
+        run_filepath = os.path.join(run_dir, 'run-{:05d}.bin'.format(len(self.run_filepaths)))
+        self.run_filepaths.append(write_run(run_filepath, buffered))
+
+    def cascade_runs(self) -> List[str]:
+        """Merge the spilled runs fan_in at a time into fewer, longer runs, until one last pass can merge them all.
+        Each merged run replaces its inputs, which are removed."""
+        run_filepaths = self.run_filepaths
+        self.merge_passes = 1
+        while len(run_filepaths) > self.fan_in:
+            merged_filepaths = []
+            for group_start in range(0, len(run_filepaths), self.fan_in):
+                group = run_filepaths[group_start:group_start + self.fan_in]
+                if len(group) == 1:
+                    merged_filepaths.extend(group)
+                    continue
+                merged_filepath = os.path.join(os.path.dirname(group[0]), 'run-pass{}-{:05d}.bin'.format(
+                    self.merge_passes, len(merged_filepaths)))
+                write_records(merged_filepath, (marshal.dumps(record)
+                                                for record in merge_runs(group, self.run_buffer_size)),
+                              buffer_size=self.run_buffer_size)
+                for run_filepath in group:
+                    if run_filepath not in self.run_filepaths:
+                        os.remove(run_filepath)
+                merged_filepaths.append(merged_filepath)
+            run_filepaths = merged_filepaths
+            self.merge_passes += 1
+        return run_filepaths
+
+    def merged_entries(self) -> Iterator[ZeroLogEntry]:
+        """Merge the spilled runs into one sequence of entries by timestamp."""
+        log_tags = self.log_tags
+        for record in merge_runs(self.cascade_runs(), self.run_buffer_size):
+            yield record_entry(record, log_tags[record[1]])
+
+    def output_to_file(self, output_filepath: str, output_format: str, omit_units=False, line_sep=os.linesep,
+                       compresslevel=None, verbose=0) -> int:
+        """Join the inputs into a CSV, TSV, JSON or JSONL output. Returns how many entries were emitted."""
+        field_sep = TABULAR_FIELD_SEPARATORS.get(output_format)
+        entries_count = 0
+        with tempfile.TemporaryDirectory(prefix='join_logs-', dir=self.temp_dir) as run_dir:
+            self.spill_runs(run_dir, verbose=verbose)
+            if verbose >= 0:
+                print('Merging {} sorted runs, {} at a time, into {} output: {}'.format(
+                    len(self.run_filepaths), self.fan_in, output_format.upper(), output_filepath))
+            log_headers = self.tabular_header_labels
+            with open_log_file(output_filepath, 'w', compresslevel=compresslevel) as output:
+                if field_sep:
+                    output.write(field_sep.join(log_headers) + line_sep)
+                elif output_format == 'json':
+                    output.write('{"entries": [')
+                for log_entry in self.merged_entries():
+                    if field_sep:
+                        output.write(log_entry.to_csv(log_headers, field_sep=field_sep, omit_units=omit_units)
+                                     + line_sep)
+                    elif output_format == 'json':
+                        output.write((',' if entries_count else '') + line_sep
+                                     + json.dumps(JoinedLog.entry_to_json(log_entry)))
+                    else:
+                        output.write(json.dumps(JoinedLog.entry_to_json(log_entry)) + line_sep)
+                    entries_count += 1
+                if output_format == 'json':
+                    output.write(line_sep + ']}' + line_sep)
+        return entries_count
+
+
+def parse_tagged_filepath(argument: str) -> Tuple[str, str]:
+    """Split a TAG=FILE argument for a secondary log."""
+    log_tag, separator, input_filepath = argument.partition('=')
+    if not separator or not log_tag:
+        raise ValueError('Secondary logs are given as TAG=FILE: {}'.format(argument))
+    return log_tag, input_filepath
+
+
+if __name__ == "__main__":
+    import sys
+    import argparse
+
+    ARGS_PARSER = argparse.ArgumentParser()
+    ARGS_PARSER.add_argument("logfile",
+                             help="the primary parsed log file, e.g. the MBB log")
+    ARGS_PARSER.add_argument("secondary", nargs='+', metavar='TAG=FILE',
+                             help="a secondary parsed log file and the tag its entries get, e.g. bms0=bms0.txt")
+    ARGS_PARSER.add_argument("--format", default='csv',
+                             choices=['csv', 'tsv', 'json', 'jsonl'],
+                             help="the output format desired")
+    ARGS_PARSER.add_argument("--omit-units",
+                             action='store_true', dest='omit_units',
+                             help="omit units from the data values")
+    ARGS_PARSER.add_argument("--memory-budget-mb", type=float, default=DEFAULT_MEMORY_BUDGET / 1024 / 1024,
+                             dest='memory_budget_mb',
+                             help="how much entry data to buffer before spilling a sorted run to disk")
+    ARGS_PARSER.add_argument("--fan-in", type=int, default=DEFAULT_MERGE_FAN_IN, dest='fan_in',
+                             help="how many sorted runs to merge at once; more runs are merged in several passes")
+    ARGS_PARSER.add_argument("--since", type=datetime.fromisoformat,
+                             help="only entries at or after this time (YYYY-MM-DD[ HH:MM:SS])")
+    ARGS_PARSER.add_argument("--until", type=datetime.fromisoformat,
+                             help="only entries at or before this time (YYYY-MM-DD[ HH:MM:SS])")
+    ARGS_PARSER.add_argument("--component", action='append', dest='components',
+                             help="only entries for this component, e.g. Battery; may be repeated")
+    ARGS_PARSER.add_argument("--level", action='append', dest='event_levels',
+                             choices=['INFO', 'DEBUG', 'WARNING', 'ERROR'],
+                             help="only entries with this event level; may be repeated")
+    ARGS_PARSER.add_argument("--temp-dir", dest='temp_dir',
+                             help="where to write sorted runs (default: system temp dir)")
+    ARGS_PARSER.add_argument("--compress-level", type=int, dest='compress_level',
+                             help="the compression level, for outputs named with .gz, .bz2 or .xz")
+    ARGS_PARSER.add_argument("--verbose", "-v",
+                             action='count', default=0,
+                             help="show more processing details")
+    ARGS_PARSER.add_argument("--outfile", required=True,
+                             help="the name of output file to emit")
+
+    CLI_ARGS = ARGS_PARSER.parse_args()
+    try:
+        SECONDARY_FILEPATHS = dict(parse_tagged_filepath(argument) for argument in CLI_ARGS.secondary)
+    except ValueError as error:
+        ARGS_PARSER.error(str(error))
+    for INPUT_FILEPATH in [CLI_ARGS.logfile] + list(SECONDARY_FILEPATHS.values()):
+        if not os.path.exists(INPUT_FILEPATH):
+            print("Log file does not exist: ", INPUT_FILEPATH)
+            sys.exit(1)
+    if CLI_ARGS.fan_in < 2:
+        ARGS_PARSER.error('--fan-in must be at least 2')
+    ENTRY_FILTER = None
+    if CLI_ARGS.since or CLI_ARGS.until or CLI_ARGS.components or CLI_ARGS.event_levels:
+        ENTRY_FILTER = ZeroLogFilter(since=CLI_ARGS.since, until=CLI_ARGS.until, components=CLI_ARGS.components,
+                                     event_levels=CLI_ARGS.event_levels)
+    JOIN = ExternalJoin(CLI_ARGS.logfile, SECONDARY_FILEPATHS,
+                        memory_budget=int(CLI_ARGS.memory_budget_mb * 1024 * 1024), temp_dir=CLI_ARGS.temp_dir,
+                        entry_filter=ENTRY_FILTER, fan_in=CLI_ARGS.fan_in)
+    ENTRIES_COUNT = JOIN.output_to_file(CLI_ARGS.outfile, CLI_ARGS.format, omit_units=CLI_ARGS.omit_units,
+                                        compresslevel=CLI_ARGS.compress_level, verbose=CLI_ARGS.verbose)
+    print('Joined {} entries from {} sorted runs in {} merge passes'.format(
+        ENTRIES_COUNT, len(JOIN.run_filepaths), JOIN.merge_passes))
@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+
+"""
+Merge several decoded log dumps of the same bike into one deduplicated log.
+
+Each dump of the MBB/BMS ring buffer repeats most of the previous dump's entries.
+Dumps are matched by the serial number/VIN in their headers and ordered by their first
+entry. Each dump is then aligned on the last run of entries already emitted, by their
+content and entry number steps, and only the entries after that run are written out.
+Timestamps only break ties between alignments, so entries after a clock reset are kept.
+"""
+
+import os
+import re
+import tempfile
+from collections import deque
+from datetime import datetime
+from typing import List, Dict, Tuple, Optional, Iterator, IO
+
+from extract_ride_data import ZeroLogHeader, ZeroLogEntry, ZeroLogFile, is_log_divider_line, \
+    open_log_file, compression_suffix, entry_signature, ENTRY_COLUMN_WIDTH
+
+# How many of the last emitted entries a dump is aligned on.
+ALIGNMENT_WINDOW = 8
+
+
+def read_raw_header_lines(log_file: IO) -> List[str]:
+    """Read the header lines up to and including the divider, without stripping them."""
+    header_lines = []
+    for line in log_file:
+        header_lines.append(line.rstrip('\r\n'))
+        if is_log_divider_line(line):
+            return header_lines
+    raise ValueError('No log divider line found in: {}'.format(getattr(log_file, 'name', log_file)))
+
+
+def log_identity(header: ZeroLogHeader) -> Tuple[Optional[str], ...]:
+    """Identify which bike (MBB) or pack (BMS) a log was dumped from."""
+    if header.log_source == 'MBB':
+        return 'MBB', header.mbb_metadata.serial_no, header.mbb_metadata.vin
+    if header.log_source == 'BMS':
+        return 'BMS', header.bms_metadata.serial_no, header.bms_metadata.pack_serial_no
+    return header.log_source, header.log_title
+
+
+def renumber_log_line(log_line: str, entry_no: int) -> str:
+    """Replace the entry number column of a decoded log line."""
+    return ' {:05d}'.format(entry_no).ljust(ENTRY_COLUMN_WIDTH) + log_line[ENTRY_COLUMN_WIDTH:]
+
+
+class LogDump:
+    """One decoded log dump file, read lazily."""
+    input_filepath: str
+    header: ZeroLogHeader
+    header_lines: List[str]
+    first_timestamp: Optional[datetime] = None
+    last_timestamp: Optional[datetime] = None
+
+    def __init__(self, input_filepath: str, verbose=0):
+        self.input_filepath = input_filepath
+        with open_log_file(input_filepath) as log_file:
+            self.header_lines = read_raw_header_lines(log_file)
+            first_entry = next(ZeroLogFile.read_entries(log_file, verbose=verbose), None)
+            self.first_timestamp = getattr(first_entry, 'timestamp', None)
+        self.last_timestamp = self.read_last_timestamp(input_filepath)
+        self.header = ZeroLogHeader(self.header_lines, verbose=verbose)
+
+    @property
+    def identity(self) -> Tuple[Optional[str], ...]:
+        """Which bike or pack this dump came from."""
+        return log_identity(self.header)
+
+    @staticmethod
+    def read_last_timestamp(input_filepath: str, tail_size=4096) -> Optional[datetime]:
+        """Find the latest entry timestamp by reading only the end of the file.
+        Compressed files cannot be read from the end, so they are streamed through instead."""
+        if compression_suffix(input_filepath):
+            with open_log_file(input_filepath) as log_file:
+                tail_lines = deque(log_file, maxlen=16)
+        else:
+            with open(input_filepath, 'rb') as log_file:
+                log_file.seek(max(0, os.path.getsize(input_filepath) - tail_size))
+                tail_lines = log_file.read().decode('utf-8', errors='replace').splitlines()
+        for line in reversed(tail_lines):
+            timestamp = decode_line_timestamp(line)
+            if timestamp is not None:
+                return timestamp
+        return None
+
+    @property
+    def sort_key(self):
+        """Dumps are merged oldest first, by their earliest and then latest entries, then by how many they hold."""
+        return (self.first_timestamp or datetime.min), (self.last_timestamp or datetime.min), \
+            self.header.log_entries_count_expected or 0
+
+    def read_lines(self) -> Iterator[Tuple[int, str]]:
+        """Yield each entry line with its source entry number, unwrapped into a rising sequence."""
+        with open_log_file(self.input_filepath) as log_file:
+            read_raw_header_lines(log_file)
+            entry_lines = (line.rstrip('\r\n') for line in log_file if line and len(line) > 5)
+            wrap_offset = 0
+            previous_number = 0
+            for line in entry_lines:
+                entry_no = self.entry_number(line)
+                if entry_no is None:
+                    entry_no = previous_number - wrap_offset
+                elif entry_no + wrap_offset < previous_number:
+                    wrap_offset = previous_number - entry_no + 1
+                previous_number = entry_no + wrap_offset
+                yield previous_number, line
+
+    @staticmethod
+    def entry_number(log_line: str) -> Optional[int]:
+        """The entry number of a decoded log line, if it has one."""
+        try:
+            return int(log_line[:ENTRY_COLUMN_WIDTH].strip())
+        except ValueError:
+            return None
+
+
+def group_dumps_by_identity(input_filepaths: List[str], verbose=0) -> Dict[Tuple, List[LogDump]]:
+    """Group dump files by the bike or pack they came from, each group oldest first."""
+    groups = {}
+    for input_filepath in input_filepaths:
+        dump = LogDump(input_filepath, verbose=verbose)
+        groups.setdefault(dump.identity, []).append(dump)
+    for dumps in groups.values():
+        dumps.sort(key=lambda dump: dump.sort_key)
+    return groups
+
+
+class LogMerger:
+    """Stream the entries of overlapping dumps of one bike, skipping repeated entries.
+
+    The merge keeps only the signatures and entry number steps of the last few emitted
+    entries, so memory stays constant. Each dump is read twice: once to find where that
+    run of entries ends in it, and once to stream the entries after it.
+    """
+    last_timestamp: Optional[datetime] = None
+    emitted_tail: deque
+    entries_emitted: int = 0
+    entries_skipped: int = 0
+
+    def __init__(self, dumps: List[LogDump], verbose=0):
+        if len({dump.identity for dump in dumps}) > 1:
+            raise ValueError('Cannot merge dumps from different sources: {}'.format(
+                ', '.join(dump.input_filepath for dump in dumps)))
+        self.dumps = dumps
+        self.verbose = verbose
+        # (signature, entry number step from the previous entry of its dump) of the last emitted entries.
+        self.emitted_tail = deque(maxlen=ALIGNMENT_WINDOW)
+
+    @property
+    def header(self) -> Optional[ZeroLogHeader]:
+        """The header of the latest dump describes the merged log."""
+        return self.dumps[-1].header if self.dumps else None
+
+    def merged_lines(self) -> Iterator[str]:
+        """Yield each distinct entry line across all dumps, renumbered in sequence."""
+        for dump in self.dumps:
+            if self.verbose > 0:
+                print('Merging entries from: {}'.format(dump.input_filepath))
+            for line in self.new_lines_of_dump(dump):
+                self.entries_emitted += 1
+                yield renumber_log_line(line, self.entries_emitted)
+
+    def new_lines_of_dump(self, dump: LogDump) -> Iterator[str]:
+        """Skip the lines of the dump that overlap what was already emitted."""
+        overlap_count = self.overlap_count(dump)
+        first_new_entry_no = None
+        for index, (entry_no, step, line) in enumerate(entry_steps(dump)):
+            if index < overlap_count:
+                self.entries_skipped += 1
+                continue
+            if first_new_entry_no is None:
+                first_new_entry_no = entry_no
+            self.note_emitted(line, step)
+            yield line
+        if self.verbose > 0:
+            print('New entries start at entry #{} of {}'.format(first_new_entry_no, dump.input_filepath))
+
+    def overlap_count(self, dump: LogDump) -> int:
+        """How many leading lines of the dump were already emitted: those up to the end of the last emitted
+        entries, found by their signatures and entry number steps. If they end in several places, the first
+        one followed by an entry no older than the last emitted entry wins, then the first one at all."""
+        tail = list(self.emitted_tail)
+        if not tail:
+            return 0
+        window = deque(maxlen=len(tail))
+        first_match = candidate = None
+        for index, (_, step, line) in enumerate(entry_steps(dump)):
+            if candidate is not None:
+                timestamp = decode_line_timestamp(line)
+                if timestamp is None or self.last_timestamp is None or timestamp >= self.last_timestamp:
+                    return candidate
+                candidate = None
+            window.append((entry_signature(line), step))
+            if matches_tail(window, tail):
+                candidate = index + 1
+                if first_match is None:
+                    first_match = candidate
+        if candidate is not None:
+            return candidate
+        return first_match or 0
+
+    def note_emitted(self, line: str, step: Optional[int]):
+        """Track the last entries emitted, and the time of the last one."""
+        self.emitted_tail.append((entry_signature(line), step))
+        timestamp = decode_line_timestamp(line)
+        if timestamp is not None:
+            self.last_timestamp = timestamp
+
+    def output_to_file(self, output_filepath: str, line_sep=os.linesep, compresslevel=None):
+        """Write the merged log in the same decoded text format as its inputs.
+        A .gz, .bz2 or .xz extension compresses the output."""
+        output_dir = os.path.dirname(os.path.abspath(output_filepath))
+        with tempfile.TemporaryFile('w+', dir=output_dir) as entries_file:
+            for line in self.merged_lines():
+                entries_file.write(line + line_sep)
+            entries_file.seek(0)
+            with open_log_file(output_filepath, 'w', compresslevel=compresslevel) as output:
+                for line in self.header_lines_for_count(self.entries_emitted):
+                    output.write(line + line_sep)
+                for line in entries_file:
+                    output.write(line)
+
+    def header_lines_for_count(self, entries_count: int) -> List[str]:
+        """Header lines of the latest dump, with the entry count of the merged log."""
+        return [re.sub(r"Printing \d+ of \d+", 'Printing {0} of {0}'.format(entries_count), line)
+                for line in self.dumps[-1].header_lines]
+
+
+def entry_steps(dump: LogDump) -> Iterator[Tuple[int, Optional[int], str]]:
+    """Yield each entry line of a dump with its entry number and the step from the previous one."""
+    previous_entry_no = None
+    for entry_no, line in dump.read_lines():
+        yield entry_no, (entry_no - previous_entry_no if previous_entry_no is not None else None), line
+        previous_entry_no = entry_no
+
+
+def matches_tail(window: deque, tail: List[Tuple[str, Optional[int]]]) -> bool:
+    """Whether the latest entries of a dump are the last emitted ones. The window is shorter than the tail
+    only at the start of a dump, which may begin partway through the emitted entries. The step into the
+    first entry of the window leads from an entry outside of it, so is not compared."""
+    for offset, ((signature, step), (tail_signature, tail_step)) in enumerate(zip(window, tail[-len(window):])):
+        if signature != tail_signature:
+            return False
+        if offset and step is not None and tail_step is not None and step != tail_step:
+            return False
+    return True
+
+
+def decode_line_timestamp(log_line: str) -> Optional[datetime]:
+    """Decode the timestamp column of a decoded log line, if it has a valid one."""
+    timestamp_text = log_line[10:32].strip()
+    if not timestamp_text:
+        return None
+    try:
+        return ZeroLogEntry.decode_timestamp(timestamp_text)
+    except ValueError:
+        return None
+
+
+def merged_output_filepath(identity: Tuple, output_dir: str) -> str:
+    """Name the merged log after the source and serial number it came from."""
+    name = '_'.join(re.sub(r"[^A-Za-z0-9_.-]", '_', part) for part in identity[:2] if part)
+    return os.path.join(output_dir, '{}_merged.txt'.format(name))
+
+
+if __name__ == "__main__":
+    import sys
+    import argparse
+
+    ARGS_PARSER = argparse.ArgumentParser()
+    ARGS_PARSER.add_argument("logfiles", nargs='+',
+                             help="the parsed log dumps to merge")
+    ARGS_PARSER.add_argument("--outfile",
+                             help="the merged log file to emit, when all dumps are of one bike")
+    ARGS_PARSER.add_argument("--outdir", default='.',
+                             help="where to emit one merged log per bike otherwise")
+    ARGS_PARSER.add_argument("--verbose", "-v",
+                             action='count', default=0,
+                             help="show more processing details")
+
+    CLI_ARGS = ARGS_PARSER.parse_args()
+    for LOG_FILEPATH in CLI_ARGS.logfiles:
+        if not os.path.exists(LOG_FILEPATH):
+            print("Log file does not exist: ", LOG_FILEPATH)
+            sys.exit(1)
+    DUMP_GROUPS = group_dumps_by_identity(CLI_ARGS.logfiles, verbose=CLI_ARGS.verbose)
+    if CLI_ARGS.outfile and len(DUMP_GROUPS) > 1:
+        print("Log dumps come from {} different sources; use --outdir instead".format(len(DUMP_GROUPS)))
+        sys.exit(1)
+    for IDENTITY, DUMPS in DUMP_GROUPS.items():
+        OUTPUT_FILEPATH = CLI_ARGS.outfile or merged_output_filepath(IDENTITY, CLI_ARGS.outdir)
+        MERGER = LogMerger(DUMPS, verbose=CLI_ARGS.verbose)
+        MERGER.output_to_file(OUTPUT_FILEPATH)
+        print('Merged {} dumps into {} entries ({} repeated entries skipped): {}'.format(
+            len(DUMPS), MERGER.entries_emitted, MERGER.entries_skipped, OUTPUT_FILEPATH))
@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+
+"""
+Track battery pack health across many log dumps of the same pack.
+
+Each dump is turned into typed, unit-normalized columns (see query_logs.LogColumns), from
+which charge cycles are found: charging segments of MBB logs, with the contactor closing
+just before them, and runs of BMS 'Charge level' snapshots. For each cycle, column
+operations over its rows give the cell imbalance (the highest module voltage difference,
+or BMS high cell minus low cell), the pack temperature spread, the lowest cell voltage and
+the state of charge it went from and to. Module voltages at each contactor closing and opening
+are kept as a series per module.
+
+The results are kept per pack in a compact, column-oriented JSON file. Adding a dump only
+parses that dump. Cycles seen in several overlapping dumps are kept once: a dump whose ring
+buffer starts or ends partway through a charge sees only part of that cycle, so of cycles that
+overlap in time, the one spanning the longest is kept. Linear trends of each metric per cycle
+are recomputed from the stored cycles.
+"""
+
+import os
+import re
+import json
+import math
+import operator
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from extract_ride_data import ZeroLogFile, ZeroLogHeader, open_log_file
+from query_logs import LogColumns, TIMESTAMP_COLUMN, EPOCH
+
+CYCLE_METRICS = ['end', 'soc_start', 'soc_end', 'imbalance_mv', 'temp_spread_c', 'min_cell_mv', 'max_pack_temp_c']
+TREND_METRICS = ['imbalance_mv', 'temp_spread_c', 'min_cell_mv']
+
+
+def pack_identity(header: ZeroLogHeader) -> str:
+    """Name the pack a log came from: the bike's VIN for MBB logs, or the pack serial number for BMS logs."""
+    if header.log_source == 'MBB':
+        identity = header.mbb_metadata.vin or header.mbb_metadata.serial_no
+    elif header.log_source == 'BMS':
+        identity = header.bms_metadata.pack_serial_no or header.bms_metadata.serial_no
+    else:
+        identity = header.log_title
+    return re.sub(r"[^A-Za-z0-9_-]+", '_', identity or 'unknown')
+
+
+def timestamp_text(seconds: float) -> Optional[str]:
+    """A column timestamp as text, or None if missing."""
+    return None if math.isnan(seconds) else str(EPOCH + timedelta(seconds=float(seconds)))
+
+
+def charge_cycles(columns: LogColumns) -> List[List[int]]:
+    """The row numbers of each charge cycle, in log order."""
+    backend = columns.backend
+    if 'M' in columns.values:
+        # BMS logs tell the mode of each 'Charge level' snapshot; other events in between do not end a charge.
+        modes = columns.values['M']
+        charging = backend.compare(operator.eq, modes, 'Charging')
+        snapshots = backend.indexes(backend.logical_not(backend.is_in(modes, [None])), 0)
+    else:
+        charging = backend.compare(operator.eq, columns.values['segment_activity'], 'CHARGING')
+        snapshots = range(columns.length)
+    cycles = []
+    previous_charging = False
+    for index in snapshots:
+        index = int(index)
+        if charging[index]:
+            if previous_charging:
+                cycles[-1].append(index)
+            else:
+                cycles.append([index])
+        previous_charging = charging[index]
+    segment_activities = columns.values['segment_activity']
+    for cycle in cycles:
+        # Include the contactor closing that started an MBB charge, where the module voltages were compared.
+        while cycle[0] > 0 and segment_activities[cycle[0] - 1] == 'STARTED':
+            cycle.insert(0, cycle[0] - 1)
+    return cycles
+
+
+def first_present(values) -> Optional[float]:
+    """The first number that is not missing."""
+    return next((float(value) for value in values if not math.isnan(value)), None)
+
+
+def cycle_metrics(columns: LogColumns, indexes: List[int]) -> Dict[str, Any]:
+    """Measure one charge cycle from its rows."""
+    backend = columns.backend
+
+    def column(name):
+        values = columns.values.get(name)
+        return backend.take(values, indexes) if values is not None else None
+
+    def extreme(function, *candidates):
+        results = [backend.aggregate(function, values) for values in candidates if values is not None]
+        results = [result for result in results if result is not None]
+        if not results:
+            return None
+        return min(results) if function == 'min' else max(results)
+
+    timestamps = column(TIMESTAMP_COLUMN)
+    soc = column('PackSOC') if 'PackSOC' in columns.values else column('SOC')
+    diff_v = column('diff')
+    high_cell, low_cell = column('H'), column('L')
+    temp_high, temp_low = column('PackTemp (h)'), column('PackTemp (l)')
+    return {
+        'start': timestamp_text(timestamps[0]),
+        'end': timestamp_text(timestamps[-1]),
+        'soc_start': first_present(soc) if soc is not None else None,
+        'soc_end': first_present(reversed(soc)) if soc is not None else None,
+        'imbalance_mv': extreme('max',
+                                backend.arithmetic(operator.mul, diff_v, 1000.0) if diff_v is not None else None,
+                                backend.arithmetic(operator.sub, high_cell, low_cell)
+                                if high_cell is not None and low_cell is not None else None),
+        'temp_spread_c': extreme('max', backend.arithmetic(operator.sub, temp_high, temp_low)
+                                 if temp_high is not None and temp_low is not None else None),
+        'min_cell_mv': extreme('min', column('MinCell'), low_cell),
+        'max_pack_temp_c': extreme('max', temp_high, column('PT')),
+    }
+
+
+def module_voltages(columns: LogColumns) -> Dict[str, Dict[str, float]]:
+    """The voltage of each module at each contactor closing or opening, by module number and time."""
+    if 'Module' not in columns.values or 'vmod' not in columns.values:
+        return {}
+    backend = columns.backend
+    # NaN, a missing number, is not equal to itself.
+    present = backend.logical_and(backend.compare(operator.eq, columns.values['Module'], columns.values['Module']),
+                                  backend.compare(operator.eq, columns.values['vmod'], columns.values['vmod']))
+    series = {}
+    for index in backend.indexes(present, 0):
+        timestamp = timestamp_text(columns.values[TIMESTAMP_COLUMN][index])
+        if timestamp is not None:
+            module = str(int(columns.values['Module'][index]))
+            series.setdefault(module, {})[timestamp] = float(columns.values['vmod'][index])
+    return series
+
+
+def cycle_seconds(start: str, end: Optional[str]) -> float:
+    """How long a cycle, by its start and end timestamp text, lasted."""
+    return (datetime.fromisoformat(end) - datetime.fromisoformat(start)).total_seconds() if end else 0.0
+
+
+def linear_trend(values: List[Optional[float]]) -> Optional[float]:
+    """The least-squares slope of the values per cycle, skipping missing values."""
+    points = [(cycle, value) for cycle, value in enumerate(values) if value is not None]
+    if len(points) < 2:
+        return None
+    mean_x = sum(x for x, _ in points) / len(points)
+    mean_y = sum(y for _, y in points) / len(points)
+    spread = sum((x - mean_x) ** 2 for x, _ in points)
+    return sum((x - mean_x) * (y - mean_y) for x, y in points) / spread
+
+
+class PackHealth:
+    """The charge cycles and module voltages of one pack, gathered from its log dumps."""
+    identity: str
+    dumps: Dict[str, Tuple[int, float]]
+    cycles: Dict[str, Dict[str, Any]]
+    # The starts of the cycles in order. Kept cycles never overlap, so their ends are in order too.
+    cycle_starts: List[str]
+    modules: Dict[str, Dict[str, float]]
+
+    def __init__(self, identity: str):
+        self.identity = identity
+        self.dumps = {}
+        self.cycles = {}
+        self.cycle_starts = []
+        self.modules = {}
+
+    @staticmethod
+    def filepath_for(output_dir: str, identity: str) -> str:
+        """Where the health of a pack is kept."""
+        return os.path.join(output_dir, identity + '.pack-health.json')
+
+    @classmethod
+    def load(cls, health_filepath: str, identity: str) -> 'PackHealth':
+        """Read the kept health of a pack, or start afresh if there is none."""
+        pack_health = cls(identity)
+        if os.path.exists(health_filepath):
+            with open(health_filepath) as health_file:
+                pack_health.from_json(json.load(health_file))
+        return pack_health
+
+    def save(self, health_filepath: str):
+        """Write the health of the pack as compact JSON."""
+        with open(health_filepath, 'w') as health_file:
+            json.dump(self.to_json(), health_file, separators=(',', ':'))
+
+    def is_added(self, log_filepath: str) -> bool:
+        """Whether this version of the dump was already added."""
+        stat = os.stat(log_filepath)
+        return self.dumps.get(os.path.abspath(log_filepath)) == (stat.st_size, stat.st_mtime)
+
+    def add_log(self, log_file: ZeroLogFile) -> int:
+        """Add the cycles and module voltages of a parsed dump. Returns how many cycles it had."""
+        columns = LogColumns.from_log_file(log_file)
+        cycles = charge_cycles(columns)
+        for indexes in cycles:
+            metrics = cycle_metrics(columns, indexes)
+            start = metrics.pop('start')
+            if start is not None:
+                self.add_cycle(start, metrics)
+        for module, voltages in module_voltages(columns).items():
+            self.modules.setdefault(module, {}).update(voltages)
+        stat = os.stat(log_file.input_filepath)
+        self.dumps[os.path.abspath(log_file.input_filepath)] = (stat.st_size, stat.st_mtime)
+        return len(cycles)
+
+    def add_cycle(self, start: str, metrics: Dict[str, Any]):
+        """Keep a cycle in place of the cycles it overlaps, unless one of those spans longer.
+        At an equal span, a later dump replaces the earlier one, as it may have seen more of a cycle in progress."""
+        end = metrics['end'] or start
+        # The cycles starting within this one, and the one before them if it ends within it.
+        first = bisect_left(self.cycle_starts, start)
+        last = bisect_right(self.cycle_starts, end)
+        if first > 0 and start <= self.cycle_end(self.cycle_starts[first - 1]):
+            first -= 1
+        overlapping = self.cycle_starts[first:last]
+        seconds = cycle_seconds(start, metrics['end'])
+        if any(cycle_seconds(other_start, self.cycles[other_start]['end']) > seconds for other_start in overlapping):
+            return
+        for other_start in overlapping:
+            del self.cycles[other_start]
+        self.cycle_starts[first:last] = [start]
+        self.cycles[start] = metrics
+
+    def cycle_end(self, start: str) -> str:
+        """The end of a kept cycle, or its start if it has no end."""
+        return self.cycles[start]['end'] or start
+
+    def trends(self) -> Dict[str, Optional[float]]:
+        """The change of each trend metric per charge cycle."""
+        return {metric: linear_trend([self.cycles[start][metric] for start in self.cycle_starts])
+                for metric in TREND_METRICS}
+
+    def to_json(self) -> Dict[str, Any]:
+        """Convert to a column-oriented JSON-serializable data structure."""
+        cycles = {'start': list(self.cycle_starts)}
+        cycles.update({metric: [self.cycles[start][metric] for start in self.cycle_starts] for metric in CYCLE_METRICS})
+        return {
+            'pack': self.identity,
+            'dumps': {path: list(signature) for path, signature in sorted(self.dumps.items())},
+            'cycles': cycles,
+            'trends': self.trends(),
+            'modules': {module: {'timestamp': sorted(voltages), 'vmod': [voltages[t] for t in sorted(voltages)]}
+                        for module, voltages in sorted(self.modules.items(), key=lambda item: int(item[0]))},
+        }
+
+    def from_json(self, health_json: Dict[str, Any]):
+        """Restore the state kept by to_json."""
+        self.dumps = {path: tuple(signature) for path, signature in health_json['dumps'].items()}
+        cycles = health_json['cycles']
+        self.cycles = {start: {metric: cycles[metric][index] for metric in CYCLE_METRICS}
+                       for index, start in enumerate(cycles['start'])}
+        self.cycle_starts = sorted(self.cycles)
+        self.modules = {module: dict(zip(series['timestamp'], series['vmod']))
+                        for module, series in health_json['modules'].items()}
+
+
+def update_pack_health(log_filepaths: List[str], output_dir: str, verbose=0) -> Dict[str, PackHealth]:
+    """Add new or changed dumps to the kept health of their packs, and save it. Returns the updated packs."""
+    updated = {}
+    for log_filepath in log_filepaths:
+        with open_log_file(log_filepath) as log_file:
+            identity = pack_identity(ZeroLogHeader(ZeroLogHeader.read_header_lines(log_file)))
+        pack_health = updated.get(identity) or PackHealth.load(PackHealth.filepath_for(output_dir, identity), identity)
+        if pack_health.is_added(log_filepath):
+            continue
+        cycles_count = pack_health.add_log(ZeroLogFile(log_filepath, verbose=-1))
+        if verbose > 0:
+            print('Added {} charge cycles from: {}'.format(cycles_count, log_filepath))
+        updated[identity] = pack_health
+    for identity, pack_health in updated.items():
+        pack_health.save(PackHealth.filepath_for(output_dir, identity))
+    return updated
+
+
+if __name__ == "__main__":
+    import argparse
+
+    ARGS_PARSER = argparse.ArgumentParser()
+    ARGS_PARSER.add_argument("logfiles", nargs='+',
+                             help="parsed MBB or BMS log dumps (may be .gz, .bz2 or .xz compressed)")
+    ARGS_PARSER.add_argument("--outdir", default='.',
+                             help="where the health of each pack is kept, as <pack>.pack-health.json")
+    ARGS_PARSER.add_argument("--verbose", "-v",
+                             action='count', default=0,
+                             help="show more processing details")
+
+    CLI_ARGS = ARGS_PARSER.parse_args()
+    UPDATED = update_pack_health(CLI_ARGS.logfiles, CLI_ARGS.outdir, verbose=CLI_ARGS.verbose)
+    for IDENTITY, PACK_HEALTH in UPDATED.items():
+        TRENDS = PACK_HEALTH.trends()
+        print('{}: {} charge cycles; per cycle: imbalance {} mV, temperature spread {} C, min cell {} mV'.format(
+            IDENTITY, len(PACK_HEALTH.cycles),
+            *('{:+.3f}'.format(TRENDS[metric]) if TRENDS[metric] is not None else 'n/a' for metric in TREND_METRICS)))
+    if not UPDATED:
+        print('No new or changed dumps')
@@ -0,0 +1,634 @@
+#!/usr/bin/env python3
+
+"""
+Filter and aggregate parsed logs with small expressions, like: PackSOC < 20 and component == 'MBB' and MotTemp > 80
+
+A log is turned into typed columns in one pass over its entries. Condition values are parsed
+by the condition schema registry, so numbers lose their units and are converted to the unit
+registered for their key. An expression is parsed with Python's ast module, restricted to
+comparisons, boolean logic, arithmetic, 'in' with literal lists, column names and literals.
+It is compiled to column operations evaluated a batch of rows at a time, over NumPy arrays
+when NumPy is installed and over the standard library's typed arrays otherwise.
+
+Conditions whose keys are not identifiers are named with col('PackTemp (h)'). Timestamps compare
+against text like '2018-05-13 10:00'. A missing value never satisfies a comparison, except !=.
+"""
+
+import ast
+import csv
+import sys
+import json
+import math
+import argparse
+import operator
+from array import array
+from datetime import datetime, timedelta
+from itertools import repeat
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from extract_ride_data import Log, ZeroLogFile, ZeroLogEntry, TIMESTAMP_LABEL, TYPED_NUMBER_LABELS, typed_entry_columns
+from condition_schema import ConditionSchema, MBB_CONDITION_TYPES, NUMBER, TEXT
+
+try:
+    import numpy
+except ImportError:  # The standard library's typed arrays stand in.
+    numpy = None
+
+BOOLEAN = 'boolean'
+
+NUMBER_COLUMNS = TYPED_NUMBER_LABELS
+# The timestamp column, which is also the name of its kind in typed columns.
+TIMESTAMP_COLUMN = TIMESTAMP_LABEL
+EPOCH = datetime(1970, 1, 1)
+DEFAULT_BATCH_SIZE = 65536
+
+COMPARISONS = {
+    ast.Eq: operator.eq,
+    ast.NotEq: operator.ne,
+    ast.Lt: operator.lt,
+    ast.LtE: operator.le,
+    ast.Gt: operator.gt,
+    ast.GtE: operator.ge,
+}
+ORDERINGS = (ast.Lt, ast.LtE, ast.Gt, ast.GtE)
+
+ARITHMETIC = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+}
+
+AGGREGATES = ['count', 'sum', 'mean', 'min', 'max']
+
+Evaluator = Callable[[Dict[str, Any], 'ArrayBackend'], Any]
+
+
+class ArrayBackend:
+    """Column operations over array('d') numbers and lists of text, one element at a time."""
+    name = 'array'
+
+    @staticmethod
+    def numbers(values) -> array:
+        """A number column."""
+        return array('d', values)
+
+    @staticmethod
+    def texts(values: List[Optional[str]]) -> list:
+        """A text column."""
+        return values
+
+    @staticmethod
+    def is_column(value) -> bool:
+        """Whether an operand is a column rather than a literal."""
+        return isinstance(value, (array, list))
+
+    @classmethod
+    def pairs(cls, left, right):
+        """Iterate over two operands together, repeating literals alongside columns."""
+        return zip(left if cls.is_column(left) else repeat(left), right if cls.is_column(right) else repeat(right))
+
+    @staticmethod
+    def full_mask(value: bool, length: int) -> list:
+        """A mask of the same value for each row."""
+        return [value] * length
+
+    @classmethod
+    def compare(cls, compare_op, left, right) -> list:
+        """Compare elementwise."""
+        return [compare_op(left_value, right_value) if left_value is not None and right_value is not None
+                else compare_op is operator.ne
+                for left_value, right_value in cls.pairs(left, right)]
+
+    @classmethod
+    def arithmetic(cls, arithmetic_op, left, right) -> array:
+        """Combine number operands elementwise; division by zero gives NaN."""
+        if arithmetic_op is operator.truediv:
+            return array('d', (left_value / right_value if right_value else math.nan
+                               for left_value, right_value in cls.pairs(left, right)))
+        return array('d', (arithmetic_op(left_value, right_value) for left_value, right_value in cls.pairs(left, right)))
+
+    @staticmethod
+    def negate(values) -> array:
+        """Negate a number operand."""
+        return array('d', (-value for value in values))
+
+    @staticmethod
+    def is_in(values, choices) -> list:
+        """Whether each value is one of the choices."""
+        choices = set(choices)
+        return [value in choices for value in values]
+
+    @staticmethod
+    def logical_and(left, right) -> list:
+        """Combine masks with and."""
+        return [left_value and right_value for left_value, right_value in zip(left, right)]
+
+    @staticmethod
+    def logical_or(left, right) -> list:
+        """Combine masks with or."""
+        return [left_value or right_value for left_value, right_value in zip(left, right)]
+
+    @staticmethod
+    def logical_not(values) -> list:
+        """Invert a mask."""
+        return [not value for value in values]
+
+    @staticmethod
+    def indexes(mask, offset: int) -> List[int]:
+        """The row numbers where the mask is true."""
+        return [index for index, selected in enumerate(mask, offset) if selected]
+
+    @staticmethod
+    def take(values, indexes: List[int]) -> list:
+        """The values at the row numbers."""
+        return [values[index] for index in indexes]
+
+    @staticmethod
+    def aggregate(function: str, values) -> Optional[float]:
+        """Aggregate numbers, skipping missing ones."""
+        present = [value for value in values if not math.isnan(value)]
+        if function == 'count':
+            return len(present)
+        if not present:
+            return None
+        if function == 'sum':
+            return math.fsum(present)
+        if function == 'mean':
+            return math.fsum(present) / len(present)
+        return min(present) if function == 'min' else max(present)
+
+
+class NumpyBackend(ArrayBackend):
+    """Column operations over NumPy arrays, a whole batch at a time."""
+    name = 'numpy'
+
+    @staticmethod
+    def numbers(values) -> 'numpy.ndarray':
+        return numpy.array(values, dtype=numpy.float64)
+
+    @staticmethod
+    def texts(values: List[Optional[str]]) -> 'numpy.ndarray':
+        return numpy.array(values, dtype=object)
+
+    @staticmethod
+    def is_column(value) -> bool:
+        return isinstance(value, numpy.ndarray)
+
+    @staticmethod
+    def full_mask(value: bool, length: int) -> 'numpy.ndarray':
+        return numpy.full(length, value, dtype=bool)
+
+    @classmethod
+    def compare(cls, compare_op, left, right) -> 'numpy.ndarray':
+        return numpy.asarray(compare_op(left, right), dtype=bool)
+
+    @classmethod
+    def arithmetic(cls, arithmetic_op, left, right) -> 'numpy.ndarray':
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            result = arithmetic_op(left, right)
+        if arithmetic_op is operator.truediv:
+            result[numpy.isinf(result)] = numpy.nan
+        return result
+
+    @staticmethod
+    def negate(values) -> 'numpy.ndarray':
+        return -values
+
+    @staticmethod
+    def is_in(values, choices) -> 'numpy.ndarray':
+        if values.dtype == object:  # Missing text is None, which cannot be sorted against text by isin.
+            choices = set(choices)
+            return numpy.fromiter((value in choices for value in values), dtype=bool, count=len(values))
+        return numpy.isin(values, numpy.array(choices, dtype=values.dtype))
+
+    @staticmethod
+    def logical_and(left, right) -> 'numpy.ndarray':
+        return left & right
+
+    @staticmethod
+    def logical_or(left, right) -> 'numpy.ndarray':
+        return left | right
+
+    @staticmethod
+    def logical_not(values) -> 'numpy.ndarray':
+        return ~values
+
+    @staticmethod
+    def indexes(mask, offset: int) -> 'numpy.ndarray':
+        return numpy.flatnonzero(mask) + offset
+
+    @staticmethod
+    def take(values, indexes) -> 'numpy.ndarray':
+        return values[indexes]
+
+    @staticmethod
+    def aggregate(function: str, values) -> Optional[float]:
+        present = values[~numpy.isnan(values)]
+        if function == 'count':
+            return int(present.size)
+        if not present.size:
+            return None
+        return float({'sum': numpy.sum, 'mean': numpy.mean, 'min': numpy.min, 'max': numpy.max}[function](present))
+
+
+def default_backend() -> ArrayBackend:
+    """NumPy when it is installed, typed arrays otherwise."""
+    return NumpyBackend() if numpy is not None else ArrayBackend()
+
+
+class LogColumns:
+    """The entries of a log as typed columns: numbers, text, and timestamps in seconds since the epoch."""
+    kinds: Dict[str, str]
+    values: Dict[str, Any]
+    length: int
+
+    def __init__(self, kinds: Dict[str, str], values: Dict[str, Any], length: int, backend: ArrayBackend):
+        self.kinds = kinds
+        self.values = values
+        self.length = length
+        self.backend = backend
+
+    @classmethod
+    def from_typed_columns(cls, kinds: Dict[str, str], values: Dict[str, list],
+                           backend: Optional[ArrayBackend] = None) -> 'LogColumns':
+        """Hold typed columns in the backend's arrays."""
+        backend = backend or default_backend()
+        columns = {name: backend.texts(values[name]) if kind == TEXT else backend.numbers(values[name])
+                   for name, kind in kinds.items()}
+        return cls(kinds, columns, len(values[TIMESTAMP_COLUMN]), backend)
+
+    @classmethod
+    def from_entries(cls, entries: List[ZeroLogEntry], condition_schema: Optional[ConditionSchema] = None,
+                     backend: Optional[ArrayBackend] = None) -> 'LogColumns':
+        """Build the columns in one pass over the entries, parsing condition values as their registered type."""
+        kinds, values = typed_entry_columns(entries, condition_schema or ConditionSchema(MBB_CONDITION_TYPES))
+        return cls.from_typed_columns(kinds, values, backend=backend)
+
+    @classmethod
+    def from_log_file(cls, log_file: Log, backend: Optional[ArrayBackend] = None) -> 'LogColumns':
+        """Build the columns of a parsed or joined log, with the condition schema of each kind of log."""
+        kinds, values = log_file.typed_columns()
+        return cls.from_typed_columns(kinds, values, backend=backend)
+
+    def batches(self, batch_size=DEFAULT_BATCH_SIZE) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        """Yield the first row number and the columns of each batch of rows."""
+        for offset in range(0, self.length, batch_size):
+            yield offset, {name: values[offset:offset + batch_size] for name, values in self.values.items()}
+
+    def row(self, index: int, names: List[str]) -> Dict[str, Any]:
+        """The values of a row, with missing numbers as None and timestamps as text."""
+        row = {}
+        for name in names:
+            value = self.values[name][index]
+            if self.kinds[name] == TEXT:
+                row[name] = value
+            elif math.isnan(value):
+                row[name] = None
+            elif self.kinds[name] == TIMESTAMP_COLUMN:
+                row[name] = str(EPOCH + timedelta(seconds=float(value)))
+            else:
+                row[name] = int(value) if name in NUMBER_COLUMNS else float(value)
+        return row
+
+
+def timestamp_seconds(text: str) -> float:
+    """Seconds since the epoch of a timestamp literal."""
+    try:
+        return (datetime.fromisoformat(text) - EPOCH).total_seconds()
+    except ValueError:
+        raise ValueError('Not a timestamp (YYYY-MM-DD[ HH:MM:SS]): {}'.format(text))
+
+
+class QueryCompiler:
+    """Compile a query expression into an evaluator of a batch of columns."""
+    column_names: List[str]
+
+    def __init__(self, kinds: Dict[str, str]):
+        self.kinds = kinds
+        self.column_names = []
+
+    def compile(self, expression: str) -> Evaluator:
+        """Compile a boolean expression, checking its column names and types."""
+        try:
+            tree = ast.parse(expression.strip(), mode='eval')
+        except SyntaxError as error:
+            raise ValueError('Invalid query: {}'.format(error.msg))
+        kind, evaluate = self.compile_node(tree.body)
+        if kind != BOOLEAN:
+            raise ValueError('The query must be a comparison or a combination of them: {}'.format(expression))
+        return evaluate
+
+    def compile_node(self, node) -> Tuple[str, Evaluator]:
+        """The kind of value a node evaluates to, and how to evaluate it."""
+        compile_syntax = self.syntax_compilers.get(type(node))
+        compiled = compile_syntax(self, node) if compile_syntax else None
+        return compiled or self.compile_literal(node)
+
+    def compile_bool_op(self, node: ast.BoolOp) -> Tuple[str, Evaluator]:
+        """Compile and/or over comparisons."""
+        operands = [self.compile_boolean(operand) for operand in node.values]
+        combine_name = 'logical_and' if isinstance(node.op, ast.And) else 'logical_or'
+
+        def evaluate_bool_op(batch, backend):
+            result = operands[0](batch, backend)
+            for operand in operands[1:]:
+                result = getattr(backend, combine_name)(result, operand(batch, backend))
+            return result
+        return BOOLEAN, evaluate_bool_op
+
+    def compile_unary_op(self, node: ast.UnaryOp) -> Optional[Tuple[str, Evaluator]]:
+        """Compile not, or the negation of a number."""
+        if isinstance(node.op, ast.Not):
+            operand = self.compile_boolean(node.operand)
+            return BOOLEAN, lambda batch, backend: backend.logical_not(operand(batch, backend))
+        if not isinstance(node.op, ast.USub):
+            return None
+        kind, operand = self.compile_node(node.operand)
+        self.require_number(kind, node)
+
+        def evaluate_negation(batch, backend):
+            value = operand(batch, backend)
+            return backend.negate(value) if backend.is_column(value) else -value
+        return NUMBER, evaluate_negation
+
+    def compile_bin_op(self, node: ast.BinOp) -> Optional[Tuple[str, Evaluator]]:
+        """Compile arithmetic between numbers."""
+        arithmetic_op = ARITHMETIC.get(type(node.op))
+        if arithmetic_op is None:
+            return None
+        (left_kind, left), (right_kind, right) = self.compile_node(node.left), self.compile_node(node.right)
+        self.require_number(left_kind, node.left)
+        self.require_number(right_kind, node.right)
+
+        def evaluate_arithmetic(batch, backend):
+            left_value, right_value = left(batch, backend), right(batch, backend)
+            if backend.is_column(left_value) or backend.is_column(right_value):
+                return backend.arithmetic(arithmetic_op, left_value, right_value)
+            if arithmetic_op is operator.truediv and not right_value:
+                return math.nan
+            return arithmetic_op(left_value, right_value)
+        return NUMBER, evaluate_arithmetic
+
+    def compile_call(self, node: ast.Call) -> Optional[Tuple[str, Evaluator]]:
+        """Compile col('name'), the column of a name that is not an identifier."""
+        if isinstance(node.func, ast.Name) and node.func.id == 'col' and len(node.args) == 1 \
+                and not node.keywords and isinstance(self.literal(node.args[0]), str):
+            return self.compile_column(self.literal(node.args[0]))
+        return None
+
+    def compile_literal(self, node) -> Tuple[str, Evaluator]:
+        """Compile a number or text literal, the only syntax left once the others are ruled out."""
+        literal = self.literal(node)
+        if isinstance(literal, (int, float)) and not isinstance(literal, bool):
+            return NUMBER, lambda batch, backend: float(literal)
+        if isinstance(literal, str):
+            return TEXT, lambda batch, backend: literal
+        raise ValueError('Unsupported query syntax: {}'.format(ast.dump(node)))
+
+    def compile_boolean(self, node) -> Evaluator:
+        """Compile an operand of and/or/not, which must itself be boolean."""
+        kind, evaluate = self.compile_node(node)
+        if kind != BOOLEAN:
+            raise ValueError('Expected a comparison, not: {}'.format(ast.dump(node)))
+        return evaluate
+
+    def compile_column(self, name: str) -> Tuple[str, Evaluator]:
+        """Look a column up by name, noting it as used."""
+        if name not in self.kinds:
+            raise ValueError('Unknown column: {}'.format(name))
+        if name not in self.column_names:
+            self.column_names.append(name)
+        return self.kinds[name], lambda batch, backend: batch[name]
+
+    @staticmethod
+    def literal(node):
+        """The value of a literal node, or None if it is not one."""
+        if isinstance(node, ast.Constant):
+            return node.value
+        if isinstance(node, (ast.List, ast.Tuple, ast.Set)):
+            return [QueryCompiler.literal(element) for element in node.elts]
+        return None
+
+    @staticmethod
+    def require_number(kind: str, node):
+        """Arithmetic and negation work on numbers only."""
+        if kind != NUMBER:
+            raise ValueError('Expected a number, not {}: {}'.format(kind, ast.dump(node)))
+
+    def compile_compare(self, node: ast.Compare) -> Evaluator:
+        """Compile a comparison, possibly chained like 10 < PackSOC <= 20."""
+        comparisons = []
+        left_node = node.left
+        for compare_node, right_node in zip(node.ops, node.comparators):
+            comparisons.append(self.compile_comparison(left_node, compare_node, right_node))
+            left_node = right_node
+
+        def evaluate_compare(batch, backend):
+            result = comparisons[0](batch, backend)
+            for comparison in comparisons[1:]:
+                result = backend.logical_and(result, comparison(batch, backend))
+            return result
+        return evaluate_compare
+
+    def compile_comparison(self, left_node, compare_node, right_node) -> Evaluator:
+        """Compile a single comparison between two operands."""
+        left_kind, left = self.compile_node(left_node)
+        if isinstance(compare_node, (ast.In, ast.NotIn)):
+            return self.compile_membership(left_kind, left, isinstance(compare_node, ast.NotIn), right_node)
+        compare_op = COMPARISONS.get(type(compare_node))
+        if compare_op is None:
+            raise ValueError('Unsupported comparison: {}'.format(ast.dump(compare_node)))
+        right_kind, right = self.compile_node(right_node)
+        left, left_kind = self.coerce_timestamp(left, left_kind, right_kind, left_node)
+        right, right_kind = self.coerce_timestamp(right, right_kind, left_kind, right_node)
+        if {left_kind, right_kind} == {NUMBER, TIMESTAMP_COLUMN}:
+            left_kind = right_kind = NUMBER
+        if left_kind != right_kind or BOOLEAN in (left_kind, right_kind):
+            raise ValueError('Cannot compare {} with {}'.format(left_kind, right_kind))
+        if left_kind == TEXT and isinstance(compare_node, ORDERINGS):
+            raise ValueError('Text can only be compared with == or !=')
+
+        def evaluate_comparison(batch, backend):
+            left_value, right_value = left(batch, backend), right(batch, backend)
+            if backend.is_column(left_value) or backend.is_column(right_value):
+                return backend.compare(compare_op, left_value, right_value)
+            return backend.full_mask(compare_op(left_value, right_value), len(batch[TIMESTAMP_COLUMN]))
+        return evaluate_comparison
+
+    def compile_membership(self, kind: str, evaluate: Evaluator, negated: bool, choices_node) -> Evaluator:
+        """Compile 'in' or 'not in' a literal list."""
+        choices = self.literal(choices_node)
+        if not isinstance(choices, list):
+            raise ValueError("'in' needs a literal list, like component in ['MBB', 'Battery']")
+        if kind in (NUMBER, TIMESTAMP_COLUMN):
+            choices = [timestamp_seconds(choice) if kind == TIMESTAMP_COLUMN and isinstance(choice, str)
+                       else float(choice) for choice in choices]
+
+        def evaluate_membership(batch, backend):
+            mask = backend.is_in(evaluate(batch, backend), choices)
+            return backend.logical_not(mask) if negated else mask
+        return evaluate_membership
+
+    def coerce_timestamp(self, evaluate: Evaluator, kind: str, other_kind: str, node) -> Tuple[Evaluator, str]:
+        """Read a text literal compared with timestamps as a timestamp."""
+        literal = self.literal(node)
+        if kind == TEXT and other_kind == TIMESTAMP_COLUMN and isinstance(literal, str):
+            seconds = timestamp_seconds(literal)
+            return (lambda batch, backend: seconds), TIMESTAMP_COLUMN
+        return evaluate, kind
+
+    # How to compile each kind of syntax node; any other node must be a literal.
+    syntax_compilers = {
+        ast.BoolOp: compile_bool_op,
+        ast.UnaryOp: compile_unary_op,
+        ast.Compare: lambda self, node: (BOOLEAN, self.compile_compare(node)),
+        ast.BinOp: compile_bin_op,
+        ast.Name: lambda self, node: self.compile_column(node.id),
+        ast.Call: compile_call,
+    }
+
+
+class LogQuery:
+    """A compiled query over the columns of a log."""
+
+    def __init__(self, expression: str, columns: LogColumns):
+        self.expression = expression
+        self.columns = columns
+        compiler = QueryCompiler(columns.kinds)
+        self.evaluate = compiler.compile(expression)
+        # The columns the expression names, as identifiers or with col(), in order of appearance.
+        self.column_names = compiler.column_names
+
+    def matching_indexes(self, batch_size=DEFAULT_BATCH_SIZE) -> list:
+        """The row numbers matching the query, evaluated a batch at a time."""
+        backend = self.columns.backend
+        indexes = []
+        for offset, batch in self.columns.batches(batch_size):
+            indexes.extend(backend.indexes(self.evaluate(batch, backend), offset))
+        return indexes
+
+    def rows(self, names: List[str], batch_size=DEFAULT_BATCH_SIZE) -> Iterator[Dict[str, Any]]:
+        """The named columns of each matching row."""
+        for index in self.matching_indexes(batch_size):
+            yield self.columns.row(int(index), names)
+
+    def aggregate(self, aggregates: List[Tuple[str, Optional[str]]], group_by: Optional[str] = None,
+                  batch_size=DEFAULT_BATCH_SIZE) -> Dict[Any, Dict[str, Optional[float]]]:
+        """Aggregate number columns over the matching rows, as function:column, e.g. ('mean', 'MotTemp').
+        A count without a column counts rows. Results are by group_by value, or under None without one."""
+        self.check_aggregates(aggregates)
+        groups = self.group_indexes(self.matching_indexes(batch_size), group_by)
+        return {group_value: self.aggregate_group(aggregates, group_indexes)
+                for group_value, group_indexes in groups.items()}
+
+    def check_aggregates(self, aggregates: List[Tuple[str, Optional[str]]]):
+        """Refuse unknown functions, and columns that are not numbers."""
+        for function, name in aggregates:
+            if function not in AGGREGATES:
+                raise ValueError('Unknown aggregate: {}'.format(function))
+            if name is not None and self.columns.kinds.get(name) not in (NUMBER, TIMESTAMP_COLUMN):
+                raise ValueError('Aggregates need a number column: {}'.format(name))
+
+    def group_indexes(self, indexes: list, group_by: Optional[str]) -> Dict[Any, list]:
+        """The row numbers by their value of the group_by column, with missing numbers as None."""
+        if group_by is None:
+            return {None: indexes}
+        if group_by not in self.columns.kinds:
+            raise ValueError('Unknown column: {}'.format(group_by))
+        groups = {}
+        for index, group_value in zip(indexes, self.columns.backend.take(self.columns.values[group_by], indexes)):
+            if isinstance(group_value, float) and math.isnan(group_value):
+                group_value = None
+            groups.setdefault(group_value, []).append(index)
+        return groups
+
+    def aggregate_group(self, aggregates: List[Tuple[str, Optional[str]]], indexes: list) -> Dict[str, Optional[float]]:
+        """The aggregates of the given rows, labelled like function:column."""
+        backend = self.columns.backend
+        result = {}
+        for function, name in aggregates:
+            if name is None:
+                result[function] = len(indexes)
+            else:
+                values = backend.take(self.columns.values[name], indexes)
+                result['{}:{}'.format(function, name)] = backend.aggregate(function, values)
+        return result
+
+
+def parse_aggregate(text: str) -> Tuple[str, Optional[str]]:
+    """Split an aggregate like mean:MotTemp, or count."""
+    function, _, name = text.partition(':')
+    return function.strip(), name.strip() or None
+
+
+def query_args_parser() -> argparse.ArgumentParser:
+    """The command line arguments."""
+    args_parser = argparse.ArgumentParser()
+    subcommands = args_parser.add_subparsers(dest='command')
+    query_args = subcommands.add_parser('query',
+                                        help="print the entries matching an expression, or aggregates of them")
+    query_args.add_argument("expression",
+                            help="e.g. \"PackSOC < 20 and component == 'MBB' and MotTemp > 80\"")
+    query_args.add_argument("logfile",
+                            help="the parsed log file to query (may be .gz, .bz2 or .xz compressed)")
+    query_args.add_argument("--select",
+                            type=lambda names: [name.strip() for name in names.split(',')],
+                            help="the comma-separated columns to print (default: entry properties and conditions used)")
+    query_args.add_argument("--aggregate", action='append', type=parse_aggregate, dest='aggregates',
+                            help="count, or sum/mean/min/max:COLUMN, instead of printing rows; may be repeated")
+    query_args.add_argument("--group-by", dest='group_by',
+                            help="aggregate separately for each value of this column")
+    query_args.add_argument("--format", default='jsonl', choices=['jsonl', 'csv'],
+                            help="the output format for rows")
+    query_args.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, dest='batch_size',
+                            help="how many rows to evaluate at once")
+    return args_parser
+
+
+def print_aggregates(query: LogQuery, cli_args: argparse.Namespace):
+    """Print a JSON line of aggregates for each group."""
+    results = query.aggregate(cli_args.aggregates, group_by=cli_args.group_by, batch_size=cli_args.batch_size)
+    for group, result in results.items():
+        if cli_args.group_by:
+            result = dict({cli_args.group_by: group}, **result)
+        print(json.dumps(result))
+
+
+def print_rows(query: LogQuery, cli_args: argparse.Namespace):
+    """Print the selected columns of the matching rows, by default the entry properties and conditions used."""
+    selected = cli_args.select or ZeroLogFile.common_headers + [
+        name for name in query.column_names if name not in ZeroLogFile.common_headers]
+    for name in selected:
+        if name not in query.columns.kinds:
+            raise ValueError('Unknown column: {}'.format(name))
+    rows = query.rows(selected, batch_size=cli_args.batch_size)
+    if cli_args.format == 'csv':
+        writer = csv.DictWriter(sys.stdout, fieldnames=selected)
+        writer.writeheader()
+        writer.writerows(rows)
+    else:
+        for row in rows:
+            print(json.dumps(row))
+
+
+def main():
+    """Query a log from the command line."""
+    args_parser = query_args_parser()
+    cli_args = args_parser.parse_args()
+    if cli_args.command != 'query':
+        args_parser.print_help()
+        sys.exit(1)
+    columns = LogColumns.from_log_file(ZeroLogFile(cli_args.logfile, verbose=-1))
+    try:
+        query = LogQuery(cli_args.expression, columns)
+        if cli_args.aggregates:
+            print_aggregates(query, cli_args)
+        else:
+            print_rows(query, cli_args)
+    except ValueError as error:
+        args_parser.error(str(error))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,392 @@
+#!/usr/bin/env python3
+
+"""
+Read raw MBB/BMS binary log dumps (.bin) directly, without decoding them to text first.
+
+The dump is memory-mapped and its event log is walked record by record. Each record is framed
+by a 0xb2 byte and a length byte, followed by the entry type, a 32-bit Unix timestamp and the
+payload; 0xfe escapes bytes in the record that would otherwise look like framing. Known entry
+types are rendered into the same message text a decoded text log has, so ZeroLogEntry's message
+and condition decoding and ZeroLogFile's segment annotation run unchanged on top. Unknown entry
+types become '0x..' messages, like the ones decoded text logs have for them.
+
+Records are read in place from the mapped ring buffer; only a record split by the wrap point of
+the ring is copied to join its two parts.
+
+Only the entry types in MBB_ENTRY_LAYOUTS and BMS_ENTRY_LAYOUTS are decoded so far. Their payload
+layouts, and the framing and ring buffer index above, are unverified: no real dump has been checked
+in yet, and the tests only run on dumps assembled to these same assumptions.
+"""
+
+import mmap
+import struct
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, Union
+
+from extract_ride_data import ZeroLogFile, ZeroLogEntry, ZeroLogHeader
+
+ENTRY_START = 0xb2
+ESCAPE = 0xfe
+EVENT_LOG_MARKER = b'\xa2\xa2\xa2\xa2'
+# After the marker: the offsets of the end and start of the entries in the ring buffer, and their count.
+EVENT_LOG_INDEX = struct.Struct('<III')
+ENTRY_PREAMBLE = struct.Struct('<BI')
+
+# Fixed header fields of each kind of dump: (offset, struct format).
+MBB_HEADER_FIELDS = {
+    'serial_no': (0x200, '21s'),
+    'vin': (0x240, '17s'),
+    'firmware_rev': (0x27b, '<H'),
+    'board_rev': (0x27d, '<H'),
+    'model': (0x27f, '3s'),
+}
+
+BMS_HEADER_FIELDS = {
+    'serial_no': (0x300, '21s'),
+    'pack_serial_no': (0x320, '8s'),
+    'initial_date': (0x12, '<I'),
+}
+
+MBB_HEADER_TEMPLATE = '''Zero MBB log
+
+Serial number      {serial_no}
+VIN                {vin}
+Firmware rev.      {firmware_rev}
+Board rev.         {board_rev}
+Model              {model}
+
+Printing {count} of {count} log entries..
+
+ Entry    Time of Log            Event                      Conditions
++--------+----------------------+--------------------------+----------------------------------
+'''
+
+BMS_HEADER_TEMPLATE = '''Zero BMS log
+
+BMS serial number  {serial_no}
+Pack serial number {pack_serial_no}
+Initial date       {initial_date:%b %d %Y %H:%M:%S}
+
+Printing {count} of {count} log entries..
+
+ Entry    Time of Log            Event                      Conditions
++--------+----------------------+--------------------------+----------------------------------
+'''
+
+EntryLayout = Tuple[struct.Struct, Callable[..., str]]
+Buffer = Union[bytes, mmap.mmap]
+
+
+def millivolts(value: int) -> float:
+    """Convert a millivolt reading to volts."""
+    return value / 1000
+
+
+def riding_message(event: str) -> Callable[..., str]:
+    """Render riding-style status records, which Disarmed records share."""
+    def render(pack_temp_high, pack_temp_low, soc, pack_mv, motor_temp, controller_temp, rpm, battery_amps,
+               mods, motor_amps, ambient_temp, odometer):
+        return '{:27}PackTemp: h {}C, l {}C, PackSOC:{:3d}%, Vpack:{:8.3f}V, MotAmps:{:4d}, BattAmps:{:4d},' \
+               ' Mods: {:02b}, MotTemp:{:4d}C, CtrlTemp:{:4d}C, AmbTemp:{:4d}C, MotRPM:{:4d}, Odo:{:6d}km'.format(
+                   event, pack_temp_high, pack_temp_low, soc, millivolts(pack_mv), motor_amps, battery_amps, mods,
+                   motor_temp, controller_temp, ambient_temp, rpm, odometer)
+    return render
+
+
+def charging_message(pack_temp_high, pack_temp_low, soc, pack_mv, battery_amps, mods, mbb_charge_enabled,
+                     bms_charge_enabled) -> str:
+    """Render a charging status record."""
+    return 'Charging                   PackTemp: h {}C, l {}C, PackSOC:{:3d}%, Vpack:{:8.3f}V, BattAmps:{:4d},' \
+           ' Mods: {:02b}, MbbChgEn: {}, BmsChgEn: {}'.format(
+               pack_temp_high, pack_temp_low, soc, millivolts(pack_mv), battery_amps, mods,
+               'Yes' if mbb_charge_enabled else 'No', 'Yes' if bms_charge_enabled else 'No')
+
+
+def contactor_message(closing, module, vmod_mv, maxsys_mv, minsys_mv, vcap_mv, precharge) -> str:
+    """Render a module contactor closing or opening record."""
+    if not closing:
+        return 'Module {:02d} Opening Contactor vmod: {:.3f}V'.format(module, millivolts(vmod_mv))
+    return 'Module {:02d} Closing Contactor vmod: {:.3f}V, maxsys: {:.3f}V, minsys: {:.3f}V, diff: {:.3f}V,' \
+           ' vcap: {:.3f}V, prechg: {}%'.format(module, millivolts(vmod_mv), millivolts(maxsys_mv),
+                                                millivolts(minsys_mv), millivolts(maxsys_mv - minsys_mv),
+                                                millivolts(vcap_mv), precharge)
+
+
+def bms_level_message(event: str) -> Callable[..., str]:
+    """Render BMS charge or discharge level snapshots."""
+    def render(amp_hours, soc, amps, low_cell, low_cell_balanced, high_cell, balance, pack_temp, bms_temp,
+               pack_mv, mode):
+        return '{:27}AH: {}, SOC: {:3d}%, I: {}A, L: {}, l: {}, H: {}, B: {:03d}, PT: {}C, BT: {}C, PV: {},' \
+               ' M: {}'.format(event, amp_hours, soc, amps, low_cell, low_cell_balanced, high_cell, balance,
+                               pack_temp, bms_temp, pack_mv, 'Charging' if mode else 'Running')
+    return render
+
+
+MBB_ENTRY_LAYOUTS: Dict[int, EntryLayout] = {
+    0x09: (struct.Struct('<B'), lambda key_on: 'Key On' if key_on else 'Key Off'),
+    0x2c: (struct.Struct('<BBHIhhHhBhhI'), riding_message('Riding')),
+    0x2d: (struct.Struct('<BBHIhBBB'), charging_message),
+    0x33: (struct.Struct('<BBIIIIB'), contactor_message),
+    0x39: (struct.Struct('<HBHB'), lambda amps, percent, min_cell, max_pack_temp:
+           'Batt Dischg Cur Limited    {} A ({}%), MinCell: {}mV, MaxPackTemp: {}C'.format(
+               amps, percent, min_cell, max_pack_temp)),
+    0x3a: (struct.Struct('<IB'), lambda kohms, cell: 'INFO: Low Chassis Isolation {} KOhms to cell {}'.format(
+        kohms, cell)),
+    0x3c: (struct.Struct('<BBHIhhHhBhhI'), riding_message('Disarmed')),
+    0x3d: (struct.Struct('<B'), lambda module: 'Battery module {} contactor closed'.format(module)),
+}
+
+BMS_ENTRY_LAYOUTS: Dict[int, EntryLayout] = {
+    0x03: (struct.Struct('<BBhHHHBbbIB'), bms_level_message('Discharge level')),
+    0x04: (struct.Struct('<BBhHHHBbbIB'), bms_level_message('Charge level')),
+    0x08: (struct.Struct('<B'), lambda closed: 'Contactor was {}'.format('Closed' if closed else 'Opened')),
+}
+
+ENTRY_LAYOUTS_BY_SOURCE = {
+    'MBB': MBB_ENTRY_LAYOUTS,
+    'BMS': BMS_ENTRY_LAYOUTS,
+}
+
+
+def unescape(record: Union[bytes, memoryview]) -> Union[bytes, memoryview]:
+    """Undo the escaping of bytes that would look like record framing: 0xfe, x stands for 0xfe ^ (x - 1)."""
+    if ESCAPE not in record:
+        return record
+    unescaped = bytearray()
+    index = 0
+    while index < len(record):
+        if record[index] == ESCAPE and index + 1 < len(record):
+            unescaped.append(ESCAPE ^ (record[index + 1] - 1))
+            index += 2
+        else:
+            unescaped.append(record[index])
+            index += 1
+    return bytes(unescaped)
+
+
+def escape(record: bytes) -> bytes:
+    """Escape framing bytes in a record, the inverse of unescape."""
+    escaped = bytearray()
+    for byte in record:
+        if byte in (ENTRY_START, ESCAPE):
+            escaped.extend([ESCAPE, (ESCAPE ^ byte) + 1])
+        else:
+            escaped.append(byte)
+    return bytes(escaped)
+
+
+def decode_text(raw: bytes) -> str:
+    """Decode a fixed-width, NUL-padded text field."""
+    return raw.split(b'\x00', 1)[0].decode('ascii', errors='replace').strip()
+
+
+def utc_datetime(unix_time: int) -> datetime:
+    """A Unix timestamp as a naive UTC datetime, like the timestamps of decoded text logs."""
+    return datetime.fromtimestamp(unix_time, timezone.utc).replace(tzinfo=None)
+
+
+def log_source_for_filepath(filepath: str) -> str:
+    """Guess whether a dump is from the MBB or a BMS from its file name, like VIN_BMS0_2018-05-13.bin."""
+    return 'BMS' if '_BMS' in filepath.upper() else 'MBB'
+
+
+class RingBufferView:
+    """The byte ranges of a ring buffer, oldest first, indexed as one sequence without copying them.
+    Only a slice across the end of a range, like a record split by the wrap point, is copied."""
+
+    def __init__(self, log_buffer: Buffer, log_view: memoryview, ranges: List[Tuple[int, int]]):
+        self.log_buffer = log_buffer
+        self.log_view = log_view
+        self.ranges = ranges
+        # Where each range starts in the joined sequence.
+        self.range_offsets = []
+        length = 0
+        for start, end in ranges:
+            self.range_offsets.append(length)
+            length += end - start
+        self.length = length
+
+    def __len__(self) -> int:
+        return self.length
+
+    def locate(self, offset: int) -> Tuple[int, int]:
+        """The index of the range holding the offset, and where it is in the buffer."""
+        for index in range(len(self.ranges) - 1, -1, -1):
+            if offset >= self.range_offsets[index]:
+                return index, self.ranges[index][0] + offset - self.range_offsets[index]
+        raise IndexError(offset)
+
+    def byte_at(self, offset: int) -> int:
+        """The byte at the offset."""
+        return self.log_view[self.locate(offset)[1]]
+
+    def slice(self, start: int, end: int) -> Union[bytes, memoryview]:
+        """The bytes from start to end: a view into the buffer, or a copy if they span ranges."""
+        index, buffer_start = self.locate(start)
+        range_end = self.ranges[index][1]
+        if buffer_start + end - start <= range_end:
+            return self.log_view[buffer_start:buffer_start + end - start]
+        return bytes(self.log_view[buffer_start:range_end]) + bytes(self.slice(start + range_end - buffer_start, end))
+
+    def find(self, value: int, start: int) -> int:
+        """The offset of the next byte of this value from start, or -1."""
+        if start >= self.length:
+            return -1
+        index, buffer_start = self.locate(start)
+        for (range_start, range_end), range_offset in zip(self.ranges[index:], self.range_offsets[index:]):
+            found = self.log_buffer.find(bytes([value]), max(buffer_start, range_start), range_end)
+            if found >= 0:
+                return range_offset + found - range_start
+        return -1
+
+
+class BinaryLogReader:
+    """Walk the records of a memory-mapped binary log dump."""
+    log_source: str
+
+    def __init__(self, log_buffer, log_source='MBB'):
+        self.log_buffer = log_buffer
+        self.log_source = log_source
+        self.entry_layouts = ENTRY_LAYOUTS_BY_SOURCE[log_source]
+
+    def header_values(self) -> Dict[str, object]:
+        """The fixed header fields of the dump."""
+        values = {}
+        header_fields = MBB_HEADER_FIELDS if self.log_source == 'MBB' else BMS_HEADER_FIELDS
+        for name, (offset, field_format) in header_fields.items():
+            value = struct.unpack_from(field_format, self.log_buffer, offset)[0]
+            values[name] = decode_text(value) if isinstance(value, bytes) else value
+        if 'initial_date' in values:
+            values['initial_date'] = utc_datetime(values['initial_date'])
+        return values
+
+    def event_log_range(self) -> Tuple[int, int, int, int]:
+        """Where the ring buffer of entries lies, as (buffer start, entries start, entries end, count)."""
+        marker_offset = self.log_buffer.find(EVENT_LOG_MARKER)
+        if marker_offset < 0:
+            raise ValueError('No event log found in binary log')
+        entries_end, entries_start, entries_count = EVENT_LOG_INDEX.unpack_from(
+            self.log_buffer, marker_offset + len(EVENT_LOG_MARKER))
+        buffer_start = marker_offset + len(EVENT_LOG_MARKER) + EVENT_LOG_INDEX.size
+        return buffer_start, buffer_start + entries_start, buffer_start + entries_end, entries_count
+
+    def event_log_ranges(self) -> List[Tuple[int, int]]:
+        """Where the entry records lie in the buffer, oldest first: two ranges if the newest entries wrapped around."""
+        buffer_start, entries_start, entries_end, _ = self.event_log_range()
+        if entries_end >= entries_start:
+            return [(entries_start, entries_end)]
+        return [(entries_start, len(self.log_buffer)), (buffer_start, entries_end)]
+
+    def records(self) -> Iterator[Tuple[int, Optional[datetime], bytes]]:
+        """Yield (entry type, timestamp, payload) for each record."""
+        with memoryview(self.log_buffer) as log_view:
+            event_log = RingBufferView(self.log_buffer, log_view, self.event_log_ranges())
+            offset = event_log.find(ENTRY_START, 0)
+            while 0 <= offset < len(event_log) - 1:
+                length = event_log.byte_at(offset + 1)
+                if length < 2 + ENTRY_PREAMBLE.size or offset + length > len(event_log):
+                    # Not a whole record; resynchronize on the next framing byte.
+                    offset = event_log.find(ENTRY_START, offset + 1)
+                    continue
+                record = unescape(event_log.slice(offset + 2, offset + length))
+                entry_type, unix_time = ENTRY_PREAMBLE.unpack_from(record)
+                timestamp = utc_datetime(unix_time) if unix_time else None
+                yield entry_type, timestamp, bytes(record[ENTRY_PREAMBLE.size:])
+                offset += length
+
+    def message_for(self, entry_type: int, payload: bytes) -> str:
+        """Render a record as the message text of a decoded log, or as hex if its type is unknown."""
+        layout = self.entry_layouts.get(entry_type)
+        if layout is not None and len(payload) >= layout[0].size:
+            payload_layout, render = layout
+            return render(*payload_layout.unpack_from(payload))
+        return ' '.join('0x{:02x}'.format(byte) for byte in bytes([entry_type]) + payload)
+
+
+class ZeroBinaryLogFile(ZeroLogFile):
+    """Parse and represent a Zero Motorcycles binary log dump, like ZeroLogFile does a decoded text log."""
+    log_source: Optional[str] = None
+
+    def __init__(self, input_filepath: str, log_source=None, tabular_header_labels=None, entry_filter=None,
+                 schema_registry=False, profiler=None, verbose=0):
+        self.log_source = log_source or log_source_for_filepath(input_filepath)
+        super().__init__(input_filepath, tabular_header_labels=tabular_header_labels, entry_filter=entry_filter,
+                         schema_registry=schema_registry, profiler=profiler, verbose=verbose)
+
+    def refresh(self, verbose=0):
+        """Parse the memory-mapped input file into state."""
+        if verbose > 0:
+            print("Reading binary log from: {}".format(self.input_filepath))
+        with open(self.input_filepath, 'rb') as log_file, \
+                mmap.mmap(log_file.fileno(), 0, access=mmap.ACCESS_READ) as log_buffer:
+            reader = BinaryLogReader(log_buffer, log_source=self.log_source)
+            with self.profile_stage('decode') as stage:
+                self.entries = [ZeroLogEntry.from_decoded(entry_number, timestamp,
+                                                          reader.message_for(entry_type, payload),
+                                                          entry_filter=self.entry_filter)
+                                for entry_number, (entry_type, timestamp, payload)
+                                in enumerate(reader.records(), 1)]
+                stage['entries'] = len(self.entries)
+            with self.profile_stage('header'):
+                self.header = self.header_for(reader.header_values(), len(self.entries))
+        self.process_entries()
+
+    def header_for(self, header_values: Dict[str, object], entries_count: int) -> ZeroLogHeader:
+        """Build the log header from the binary header fields."""
+        template = MBB_HEADER_TEMPLATE if self.log_source == 'MBB' else BMS_HEADER_TEMPLATE
+        return ZeroLogHeader(template.format(count=entries_count, **header_values).splitlines())
+
+
+def write_binary_log(output_filepath: str, header_values: Dict[str, object],
+                     records: List[Tuple[int, datetime, tuple]], log_source='MBB', wrap_at=None):
+    """Write a binary log dump of the given records, each (entry type, timestamp, payload fields).
+    With wrap_at, the ring buffer wraps around after that many bytes of entries. Used for test fixtures."""
+    entry_layouts = ENTRY_LAYOUTS_BY_SOURCE[log_source]
+    event_log = bytearray()
+    for entry_type, timestamp, fields in records:
+        payload = entry_layouts[entry_type][0].pack(*fields) if entry_type in entry_layouts else bytes(fields)
+        record = escape(ENTRY_PREAMBLE.pack(entry_type, int((timestamp - datetime(1970, 1, 1)).total_seconds()))
+                        + payload)
+        event_log.extend(bytes([ENTRY_START, len(record) + 2]) + record)
+    header = bytearray(0x400)
+    header_fields = MBB_HEADER_FIELDS if log_source == 'MBB' else BMS_HEADER_FIELDS
+    for name, (offset, field_format) in header_fields.items():
+        value = header_values[name]
+        if isinstance(value, datetime):
+            value = int((value - datetime(1970, 1, 1)).total_seconds())
+        struct.pack_into(field_format, header, offset, value.encode('ascii') if isinstance(value, str) else value)
+    if wrap_at:
+        # The oldest entries fill the end of the buffer and the newest continue from its start,
+        # with unused space between them.
+        newest = event_log[wrap_at:]
+        ring_buffer = newest + b'\xff' * 8 + event_log[:wrap_at]
+        entries_start, entries_end = len(newest) + 8, len(newest)
+    else:
+        ring_buffer, entries_start, entries_end = event_log, 0, len(event_log)
+    with open(output_filepath, 'wb') as output:
+        output.write(bytes(header) + EVENT_LOG_MARKER + EVENT_LOG_INDEX.pack(entries_end, entries_start, len(records))
+                     + bytes(ring_buffer))
+
+
+if __name__ == "__main__":
+    import sys
+    import argparse
+
+    ARGS_PARSER = argparse.ArgumentParser()
+    ARGS_PARSER.add_argument("binfile",
+                             help="the raw binary log dump to read")
+    ARGS_PARSER.add_argument("--source", choices=list(ENTRY_LAYOUTS_BY_SOURCE),
+                             help="whether the dump is from the MBB or a BMS (default: guess from the file name)")
+    ARGS_PARSER.add_argument("--format", default='csv',
+                             choices=['csv', 'tsv', 'json', 'jsonl', 'sqlite'],
+                             help="the output format desired")
+    ARGS_PARSER.add_argument("--outfile",
+                             help="the name of output file to emit")
+
+    CLI_ARGS = ARGS_PARSER.parse_args()
+    LOG_FILE = ZeroBinaryLogFile(CLI_ARGS.binfile, log_source=CLI_ARGS.source)
+    if not LOG_FILE.entries:
+        print('No entries found in: {}'.format(CLI_ARGS.binfile))
+        sys.exit(1)
+    LOG_FILE.output_to_file(CLI_ARGS.outfile or CLI_ARGS.binfile.rsplit('.', 1)[0] + '.' + CLI_ARGS.format,
+                            CLI_ARGS.format)
@@ -0,0 +1,354 @@
+#!/usr/bin/env python3
+
+"""
+Serve log extraction over HTTP, for tools that would otherwise shell out to extract_ride_data.py.
+
+POST a decoded log to /extract?format=csv (or tsv, json, jsonl; add omit_units=1 to strip units)
+and the extracted output is streamed back. GET /stats returns the service counters as JSON.
+
+Uploads are streamed to a spool file while being hashed, decoding runs in a process pool, and the
+output is streamed back as the worker writes it. Outputs are kept in a cache keyed by the content
+hash of the upload, so the same log posted again is served without decoding it.
+If decoding fails once the output has started streaming, the connection is dropped without the final
+chunk, so clients see a truncated response rather than a complete one.
+"""
+
+import os
+import json
+import time
+import asyncio
+import hashlib
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, Set, Tuple, Optional
+from urllib.parse import urlsplit, parse_qs
+
+from extract_ride_data import ZeroLogFile
+
+CONTENT_TYPES_BY_FORMAT = {
+    'csv': 'text/csv',
+    'tsv': 'text/tab-separated-values',
+    'json': 'application/json',
+    'jsonl': 'application/x-ndjson'
+}
+
+HTTP_REASONS = {
+    200: 'OK',
+    400: 'Bad Request',
+    404: 'Not Found',
+    405: 'Method Not Allowed',
+    411: 'Length Required',
+    413: 'Payload Too Large',
+    422: 'Unprocessable Entity',
+    500: 'Internal Server Error'
+}
+
+READ_CHUNK_SIZE = 64 * 1024
+
+
+def extract_to_file(log_filepath: str, output_filepath: str, output_format: str, omit_units=False) -> int:
+    """Extract a log into the output file, returning how many entries it had."""
+    log_file = ZeroLogFile(log_filepath, verbose=-1)
+    log_file.output_to_file(output_filepath, output_format, omit_units=omit_units, verbose=-1)
+    return len(log_file.entries)
+
+
+class ResultCache:
+    """Extracted outputs on disk, keyed by upload content hash and output options."""
+
+    def __init__(self, cache_dir: str, max_bytes: int):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def key(content_hash: str, output_format: str, omit_units: bool) -> str:
+        """The cache key of one output of one upload."""
+        return '{}-{}{}'.format(content_hash, output_format, '-nounits' if omit_units else '')
+
+    def filepath(self, key: str) -> str:
+        """Where the finished output for the key lives."""
+        return os.path.join(self.cache_dir, key + '.out')
+
+    def partial_filepath(self, key: str) -> str:
+        """Where the output for the key is written while being extracted."""
+        return os.path.join(self.cache_dir, key + '.partial')
+
+    def get(self, key: str) -> Optional[str]:
+        """The finished output filepath for the key, if cached."""
+        filepath = self.filepath(key)
+        if os.path.exists(filepath):
+            os.utime(filepath)  # Keep recently used outputs from being evicted.
+            return filepath
+        return None
+
+    def trim(self):
+        """Evict the least recently used outputs beyond the size budget."""
+        entries = [entry for entry in os.scandir(self.cache_dir) if entry.name.endswith('.out')]
+        entries.sort(key=lambda entry: entry.stat().st_mtime, reverse=True)
+        total_bytes = 0
+        for entry in entries:
+            total_bytes += entry.stat().st_size
+            if total_bytes > self.max_bytes:
+                os.remove(entry.path)
+
+
+class HTTPError(Exception):
+    """An error to report to the client as an HTTP status."""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class ExtractionServer:
+    """A minimal asyncio HTTP/1.1 server dispatching extraction to a worker pool."""
+    # Run in the worker pool, so it must be a picklable module-level function.
+    extract_job = staticmethod(extract_to_file)
+    # Connections whose response status line was already sent; errors can then only drop them.
+    heads_sent: Set[asyncio.StreamWriter]
+
+    def __init__(self, cache_dir: str, max_upload_bytes=256 * 1024 * 1024, max_cache_bytes=1024 * 1024 * 1024,
+                 max_workers=None, max_concurrent=None, use_processes=True, verbose=0):
+        self.cache = ResultCache(cache_dir, max_cache_bytes)
+        self.spool_dir = os.path.join(cache_dir, 'uploads')
+        os.makedirs(self.spool_dir, exist_ok=True)
+        self.max_upload_bytes = max_upload_bytes
+        self.verbose = verbose
+        max_workers = max_workers or os.cpu_count() or 2
+        executor_class = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+        self.executor = executor_class(max_workers=max_workers)
+        self.max_concurrent = max_concurrent or max_workers * 2
+        self.job_slots = None
+        self.jobs_in_progress: Dict[str, asyncio.Future] = {}
+        self.heads_sent = set()
+        self.stats = {'requests': 0, 'cache_hits': 0, 'extractions': 0, 'entries_extracted': 0,
+                      'errors': 0, 'bytes_received': 0, 'bytes_sent': 0}
+
+    async def start(self, host='127.0.0.1', port=8080) -> asyncio.AbstractServer:
+        """Start listening; the returned server is served until closed."""
+        self.job_slots = asyncio.Semaphore(self.max_concurrent)
+        return await asyncio.start_server(self.handle_connection, host, port)
+
+    def close(self):
+        """Stop the worker pool."""
+        self.executor.shutdown(wait=True)
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Serve one request per connection."""
+        self.stats['requests'] += 1
+        try:
+            method, target, headers = await self.read_request_head(reader)
+            url = urlsplit(target)
+            if self.verbose > 0:
+                print('{} {}'.format(method, target))
+            if url.path == '/stats' and method == 'GET':
+                await self.send_bytes(writer, 200, 'application/json', json.dumps(self.stats).encode())
+            elif url.path == '/extract':
+                if method != 'POST':
+                    raise HTTPError(405, 'Use POST to upload a log')
+                await self.handle_extract(reader, writer, headers, parse_qs(url.query))
+            else:
+                raise HTTPError(404, 'Unknown path: {}'.format(url.path))
+        except HTTPError as error:
+            await self.send_error(writer, error.status, error.message)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except Exception as error:  # Anything unexpected, like a full spool disk.
+            print('Failed to serve a request: {!r}'.format(error))
+            await self.send_error(writer, 500, 'Internal error: {!r}'.format(error))
+        finally:
+            self.heads_sent.discard(writer)
+            writer.close()
+
+    async def send_error(self, writer, status: int, message: str):
+        """Report the error as the response, or drop the connection if a response was already started."""
+        self.stats['errors'] += 1
+        if writer in self.heads_sent:
+            if self.verbose >= 0:
+                print('Dropping a response after it started: {}'.format(message))
+            writer.transport.abort()
+        else:
+            await self.send_bytes(writer, status, 'text/plain', (message + '\n').encode())
+
+    @staticmethod
+    async def read_request_head(reader: asyncio.StreamReader) -> Tuple[str, str, Dict[str, str]]:
+        """Read the request line and headers."""
+        try:
+            method, target, _ = (await reader.readline()).decode('latin-1').split()
+        except ValueError:
+            raise HTTPError(400, 'Malformed request line')
+        headers = {}
+        while True:
+            line = (await reader.readline()).decode('latin-1')
+            if line in ('\r\n', '\n', ''):
+                return method, target, headers
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+    async def handle_extract(self, reader, writer, headers: Dict[str, str], params: Dict[str, list]):
+        """Spool and hash the upload, then stream back its extracted output."""
+        output_format = params.get('format', ['csv'])[0]
+        if output_format not in CONTENT_TYPES_BY_FORMAT:
+            raise HTTPError(400, 'Unsupported format: {}'.format(output_format))
+        omit_units = params.get('omit_units', ['0'])[0] not in ('0', '', 'false')
+        if 'content-length' not in headers:
+            raise HTTPError(411, 'Content-Length is required')
+        try:
+            content_length = int(headers['content-length'])
+        except ValueError:
+            raise HTTPError(400, 'Malformed Content-Length')
+        if content_length > self.max_upload_bytes:
+            raise HTTPError(413, 'Uploads are limited to {} bytes'.format(self.max_upload_bytes))
+
+        upload_fd, upload_filepath = tempfile.mkstemp(dir=self.spool_dir)
+        try:
+            content_hash = hashlib.sha256()
+            with os.fdopen(upload_fd, 'wb') as upload_file:
+                remaining = content_length
+                while remaining > 0:
+                    chunk = await reader.read(min(READ_CHUNK_SIZE, remaining))
+                    if not chunk:
+                        raise HTTPError(400, 'Upload ended early')
+                    content_hash.update(chunk)
+                    upload_file.write(chunk)
+                    remaining -= len(chunk)
+            self.stats['bytes_received'] += content_length
+            key = self.cache.key(content_hash.hexdigest(), output_format, omit_units)
+            await self.stream_result(writer, key, upload_filepath, output_format, omit_units)
+        finally:
+            os.remove(upload_filepath)
+
+    async def stream_result(self, writer, key: str, upload_filepath: str, output_format: str, omit_units: bool):
+        """Stream the cached output, or extract it while streaming what the worker has written so far."""
+        content_type = CONTENT_TYPES_BY_FORMAT[output_format]
+        while key in self.jobs_in_progress:
+            # The same upload is being extracted for another request; wait for its output.
+            await asyncio.wait([self.jobs_in_progress[key]])
+        cached_filepath = self.cache.get(key)
+        if cached_filepath:
+            self.stats['cache_hits'] += 1
+            with open(cached_filepath, 'rb') as cached_file:
+                await self.send_chunked(writer, 200, content_type, cached_file, None)
+            return
+
+        loop = asyncio.get_running_loop()
+        # Claimed before waiting for a job slot, so identical uploads queued behind a full pool wait for this one.
+        claim = self.jobs_in_progress[key] = loop.create_future()
+        partial_filepath = self.cache.partial_filepath(key)
+        try:
+            async with self.job_slots:
+                open(partial_filepath, 'wb').close()
+                job = loop.run_in_executor(self.executor, self.extract_job, upload_filepath, partial_filepath,
+                                           output_format, omit_units)
+                with open(partial_filepath, 'rb') as partial_file:
+                    # Report failures as errors as long as no output has been written yet.
+                    while not job.done() and os.path.getsize(partial_filepath) == 0:
+                        await asyncio.sleep(0.01)
+                    if job.done() and isinstance(job.exception(), OSError):
+                        raise HTTPError(500, 'Unable to write the extracted output: {!r}'.format(job.exception()))
+                    if job.done() and job.exception():
+                        raise HTTPError(422, 'Unable to extract the log: {!r}'.format(job.exception()))
+                    await self.send_chunked(writer, 200, content_type, partial_file, job)
+                self.stats['extractions'] += 1
+                self.stats['entries_extracted'] += job.result()
+                self.cache_output(key, partial_filepath)
+        finally:
+            del self.jobs_in_progress[key]
+            claim.set_result(None)
+            if os.path.exists(partial_filepath):
+                os.remove(partial_filepath)
+
+    def cache_output(self, key: str, partial_filepath: str):
+        """Keep a completed output for reuse; the response was already sent, so failing to is only reported."""
+        try:
+            os.replace(partial_filepath, self.cache.filepath(key))
+            self.cache.trim()
+        except OSError as error:
+            print('Unable to cache the extracted output: {!r}'.format(error))
+
+    async def send_chunked(self, writer, status: int, content_type: str, output_file, job: Optional[asyncio.Future]):
+        """Send the file with chunked encoding; while the job runs, follow the file as it grows.
+        The last chunk is only sent if the job succeeded."""
+        self.send_head(writer, status, content_type, {'Transfer-Encoding': 'chunked'})
+        while True:
+            chunk = output_file.read(READ_CHUNK_SIZE)
+            if chunk:
+                writer.write(b'%x\r\n%s\r\n' % (len(chunk), chunk))
+                self.stats['bytes_sent'] += len(chunk)
+                await writer.drain()
+            elif job is None:
+                break
+            elif job.done():
+                if job.exception():
+                    raise HTTPError(422, 'Unable to extract the log: {!r}'.format(job.exception()))
+                job = None  # One more read picks up whatever was written before the job finished.
+            else:
+                await asyncio.sleep(0.01)
+        writer.write(b'0\r\n\r\n')
+        await writer.drain()
+
+    async def send_bytes(self, writer, status: int, content_type: str, body: bytes):
+        """Send a complete response body."""
+        self.send_head(writer, status, content_type, {'Content-Length': str(len(body))})
+        writer.write(body)
+        self.stats['bytes_sent'] += len(body)
+        await writer.drain()
+
+    def send_head(self, writer, status: int, content_type: str, extra_headers: Dict[str, str]):
+        """Start the response, after which errors can no longer be reported as a status."""
+        writer.write(self.response_head(status, content_type, extra_headers))
+        self.heads_sent.add(writer)
+
+    @staticmethod
+    def response_head(status: int, content_type: str, extra_headers: Dict[str, str]) -> bytes:
+        """The status line and headers of a response."""
+        lines = ['HTTP/1.1 {} {}'.format(status, HTTP_REASONS[status]),
+                 'Content-Type: {}'.format(content_type),
+                 'Connection: close',
+                 'Date: {}'.format(time.strftime('%a, %d %b %Y %H:%M:%S GMT', time.gmtime()))]
+        lines.extend('{}: {}'.format(name, value) for name, value in extra_headers.items())
+        return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+
+
+if __name__ == "__main__":
+    import argparse
+
+    ARGS_PARSER = argparse.ArgumentParser()
+    ARGS_PARSER.add_argument("--host", default='127.0.0.1',
+                             help="the address to listen on")
+    ARGS_PARSER.add_argument("--port", type=int, default=8080,
+                             help="the port to listen on")
+    ARGS_PARSER.add_argument("--cache-dir", dest='cache_dir',
+                             default=os.path.join(tempfile.gettempdir(), 'zero-log-extractor-cache'),
+                             help="where to keep extracted outputs for reuse")
+    ARGS_PARSER.add_argument("--max-cache-mb", type=int, default=1024, dest='max_cache_mb',
+                             help="how much extracted output to keep cached")
+    ARGS_PARSER.add_argument("--max-upload-mb", type=int, default=256, dest='max_upload_mb',
+                             help="the largest log upload accepted")
+    ARGS_PARSER.add_argument("--workers", type=int, default=os.cpu_count() or 2,
+                             help="how many logs to decode at once")
+    ARGS_PARSER.add_argument("--max-concurrent", type=int, dest='max_concurrent',
+                             help="how many extractions may be queued or running (default: twice the workers)")
+    ARGS_PARSER.add_argument("--verbose", "-v",
+                             action='count', default=0,
+                             help="show more processing details")
+
+    CLI_ARGS = ARGS_PARSER.parse_args()
+    SERVER = ExtractionServer(CLI_ARGS.cache_dir,
+                              max_upload_bytes=CLI_ARGS.max_upload_mb * 1024 * 1024,
+                              max_cache_bytes=CLI_ARGS.max_cache_mb * 1024 * 1024,
+                              max_workers=CLI_ARGS.workers, max_concurrent=CLI_ARGS.max_concurrent,
+                              verbose=CLI_ARGS.verbose)
+    LOOP = asyncio.get_event_loop()
+    LISTENER = LOOP.run_until_complete(SERVER.start(CLI_ARGS.host, CLI_ARGS.port))
+    print('Serving log extraction on http://{}:{}/extract'.format(CLI_ARGS.host, CLI_ARGS.port))
+    try:
+        LOOP.run_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        LISTENER.close()
+        LOOP.run_until_complete(LISTENER.wait_closed())
+        SERVER.close()
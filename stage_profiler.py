@@ -0,0 +1,134 @@
+"""
+Profile log extraction by stage: reading, header parsing, entry decoding, segment annotation,
+condition key discovery and writing each output.
+
+A StageProfiler given to ZeroLogFile (or output_to_file) records wall time, CPU time, entry
+counts and allocations for each stage it runs. Entry decoding is also broken down by message
+family and by which special-condition branch of ZeroLogEntry decoded the entry.
+
+Stages may nest. tracemalloc keeps a single peak, which each stage resets on entry; the peak an
+enclosing stage had reached before that is kept aside, so its own peak still covers the whole stage.
+"""
+
+import json
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+
+class StageProfiler:
+    """Accumulate measurements of named extraction stages and of entry decoding by message family."""
+    stages: Dict[str, Dict[str, float]]
+    message_families: Dict[str, Dict[str, float]]
+    special_conditions: Dict[str, Dict[str, float]]
+    # For each stage in progress, outermost first, the highest traced memory before an inner stage reset the peak.
+    outer_peaks: List[int]
+
+    def __init__(self, trace_allocations=True):
+        self.trace_allocations = trace_allocations
+        self.started_tracing = False
+        self.outer_peaks = []
+        self.stages = {}
+        self.message_families = {}
+        self.special_conditions = {}
+
+    def __enter__(self) -> 'StageProfiler':
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def start(self):
+        """Begin tracing allocations, unless already traced elsewhere."""
+        if self.trace_allocations and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.started_tracing = True
+
+    def stop(self):
+        """Stop tracing allocations if this profiler started it."""
+        if self.started_tracing:
+            tracemalloc.stop()
+            self.started_tracing = False
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[Dict[str, int]]:
+        """Measure a stage. The caller may set 'entries' in the yielded dict to count what it handled."""
+        record = self.stages.setdefault(name, {'calls': 0, 'entries': 0, 'wall_seconds': 0.0, 'cpu_seconds': 0.0,
+                                               'allocated_bytes': 0, 'peak_bytes': 0})
+        counts = {}
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            memory_before, memory_peak = tracemalloc.get_traced_memory()
+            if hasattr(tracemalloc, 'reset_peak'):
+                if self.outer_peaks:
+                    self.outer_peaks[-1] = max(self.outer_peaks[-1], memory_peak)
+                tracemalloc.reset_peak()
+            self.outer_peaks.append(memory_before)
+        cpu_before = time.process_time()
+        wall_before = time.perf_counter()
+        try:
+            yield counts
+        finally:
+            record['wall_seconds'] += time.perf_counter() - wall_before
+            record['cpu_seconds'] += time.process_time() - cpu_before
+            record['calls'] += 1
+            record['entries'] += counts.get('entries', 0)
+            if tracing:
+                memory_after, memory_peak = tracemalloc.get_traced_memory()
+                memory_peak = max(memory_peak, self.outer_peaks.pop())
+                record['allocated_bytes'] += memory_after - memory_before
+                record['peak_bytes'] = max(record['peak_bytes'], memory_peak - memory_before)
+
+    @staticmethod
+    def count(table: Dict[str, Dict[str, float]], key: str, seconds: float):
+        """Count one occurrence of the key, with the time it took."""
+        record = table.get(key)
+        if record is None:
+            record = table[key] = {'count': 0, 'seconds': 0.0}
+        record['count'] += 1
+        record['seconds'] += seconds
+
+    def count_entry(self, message_family: str, seconds: float, special_condition: Optional[str] = None,
+                    special_condition_seconds=0.0):
+        """Count a decoded entry by its message family, with the time its whole decoding took,
+        and by its special-condition branch, with the time of that branch alone."""
+        self.count(self.message_families, message_family, seconds)
+        if special_condition:
+            self.count(self.special_conditions, special_condition, special_condition_seconds)
+
+    def merge(self, other: 'StageProfiler'):
+        """Add the measurements of another profiler, e.g. one that ran in a worker process.
+        Times and counts add up; peaks keep the highest."""
+        for name, other_record in other.stages.items():
+            record = self.stages.setdefault(name, dict.fromkeys(other_record, 0))
+            for key, value in other_record.items():
+                record[key] = max(record[key], value) if key == 'peak_bytes' else record[key] + value
+        for table, other_table in [(self.message_families, other.message_families),
+                                   (self.special_conditions, other.special_conditions)]:
+            for key, other_record in other_table.items():
+                record = table.setdefault(key, {'count': 0, 'seconds': 0.0})
+                record['count'] += other_record['count']
+                record['seconds'] += other_record['seconds']
+
+    def to_json(self) -> Dict[str, Any]:
+        """Convert to JSON-serializable data structure."""
+        return {
+            'stages': self.stages,
+            'message_families': dict(sorted(self.message_families.items(),
+                                            key=lambda item: item[1]['seconds'], reverse=True)),
+            'special_conditions': self.special_conditions,
+            'allocations_traced': self.trace_allocations
+        }
+
+    def save(self, report_filepath: str):
+        """Write the report as JSON."""
+        with open(report_filepath, 'w') as report_file:
+            json.dump(self.to_json(), report_file, indent=2)
+
+    def print_summary(self):
+        """Print one line per stage."""
+        for name, record in self.stages.items():
+            print('{:16} wall {:8.3f}s  cpu {:8.3f}s  {:>10,} entries  {:>14,} B allocated'.format(
+                name, record['wall_seconds'], record['cpu_seconds'], record['entries'], record['allocated_bytes']))
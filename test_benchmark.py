@@ -0,0 +1,17 @@
+import os
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+from benchmark import benchmark_throughput
+from generate_logs import write_log
+
+
+class TestBenchmark(TestCase):
+    def test_throughput(self):
+        with TemporaryDirectory() as directory:
+            log_filepath = write_log(os.path.join(directory, 'log.txt'), entries_count=200)
+            results = benchmark_throughput(log_filepath, output_formats=['csv', 'jsonl'], repeat=1,
+                                           work_dir=directory)
+        self.assertEqual(['read', 'parse', 'annotate', 'export_csv', 'export_jsonl', 'memory'], list(results))
+        self.assertGreater(results['parse']['lines_per_second'], 0)
+        self.assertEqual(200, results['memory']['entries'])
+        self.assertGreater(results['memory']['peak_bytes'], 0)
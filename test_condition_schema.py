@@ -0,0 +1,27 @@
+from unittest import TestCase
+from condition_schema import ConditionSchema, parse_number, discover_conditions_keys
+
+
+class TestConditionSchema(TestCase):
+    def test_for_source(self):
+        self.assertIn('PackSOC', ConditionSchema.for_source('MBB', '51').keys)
+        self.assertIn('SOC', ConditionSchema.for_source('BMS').keys)
+        self.assertEqual(ConditionSchema.for_source('MBB').keys, ConditionSchema.for_source(None).keys)
+
+    def test_overflow(self):
+        schema = ConditionSchema.for_source('MBB')
+        overflow = schema.overflow_conditions({'PackSOC': '9%', 'Dummy': '1', 'Other': 'x'})
+        self.assertEqual({'Dummy': '1', 'Other': 'x'}, overflow)
+        self.assertEqual('Dummy=1; Other=x', schema.overflow_text(overflow))
+
+    def test_typed_value(self):
+        schema = ConditionSchema.for_source('MBB')
+        self.assertEqual(93.175, schema.typed_value('vmod', '93.175V'))
+        self.assertEqual(3280.0, schema.typed_value('MinCell', '3280mV'))
+        self.assertEqual('Yes', schema.typed_value('MbbChgEn', 'Yes'))
+        self.assertIsNone(schema.typed_value('PackSOC', 'n/a'))
+        self.assertEqual('n/a', schema.typed_value('Dummy', 'n/a'))
+        self.assertAlmostEqual(3.28, parse_number('3280mV', 'V'))
+
+    def test_discover_conditions_keys(self):
+        self.assertEqual(['a', 'b', 'c'], discover_conditions_keys([{'a': 1, 'b': 2}, {}, {'b': 3, 'c': 4}]))
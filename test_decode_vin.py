@@ -0,0 +1,41 @@
+import io
+import csv
+import json
+from unittest import TestCase
+from decode_vin import decode_vin, decoded_vin_row, write_decoded_vins, VinDecodeError, CSV_COLUMNS
+
+
+class TestDecodeVin(TestCase):
+    def test_decode_vin(self):
+        self.assertEqual({
+            'manufacturer': 'Zero Motorcycles',
+            'plant_location': 'Santa Cruz, CA',
+            'year': 2016,
+            'platform': 'SDS',
+            'model': 'DSR',
+            'motor': {'power': '16kW', 'size': '75-7R'},
+            'pack_capacity': '13.0'
+        }, decode_vin('538SD9Z37GCG06073'))
+        self.assertEqual({'power': '13kW', 'size': None}, decode_vin('538SMBZ13GCA06073')['motor'])
+        with self.assertRaisesRegex(KeyError, "model line code: 'Q9'"):
+            decode_vin('538SQ9Z37GCG06073')
+        with self.assertRaises(VinDecodeError):
+            decode_vin('538SD9Z37')
+
+    def test_write_decoded_vins(self):
+        vin_lines = ['538SD9Z37GCG06073\n', '\n', '538sd9z37gcg06073\n', '538SD9Z37WCG06073\n']
+        output = io.StringIO()
+        self.assertEqual(1, write_decoded_vins(vin_lines, output, 'jsonl'))
+        rows = [json.loads(line) for line in output.getvalue().splitlines()]
+        self.assertEqual(3, len(rows))
+        self.assertEqual(rows[0], rows[1])
+        self.assertEqual('75-7R', rows[0]['motor_size'])
+        self.assertIsNone(rows[0]['error'])
+        self.assertEqual(("Unknown model year code: 'W'", None), (rows[2]['error'], rows[2]['year']))
+        self.assertIs(decoded_vin_row('538SD9Z37GCG06073'), decoded_vin_row('538SD9Z37GCG06073'))
+
+        output = io.StringIO()
+        write_decoded_vins(vin_lines, output, 'csv')
+        rows = list(csv.DictReader(io.StringIO(output.getvalue())))
+        self.assertEqual(CSV_COLUMNS, list(rows[0]))
+        self.assertEqual(('2016', ''), (rows[0]['year'], rows[0]['error']))
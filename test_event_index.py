@@ -0,0 +1,62 @@
+import os
+from datetime import datetime
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+from event_index import EventIndex
+from test_extract_ride_data import MBB_LOG_ENTRIES, write_mbb_log
+
+
+class TestEventIndex(TestCase):
+    def test_index_and_search(self):
+        with TemporaryDirectory() as directory:
+            log_filepath = write_mbb_log(directory, MBB_LOG_ENTRIES, name='mbb.txt')
+            index = EventIndex(os.path.join(directory, 'index.sqlite'))
+            try:
+                self.assertEqual({log_filepath: 6}, index.index_paths([directory]))
+                self.assertEqual({}, index.index_paths([directory]))
+
+                postings = index.search(event='batt dischg  CUR limited')
+                self.assertEqual([(log_filepath, 4, datetime(2018, 5, 13, 10, 10, 35))],
+                                 [posting[:3] for posting in postings])
+                [(path, log_entry)] = index.read_postings(postings)
+                self.assertEqual('Batt Dischg Cur Limited', log_entry.event)
+                self.assertEqual('3280mV', log_entry.conditions['MinCell'])
+
+                self.assertEqual([5, 6], [posting[1] for posting in index.search(component='MBB',
+                                                                                 event_type='CHARGING')])
+                self.assertEqual([2], [posting[1] for posting in index.search(event='module closing*')])
+                self.assertEqual([1], [posting[1] for posting in index.search(event_level='DEBUG',
+                                                                              vin='538SD9Z37GCG06073')])
+                self.assertEqual([], index.search(event_level='DEBUG', vin='OTHER'))
+                self.assertEqual([6], [posting[1] for posting in index.search(
+                    event_type='CHARGING', since=datetime(2018, 5, 13, 10, 20))])
+
+                write_mbb_log(directory, MBB_LOG_ENTRIES + [
+                    ' 00007     05/13/2018 10:31:15   INFO: Low Chassis Isolation 4 KOhms to cell 11'],
+                    name='mbb.txt')
+                stat = os.stat(log_filepath)
+                os.utime(log_filepath, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000000))
+                self.assertEqual({log_filepath: 7}, index.index_paths([log_filepath]))
+                [(_, log_entry)] = index.read_postings(index.search(event='Low Chassis Isolation',
+                                                                    event_level='INFO'))
+                self.assertEqual(7, log_entry.entry)
+                self.assertEqual(1, len(index.search(event_type='LIMIT')))
+            finally:
+                index.close()
+
+    def test_repeated_entry_numbers(self):
+        with TemporaryDirectory() as directory:
+            # The entry counter wrapped around, so the last lines repeat earlier entry numbers.
+            log_filepath = write_mbb_log(directory, MBB_LOG_ENTRIES + [
+                ' 00001     05/14/2018 08:00:00   INFO: Low Chassis Isolation 4 KOhms to cell 11',
+                ' 00002     05/14/2018 08:00:05   DEBUG: Sevcon Contactor Drive ON.'], name='mbb.txt')
+            index = EventIndex(os.path.join(directory, 'index.sqlite'))
+            try:
+                self.assertEqual({log_filepath: 8}, index.index_paths([log_filepath]))
+                self.assertEqual([(1, datetime(2018, 5, 13, 10, 6, 43)), (2, datetime(2018, 5, 14, 8, 0, 5))],
+                                 [posting[1:3] for posting in index.search(event_level='DEBUG')])
+                self.assertEqual([1], [posting[1] for posting in index.search(event='low chassis isolation',
+                                                                              event_level='INFO')])
+                self.assertEqual([], index.search(event='low chassis isolation', event_level='DEBUG'))
+            finally:
+                index.close()
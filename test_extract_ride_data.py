@@ -1,6 +1,55 @@
-from unittest import TestCase
+import os
+import json
+import sqlite3
+from tempfile import TemporaryDirectory
+from unittest import TestCase, skipUnless
 from datetime import datetime
-from extract_ride_data import ZeroLogHeader, LogEntry, ZeroLogEntry
+from extract_ride_data import ZeroLogHeader, LogEntry, ZeroLogEntry, ZeroLogFile, ZeroLogCheckpoint, \
+    ZeroLogFilter, JoinedLog, open_log_file, strip_compression_suffix
+from generate_logs import write_log
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+try:
+    import pandas
+except ImportError:
+    pandas = None
+
+MBB_LOG_HEADER = '''Zero MBB log
+
+Serial number      2015_mbb_48e0f7_00720
+VIN                538SD9Z37GCG06073
+Firmware rev.      51
+Board rev.         3
+Model              DSR
+
+Printing 6 of 6 log entries..
+
+ Entry    Time of Log            Event                      Conditions
++--------+----------------------+--------------------------+----------------------------------
+'''
+
+MBB_LOG_ENTRIES = [
+    ' 00001     05/13/2018 10:06:43   DEBUG: Sevcon Contactor Drive ON.',
+    ' 00002     05/13/2018 10:06:43   Module 00 Closing Contactor vmod: 93.175V, maxsys: 93.197V, minsys: 93.197V',
+    ' 00003     05/13/2018 10:10:35   Riding                     PackTemp: h 37C, l 36C, PackSOC:  9%,'
+    ' Vpack: 93.271V, MotAmps: 108, BattAmps:   1, Mods: 10, MotTemp:  43C',
+    ' 00004     05/13/2018 10:10:35   Batt Dischg Cur Limited    105 A (15.217391304347826%), MinCell: 3280mV,'
+    ' MaxPackTemp: 37C',
+    ' 00005     05/13/2018 10:11:15   Charging                   PackTemp: h 37C, l 36C, PackSOC:  9%,'
+    ' Vpack: 94.750V, BattAmps: -63, Mods: 01, MbbChgEn: Yes, BmsChgEn: No',
+    ' 00006     05/13/2018 10:21:15   Charging                   PackTemp: h 37C, l 36C, PackSOC: 21%,'
+    ' Vpack: 101.313V, BattAmps: -86, Mods: 01, MbbChgEn: Yes, BmsChgEn: No',
+]
+
+
+def write_mbb_log(directory, entry_lines, name='log.txt'):
+    filepath = os.path.join(directory, name)
+    with open(filepath, 'w') as log_file:
+        log_file.write(MBB_LOG_HEADER + '\n'.join(entry_lines) + '\n')
+    return filepath
 
 
 class TestLogHeader(TestCase):
@@ -195,3 +244,258 @@ class TestZeroLogEntry(TestCase):
                           'max discharge': '100cx10'},
                          log_entry.conditions)
         self.assertEqual(1, log_entry.battery_module_no())
+
+
+class TestZeroLogFile(TestCase):
+    def test_refresh(self):
+        with TemporaryDirectory() as directory:
+            log_file = ZeroLogFile(write_mbb_log(directory, MBB_LOG_ENTRIES))
+        self.assertEqual([1, 2, 3, 4, 5, 6], [entry.entry for entry in log_file.entries])
+        self.assertEqual([0, 1, 2, 2, 3, 3], [entry.segment_id for entry in log_file.entries])
+        self.assertEqual(['vmod', 'maxsys', 'minsys', 'Module', 'PackTemp (h)'],
+                         log_file.tabular_header_labels[8:13])
+
+    def test_typed_columns(self):
+        with TemporaryDirectory() as directory:
+            log_file = ZeroLogFile(write_mbb_log(directory, MBB_LOG_ENTRIES), verbose=-1)
+        kinds, values = log_file.typed_columns()
+        self.assertEqual(('number', 'text', 'timestamp'), (kinds['Vpack'], kinds['Mods'], kinds['timestamp']))
+        self.assertEqual([101.313, 3280.0], [values['Vpack'][5], values['MinCell'][3]])
+        self.assertEqual(['10', None], [values['Mods'][2], values['Mods'][3]])
+        self.assertEqual(1526206003.0, values['timestamp'][0])
+        self.assertNotIn('log_tag', kinds)
+
+    @skipUnless(pandas, 'pandas is not installed')
+    def test_to_dataframe(self):
+        with TemporaryDirectory() as directory:
+            log_file = ZeroLogFile(write_mbb_log(directory, MBB_LOG_ENTRIES), verbose=-1)
+        arrays = log_file.to_numpy()
+        self.assertEqual(numpy.dtype('datetime64[us]'), arrays['timestamp'].dtype)
+        self.assertEqual(numpy.datetime64('2018-05-13T10:06:43'), arrays['timestamp'][0])
+        self.assertTrue(numpy.isnan(arrays['Vpack'][0]))
+        frame = log_file.to_dataframe()
+        self.assertEqual((6, len(arrays)), frame.shape)
+        self.assertEqual('category', frame['event_type'].dtype.name)
+        self.assertEqual(['CHARGING', 'LIMIT', 'RIDING'], sorted(frame['event_type'].dropna().unique()))
+        self.assertEqual(9.0, frame['PackSOC'].min())
+
+    def test_incremental_refresh(self):
+        with TemporaryDirectory() as directory:
+            output_filepath = os.path.join(directory, 'log.jsonl')
+            log_file = ZeroLogFile(write_mbb_log(directory, MBB_LOG_ENTRIES[:4]))
+            log_file.output_to_file(output_filepath, 'jsonl', verbose=-1)
+            checkpoint = ZeroLogCheckpoint.for_log(log_file, [output_filepath])
+            self.assertEqual((4, 2, 'RIDING'),
+                             (checkpoint.entry, checkpoint.segment_id, checkpoint.segment_activity))
+            checkpoint_filepath = ZeroLogCheckpoint.filepath_for(os.path.join(directory, 'log'))
+            checkpoint.save(checkpoint_filepath)
+            checkpoint = ZeroLogCheckpoint.load(checkpoint_filepath)
+            self.assertTrue(checkpoint.covers_outputs([output_filepath]))
+
+            log_file = ZeroLogFile(write_mbb_log(directory, MBB_LOG_ENTRIES), checkpoint=checkpoint)
+            self.assertEqual([5, 6], [entry.entry for entry in log_file.entries])
+            self.assertEqual([3, 3], [entry.segment_id for entry in log_file.entries])
+            self.assertTrue(log_file.has_new_conditions_keys)
+            log_file.output_to_file(output_filepath, 'jsonl', append=True, verbose=-1)
+            with open(output_filepath) as output:
+                entries = [json.loads(line) for line in output]
+        self.assertEqual([1, 2, 3, 4, 5, 6], [entry['entry'] for entry in entries])
+
+    def test_incremental_refresh_of_renumbered_dump(self):
+        with TemporaryDirectory() as directory:
+            log_file = ZeroLogFile(write_mbb_log(directory, MBB_LOG_ENTRIES[:4]), verbose=-1)
+            checkpoint = ZeroLogCheckpoint.for_log(log_file, [])
+            self.assertEqual(3, len(checkpoint.signatures))
+            # The ring buffer shifted: entries are renumbered, and a new entry in the checkpoint's second
+            # and one with the clock stepped back follow it.
+            renumbered_entries = [' {:05d}'.format(number) + line[6:] for number, line in enumerate([
+                MBB_LOG_ENTRIES[1], MBB_LOG_ENTRIES[2], MBB_LOG_ENTRIES[3],
+                ' 00000     05/13/2018 10:10:35   Riding                     PackSOC:  8%',
+                ' 00000     05/13/2018 09:00:00   Riding                     PackSOC:  7%',
+                MBB_LOG_ENTRIES[4]], start=1)]
+            log_file = ZeroLogFile(write_mbb_log(directory, renumbered_entries), checkpoint=checkpoint, verbose=-1)
+            self.assertIs(checkpoint, log_file.checkpoint)
+            self.assertEqual([4, 5, 6], [entry.entry for entry in log_file.entries])
+
+            # Without the checkpointed entries in the dump, the whole log is read.
+            log_file = ZeroLogFile(write_mbb_log(directory, MBB_LOG_ENTRIES[4:]), checkpoint=checkpoint, verbose=-1)
+            self.assertIsNone(log_file.checkpoint)
+            self.assertEqual([5, 6], [entry.entry for entry in log_file.entries])
+
+    def test_incremental_refresh_with_filter(self):
+        entry_filter = ZeroLogFilter(components=['Battery'])
+        opening_entry = ' 00007     05/13/2018 10:21:20   Module 00 Opening Contactor vmod: 93.175V'
+        with TemporaryDirectory() as directory:
+            log_file = ZeroLogFile(write_mbb_log(directory, MBB_LOG_ENTRIES[:4]), entry_filter=entry_filter,
+                                   verbose=-1)
+            self.assertEqual([2], [entry.entry for entry in log_file.entries])
+            # The segment state is checkpointed where the last line left it, not at the last selected entry.
+            checkpoint = ZeroLogCheckpoint.for_log(log_file, [])
+            self.assertEqual((4, 2, 'RIDING'), (checkpoint.entry, checkpoint.segment_id, checkpoint.segment_activity))
+
+            # When the filter drops every new entry, the checkpoint still moves past them.
+            log_file = ZeroLogFile(write_mbb_log(directory, MBB_LOG_ENTRIES), checkpoint=checkpoint,
+                                   entry_filter=entry_filter, verbose=-1)
+            self.assertEqual([], log_file.entries)
+            checkpoint = ZeroLogCheckpoint.for_log(log_file, [], previous=checkpoint)
+            self.assertEqual((6, 3, 'CHARGING'), (checkpoint.entry, checkpoint.segment_id, checkpoint.segment_activity))
+
+            log_file = ZeroLogFile(write_mbb_log(directory, MBB_LOG_ENTRIES + [opening_entry]), checkpoint=checkpoint,
+                                   entry_filter=entry_filter, verbose=-1)
+            self.assertEqual([(7, 4, 'STOPPED')],
+                             [(entry.entry, entry.segment_id, entry.segment_activity) for entry in log_file.entries])
+
+    def test_sqlite_append_adds_columns(self):
+        with TemporaryDirectory() as directory:
+            output_filepath = os.path.join(directory, 'log.sqlite')
+            log_file = ZeroLogFile(write_mbb_log(directory, MBB_LOG_ENTRIES[:2]))
+            log_file.output_to_file(output_filepath, 'sqlite', verbose=-1)
+            log_file = ZeroLogFile(write_mbb_log(directory, MBB_LOG_ENTRIES),
+                                   checkpoint=ZeroLogCheckpoint.for_log(log_file, [output_filepath]))
+            log_file.output_to_file(output_filepath, 'sqlite', append=True, verbose=-1)
+            connection = sqlite3.connect(output_filepath)
+            rows = connection.execute('SELECT entry, vmod, "PackTemp (h)" FROM entries').fetchall()
+            connection.close()
+        self.assertEqual([('1', None, None), ('2', '93.175', None), ('3', None, '37'),
+                          ('4', None, None), ('5', None, '37'), ('6', None, '37')], rows)
+
+    def test_compressed_input_and_output(self):
+        with TemporaryDirectory() as directory:
+            plain_filepath = write_mbb_log(directory, MBB_LOG_ENTRIES)
+            plain_log_file = ZeroLogFile(plain_filepath)
+            plain_log_file.output_to_file(os.path.join(directory, 'log.csv'), 'csv', verbose=-1)
+            for suffix in ['.gz', '.bz2', '.xz']:
+                compressed_filepath = plain_filepath + suffix
+                with open(plain_filepath) as plain_file, open_log_file(compressed_filepath, 'w') as compressed_file:
+                    compressed_file.write(plain_file.read())
+                self.assertEqual(plain_filepath, strip_compression_suffix(compressed_filepath))
+                log_file = ZeroLogFile(compressed_filepath)
+                self.assertEqual(plain_log_file.to_json(), log_file.to_json())
+                output_filepath = os.path.join(directory, 'log.csv' + suffix)
+                log_file.output_to_file(output_filepath, 'csv', compresslevel=1, verbose=-1)
+                with open_log_file(output_filepath) as output, open(os.path.join(directory, 'log.csv')) as expected:
+                    self.assertEqual(expected.read(), output.read())
+
+    def test_filters_keep_segments(self):
+        with TemporaryDirectory() as directory:
+            log_filepath = write_mbb_log(directory, MBB_LOG_ENTRIES)
+            log_file = ZeroLogFile(log_filepath, entry_filter=ZeroLogFilter(
+                since=datetime(2018, 5, 13, 10, 10), until=datetime(2018, 5, 13, 10, 11, 15), components=['mbb']))
+            self.assertEqual([(3, 2, 'RIDING'), (4, 2, 'RIDING'), (5, 3, 'CHARGING')],
+                             [(entry.entry, entry.segment_id, entry.segment_activity) for entry in log_file.entries])
+            log_file = ZeroLogFile(log_filepath, entry_filter=ZeroLogFilter(event_levels=['DEBUG']))
+            self.assertEqual([1], [entry.entry for entry in log_file.entries])
+
+    def test_projection_skips_unwanted_conditions(self):
+        with TemporaryDirectory() as directory:
+            log_file = ZeroLogFile(write_mbb_log(directory, MBB_LOG_ENTRIES), entry_filter=ZeroLogFilter(
+                columns=['entry', 'event', 'MinCell']))
+        self.assertEqual(['entry', 'event', 'MinCell'], log_file.tabular_header_labels)
+        self.assertEqual([{}, {}, {}, {'MinCell': '3280mV'}, {}, {}], [entry.conditions for entry in log_file.entries])
+        self.assertEqual('4,Batt Dischg Cur Limited,3.28', log_file.entries[3].to_csv(log_file.tabular_header_labels))
+
+    def test_projection_of_derived_conditions(self):
+        with TemporaryDirectory() as directory:
+            log_file = ZeroLogFile(write_log(os.path.join(directory, 'mbb.txt'), entries_count=2000, seed=1),
+                                   entry_filter=ZeroLogFilter(columns=['timestamp', 'EVSE Voltage']), verbose=-1)
+        self.assertEqual(['timestamp', 'EVSE Voltage'], log_file.tabular_header_labels)
+        charge_tank_entries = [entry for entry in log_file.entries if entry.component == 'Charge Tank']
+        self.assertTrue(charge_tank_entries)
+        for entry in charge_tank_entries:
+            self.assertEqual(['EVSE Voltage'], list(entry.conditions))
+            self.assertRegex(entry.conditions['EVSE Voltage'], r'^\d+Vac$')
+
+    def test_filter_timestamp_text(self):
+        entry_filter = ZeroLogFilter(since=datetime(2018, 5, 13), until=datetime(2019, 1, 1))
+        self.assertTrue(entry_filter.accepts_timestamp_text('12/31/2018 23:59:59'))
+        self.assertFalse(entry_filter.accepts_timestamp_text('01/01/2019 00:00:01'))
+        self.assertFalse(entry_filter.accepts_timestamp_text('05/12/2018 10:00:00'))
+        self.assertFalse(entry_filter.accepts_timestamp_text(''))
+
+    def test_schema_registry(self):
+        entry_lines = MBB_LOG_ENTRIES + [
+            ' 00007     05/13/2018 10:21:16   Charging                   PackSOC: 22%, Vpack: 101.4V, Dummy: 1']
+        with TemporaryDirectory() as directory:
+            log_filepath = write_mbb_log(directory, entry_lines)
+            discovered = ZeroLogFile(log_filepath)
+            registered = ZeroLogFile(log_filepath, schema_registry=True)
+            self.assertEqual('other_conditions', registered.tabular_header_labels[-1])
+            self.assertNotIn('Dummy', registered.tabular_header_labels)
+            self.assertIn('Dummy', discovered.tabular_header_labels)
+            self.assertEqual('Dummy=1', registered.entries[-1].other_conditions)
+            registered.output_to_file(os.path.join(directory, 'loaded.csv'), 'csv', verbose=-1)
+            entries_count = ZeroLogFile.stream_to_file(log_filepath, os.path.join(directory, 'streamed.csv'), 'csv',
+                                                       verbose=-1)
+            self.assertEqual(len(entry_lines), entries_count)
+            with open(os.path.join(directory, 'loaded.csv')) as loaded, \
+                    open(os.path.join(directory, 'streamed.csv')) as streamed:
+                self.assertEqual(loaded.read(), streamed.read())
+
+    def test_long_and_split_layouts(self):
+        with TemporaryDirectory() as directory:
+            log_file = ZeroLogFile(write_mbb_log(directory, MBB_LOG_ENTRIES))
+            long_filepath = os.path.join(directory, 'log.long.csv')
+            log_file.output_to_long_file(long_filepath, 'csv', verbose=-1)
+            with open(long_filepath) as long_output:
+                long_lines = long_output.read().splitlines()
+            self.assertEqual(','.join(ZeroLogFile.common_headers + ['condition', 'value']), long_lines[0])
+            self.assertEqual(1 + sum(len(entry.conditions) or 1 for entry in log_file.entries), len(long_lines))
+            self.assertIn('4,2,RIDING,2018-05-13 10:10:35,MBB,LIMIT,,Batt Dischg Cur Limited,MinCell,3.28',
+                          long_lines)
+
+            output_filepaths = log_file.output_split_files(os.path.join(directory, 'log'), 'tsv', verbose=-1)
+            self.assertEqual(['Controller', 'Battery', 'MBB_RIDING', 'MBB_LIMIT', 'MBB_CHARGING'],
+                             list(output_filepaths))
+            with open(output_filepaths['Battery']) as battery_output:
+                battery_lines = battery_output.read().splitlines()
+            self.assertEqual(ZeroLogFile.common_headers + ['vmod', 'maxsys', 'minsys', 'Module'],
+                             battery_lines[0].split('\t'))
+            self.assertEqual(2, len(battery_lines))
+
+    def test_segment_files(self):
+        with TemporaryDirectory() as directory:
+            log_file = ZeroLogFile(write_mbb_log(directory, MBB_LOG_ENTRIES))
+            output_filepaths = log_file.output_segment_files(os.path.join(directory, 'log'), 'jsonl', max_workers=2,
+                                                             use_processes=False, verbose=-1)
+            self.assertEqual(['log.segment-0000-STOPPED-20180513T100643.jsonl',
+                              'log.segment-0001-STARTED-20180513T100643.jsonl',
+                              'log.segment-0002-RIDING-20180513T101035.jsonl',
+                              'log.segment-0003-CHARGING-20180513T101115.jsonl'],
+                             [os.path.basename(output_filepath) for output_filepath in output_filepaths])
+            with open(output_filepaths[2]) as segment_output:
+                self.assertEqual([3, 4], [json.loads(line)['entry'] for line in segment_output])
+
+
+class TestJoinedLog(TestCase):
+    def test_concurrent_load_and_deep_refresh(self):
+        with TemporaryDirectory() as directory:
+            primary_filepath = write_mbb_log(directory, MBB_LOG_ENTRIES, name='primary.txt')
+            secondary_filepath = write_mbb_log(directory, MBB_LOG_ENTRIES[:3], name='secondary.txt')
+            joined_log = JoinedLog.load(primary_filepath, {'other': secondary_filepath}, max_workers=2, verbose=-1)
+            self.assertEqual(9, len(joined_log.entries))
+            self.assertEqual([None, None, 'other', 'other', None, None, 'other', None, None],
+                             [entry.log_tag for entry in joined_log.entries])
+            self.assertEqual([1, 2, 1, 2, 3, 4, 3, 5, 6], [entry.entry for entry in joined_log.entries])
+
+            joined_log.refresh(deep=True)
+            self.assertEqual(9, len(joined_log.entries))
+            primary_entries = joined_log.primary_log.entries
+            write_mbb_log(directory, MBB_LOG_ENTRIES, name='secondary.txt')
+            stat = os.stat(secondary_filepath)
+            os.utime(secondary_filepath, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000000))
+            self.assertEqual([joined_log.secondary_logs['other']], joined_log.reload_changed_logs())
+            joined_log.refresh()
+            self.assertIs(primary_entries, joined_log.primary_log.entries)
+            self.assertEqual(12, len(joined_log.entries))
+
+    @skipUnless(pandas, 'pandas is not installed')
+    def test_to_dataframe(self):
+        with TemporaryDirectory() as directory:
+            primary_log = ZeroLogFile(write_mbb_log(directory, MBB_LOG_ENTRIES, name='primary.txt'), verbose=-1)
+            secondary_log = ZeroLogFile(write_mbb_log(directory, MBB_LOG_ENTRIES[:3], name='secondary.txt'),
+                                        verbose=-1)
+        frame = primary_log.join_log('other', secondary_log).to_dataframe()
+        self.assertEqual(9, len(frame))
+        self.assertEqual('category', frame['log_tag'].dtype.name)
+        self.assertEqual(3, (frame['log_tag'] == 'other').sum())
+        self.assertEqual([93.175, 93.175], frame['vmod'].dropna().tolist())
@@ -0,0 +1,40 @@
+import os
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+from extract_ride_data import ZeroLogFile
+from generate_logs import write_log, generate_log_lines
+
+
+class TestGenerateLogs(TestCase):
+    def test_mbb_log(self):
+        with TemporaryDirectory() as directory:
+            log_file = ZeroLogFile(write_log(os.path.join(directory, 'mbb.txt.gz'), entries_count=2000, seed=1),
+                                   verbose=-1)
+        self.assertEqual('MBB', log_file.header.log_source)
+        self.assertEqual(2000, log_file.header.log_entries_count_expected)
+        self.assertEqual(list(range(1, 2001)), [entry.entry for entry in log_file.entries])
+        events = {entry.event for entry in log_file.entries}
+        for event in ['Riding', 'Charging', 'Module Closing Contactor', 'Module Opening Contactor',
+                      'Batt Dischg Cur Limited', 'Low Chassis Isolation', 'Module not connected',
+                      'Battery module contactor closed', 'Charger 6 Charging']:
+            self.assertIn(event, events)
+        self.assertEqual({'STARTED', 'RIDING', 'STOPPED', 'CHARGING'},
+                         {entry.segment_activity for entry in log_file.entries})
+        charge_tank_entry = next(entry for entry in log_file.entries if entry.component == 'Charge Tank')
+        self.assertIn('EVSE Amps', charge_tank_entry.conditions)
+
+    def test_bms_log(self):
+        with TemporaryDirectory() as directory:
+            log_file = ZeroLogFile(write_log(os.path.join(directory, 'bms.txt'), source='BMS', entries_count=500),
+                                   verbose=-1)
+        self.assertEqual('BMS', log_file.header.log_source)
+        self.assertEqual(500, len(log_file.entries))
+        self.assertEqual({'Charge level', 'Discharge level', 'Contactor was Opened'},
+                         {entry.event for entry in log_file.entries})
+        self.assertIn('SOC', log_file.tabular_header_labels)
+
+    def test_reproducible(self):
+        self.assertEqual(list(generate_log_lines(entries_count=300, seed=7)),
+                         list(generate_log_lines(entries_count=300, seed=7)))
+        self.assertNotEqual(list(generate_log_lines(entries_count=300, seed=7)),
+                            list(generate_log_lines(entries_count=300, seed=8)))
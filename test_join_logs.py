@@ -0,0 +1,65 @@
+import os
+import json
+from datetime import datetime
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+from extract_ride_data import ZeroLogFile, ZeroLogFilter
+from generate_logs import write_log
+from join_logs import ExternalJoin, LOG_TAG_LABEL
+
+
+class TestExternalJoin(TestCase):
+    def test_matches_joined_log(self):
+        with TemporaryDirectory() as directory:
+            mbb_filepath = write_log(os.path.join(directory, 'mbb.txt'), entries_count=600, seed=3)
+            bms_filepath = write_log(os.path.join(directory, 'bms.txt.gz'), source='BMS', entries_count=300, seed=4)
+            joined_log = ZeroLogFile(mbb_filepath, verbose=-1).join_log('bms', ZeroLogFile(bms_filepath, verbose=-1))
+            expected = [(entry.timestamp, entry.log_tag, entry.entry, entry.event) for entry in joined_log.entries]
+
+            run_dir = os.path.join(directory, 'runs')
+            os.mkdir(run_dir)
+            external_join = ExternalJoin(mbb_filepath, {'bms': bms_filepath}, memory_budget=20000)
+            external_join.spill_runs(run_dir)
+            self.assertGreater(len(external_join.run_filepaths), 3)
+            self.assertEqual(expected, [(entry.timestamp, entry.log_tag, entry.entry, entry.event)
+                                        for entry in external_join.merged_entries()])
+
+            csv_filepath = os.path.join(directory, 'joined.csv')
+            self.assertEqual(900, external_join.output_to_file(csv_filepath, 'csv', verbose=-1))
+            with open(csv_filepath) as csv_file:
+                header = csv_file.readline().strip().split(',')
+                rows = csv_file.readlines()
+            self.assertIn(LOG_TAG_LABEL, header)
+            self.assertIn('SOC', header)
+            self.assertIn('Vpack', header)
+            self.assertEqual(900, len(rows))
+
+            json_filepath = os.path.join(directory, 'joined.json')
+            external_join.output_to_file(json_filepath, 'json', verbose=-1)
+            with open(json_filepath) as json_file:
+                self.assertEqual(joined_log.to_json(), json.load(json_file))
+
+    def test_cascade_merge(self):
+        with TemporaryDirectory() as directory:
+            mbb_filepath = write_log(os.path.join(directory, 'mbb.txt'), entries_count=600, seed=3)
+            bms_filepath = write_log(os.path.join(directory, 'bms.txt'), source='BMS', entries_count=300, seed=4)
+            entry_filter = ZeroLogFilter(since=datetime(2018, 5, 13, 12))
+            joined_log = ZeroLogFile(mbb_filepath, entry_filter=entry_filter, verbose=-1).join_log(
+                'bms', ZeroLogFile(bms_filepath, entry_filter=entry_filter, verbose=-1))
+            expected = [(entry.timestamp, entry.log_tag, entry.entry) for entry in joined_log.entries]
+            self.assertTrue(expected)
+
+            run_dir = os.path.join(directory, 'runs')
+            os.mkdir(run_dir)
+            external_join = ExternalJoin(mbb_filepath, {'bms': bms_filepath}, memory_budget=2000, fan_in=3,
+                                         entry_filter=entry_filter)
+            external_join.spill_runs(run_dir)
+            self.assertGreater(len(external_join.run_filepaths), 9)
+            self.assertEqual(4096, external_join.run_buffer_size)
+            self.assertEqual(expected, [(entry.timestamp, entry.log_tag, entry.entry)
+                                        for entry in external_join.merged_entries()])
+            self.assertGreater(external_join.merge_passes, 2)
+            # Only the spilled runs and the last pass's runs are left.
+            self.assertLessEqual(len(os.listdir(run_dir)), len(external_join.run_filepaths) + 3)
+        with self.assertRaises(ValueError):
+            ExternalJoin(mbb_filepath, {}, fan_in=1)
@@ -0,0 +1,98 @@
+import os
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+from merge_logs import LogDump, LogMerger, group_dumps_by_identity, renumber_log_line
+
+MBB_HEADER = '''Zero MBB log
+
+Serial number      2015_mbb_48e0f7_00720
+VIN                {vin}
+Firmware rev.      51
+Board rev.         3
+Model              DSR
+
+Printing {count} of {count} log entries..
+
+ Entry    Time of Log            Event                      Conditions
++--------+----------------------+--------------------------+----------------------------------
+'''
+
+ENTRY_MESSAGES = [
+    '05/13/2018 10:06:43   DEBUG: Sevcon Contactor Drive ON.',
+    '05/13/2018 10:06:43   Module 00 Closing Contactor vmod: 93.175V, maxsys: 93.197V',
+    '05/13/2018 10:06:43   Module 00 Closing Contactor vmod: 93.175V, maxsys: 93.197V',
+    '05/13/2018 10:10:35   Riding                     PackSOC:  9%, Vpack: 93.271V',
+    '05/13/2018 10:11:04   External Chg 0 Charger 2 Connected',
+    '05/13/2018 10:11:15   Charging                   PackSOC:  9%, Vpack: 94.750V',
+    '05/13/2018 10:21:15   Charging                   PackSOC: 21%, Vpack: 101.313V',
+    '05/13/2018 10:21:15   Charging                   PackSOC: 21%, Vpack: 101.313V',
+    '05/13/2018 10:31:15   Charging                   PackSOC: 32%, Vpack: 103.378V',
+]
+
+
+def write_dump(directory, name, messages, first_entry_no=1, vin='538SD9Z37GCG06073'):
+    filepath = os.path.join(directory, name)
+    with open(filepath, 'w') as dump_file:
+        dump_file.write(MBB_HEADER.format(vin=vin, count=len(messages)))
+        for entry_no, message in enumerate(messages, first_entry_no):
+            dump_file.write(' {:05d}     {}\n'.format(entry_no % 100000, message))
+    return filepath
+
+
+class TestLogMerger(TestCase):
+    def merge(self, *dump_messages, **kwargs):
+        with TemporaryDirectory() as directory:
+            filepaths = [write_dump(directory, 'dump{}.txt'.format(i), messages, **kwargs)
+                         for i, messages in enumerate(dump_messages)]
+            groups = group_dumps_by_identity(list(reversed(filepaths)))
+            self.assertEqual(1, len(groups))
+            merger = LogMerger(list(groups.values())[0])
+            output_filepath = os.path.join(directory, 'merged.txt')
+            merger.output_to_file(output_filepath, line_sep='\n')
+            with open(output_filepath) as merged_file:
+                merged_lines = merged_file.read().splitlines()
+        return merger, merged_lines
+
+    def test_overlapping_dumps(self):
+        merger, merged_lines = self.merge(ENTRY_MESSAGES[:7], ENTRY_MESSAGES[2:])
+        self.assertEqual(len(ENTRY_MESSAGES), merger.entries_emitted)
+        self.assertEqual(5, merger.entries_skipped)
+        self.assertIn('Printing 9 of 9 log entries..', merged_lines)
+        entry_lines = merged_lines[-len(ENTRY_MESSAGES):]
+        self.assertEqual([' {:05d}     {}'.format(i, message) for i, message in enumerate(ENTRY_MESSAGES, 1)],
+                         entry_lines)
+
+    def test_repeated_entries_at_boundary_second(self):
+        merger, _ = self.merge(ENTRY_MESSAGES[:2], ENTRY_MESSAGES[:3])
+        self.assertEqual(3, merger.entries_emitted)
+        merger, _ = self.merge(ENTRY_MESSAGES[:7], ENTRY_MESSAGES[4:8])
+        self.assertEqual(8, merger.entries_emitted)
+
+    def test_clock_step_back_after_overlap(self):
+        # The clock was reset while riding, between the two dumps.
+        stepped_messages = ['05/13/2018 09:00:05   Riding                     PackSOC: 30%, Vpack: 99.100V',
+                            '05/13/2018 09:00:35   Riding                     PackSOC: 29%, Vpack: 98.900V']
+        merger, merged_lines = self.merge(ENTRY_MESSAGES[:7], ENTRY_MESSAGES[4:7] + stepped_messages)
+        self.assertEqual(9, merger.entries_emitted)
+        self.assertEqual(3, merger.entries_skipped)
+        self.assertEqual([' {:05d}     {}'.format(i, message)
+                          for i, message in enumerate(ENTRY_MESSAGES[:7] + stepped_messages, 1)],
+                         merged_lines[-9:])
+
+    def test_entry_number_wraparound(self):
+        with TemporaryDirectory() as directory:
+            dump = LogDump(write_dump(directory, 'dump.txt', ENTRY_MESSAGES, first_entry_no=99997))
+            self.assertEqual(list(range(99997, 99997 + len(ENTRY_MESSAGES))),
+                             [entry_no for entry_no, _ in dump.read_lines()])
+
+    def test_different_bikes(self):
+        with TemporaryDirectory() as directory:
+            filepaths = [write_dump(directory, 'a.txt', ENTRY_MESSAGES),
+                         write_dump(directory, 'b.txt', ENTRY_MESSAGES, vin='538SD9Z37GCG06074')]
+            self.assertEqual(2, len(group_dumps_by_identity(filepaths)))
+            with self.assertRaises(ValueError):
+                LogMerger([LogDump(filepath) for filepath in filepaths])
+
+    def test_renumber_log_line(self):
+        self.assertEqual(' 00012     05/13/2018 10:06:43   Riding',
+                         renumber_log_line(' 00001     05/13/2018 10:06:43   Riding', 12))
@@ -0,0 +1,81 @@
+import os
+import json
+import shutil
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+from generate_logs import write_log
+from pack_health import PackHealth, update_pack_health, linear_trend
+
+
+class TestPackHealth(TestCase):
+    def test_linear_trend(self):
+        self.assertEqual(2.0, linear_trend([1.0, None, 5.0, 7.0]))
+        self.assertIsNone(linear_trend([None, 3.0]))
+
+    def test_add_cycle(self):
+        pack_health = PackHealth('2015_pack_00345')
+        for start, end in [('2018-05-13 10:00:00', '2018-05-13 10:30:00'),
+                           ('2018-05-13 11:00:00', '2018-05-13 11:10:00'),
+                           ('2018-05-13 12:00:00', None),
+                           # Overlaps the first two and spans longer than either.
+                           ('2018-05-13 10:20:00', '2018-05-13 11:05:00'),
+                           # Within the longer one.
+                           ('2018-05-13 10:50:00', '2018-05-13 10:55:00')]:
+            pack_health.add_cycle(start, {'end': end})
+        self.assertEqual(['2018-05-13 10:20:00', '2018-05-13 12:00:00'], pack_health.cycle_starts)
+        self.assertEqual(sorted(pack_health.cycles), pack_health.cycle_starts)
+
+    def test_update_pack_health(self):
+        with TemporaryDirectory() as directory:
+            mbb_filepath = write_log(os.path.join(directory, 'mbb.txt'), entries_count=3000, seed=1)
+            bms_filepath = write_log(os.path.join(directory, 'bms.txt'), source='BMS', entries_count=3000, seed=2)
+            updated = update_pack_health([mbb_filepath, bms_filepath], directory, verbose=-1)
+            self.assertEqual(['538SD9Z37GCG06073', '2015_pack_00345'], list(updated))
+
+            bike_health = updated['538SD9Z37GCG06073']
+            self.assertEqual(26, len(bike_health.cycles))
+            first_cycle = bike_health.cycles['2018-05-13 14:16:16']
+            self.assertEqual('2018-05-13 14:26:16', first_cycle['end'])
+            self.assertEqual(1.0, first_cycle['temp_spread_c'])
+            self.assertEqual(['0', '1'], sorted(bike_health.modules))
+
+            pack_health = updated['2015_pack_00345']
+            self.assertEqual(22, len(pack_health.cycles))
+            first_cycle = pack_health.cycles['2018-05-13 10:08:43']
+            self.assertEqual((90.0, 100.0), (first_cycle['soc_start'], first_cycle['soc_end']))
+            self.assertEqual((30.0, 3910.0), (first_cycle['imbalance_mv'], first_cycle['min_cell_mv']))
+            self.assertLess(pack_health.trends()['min_cell_mv'], 0)
+
+            health_filepath = PackHealth.filepath_for(directory, '2015_pack_00345')
+            with open(health_filepath) as health_file:
+                health_json = json.load(health_file)
+            self.assertEqual(22, len(health_json['cycles']['start']))
+            self.assertEqual(health_json, PackHealth.load(health_filepath, '2015_pack_00345').to_json())
+
+            # Unchanged dumps are skipped; an overlapping dump of the same pack adds no cycle twice.
+            self.assertEqual({}, update_pack_health([mbb_filepath, bms_filepath], directory, verbose=-1))
+            copy_filepath = shutil.copy(bms_filepath, os.path.join(directory, 'bms-again.txt'))
+            updated = update_pack_health([copy_filepath], directory, verbose=-1)
+            self.assertEqual(22, len(updated['2015_pack_00345'].cycles))
+            self.assertEqual(2, len(updated['2015_pack_00345'].dumps))
+
+    def test_overlapping_dumps(self):
+        with TemporaryDirectory() as directory:
+            bms_filepath = write_log(os.path.join(directory, 'bms.txt'), source='BMS', entries_count=3000, seed=2)
+            # A later dump whose ring buffer has overwritten the start of the first charge cycle.
+            with open(bms_filepath) as log_file:
+                lines = log_file.read().splitlines(keepends=True)
+            first_entry = next(index for index, line in enumerate(lines) if line.startswith(' 00001 '))
+            truncated_filepath = os.path.join(directory, 'bms-later.txt')
+            with open(truncated_filepath, 'w') as truncated_file:
+                truncated_file.writelines(lines[:first_entry] + lines[first_entry + 2:])
+
+            for order, log_filepaths in enumerate([[bms_filepath, truncated_filepath],
+                                                   [truncated_filepath, bms_filepath]]):
+                output_dir = os.path.join(directory, 'health-{}'.format(order))
+                os.mkdir(output_dir)
+                for log_filepath in log_filepaths:
+                    pack_health = update_pack_health([log_filepath], output_dir, verbose=-1)['2015_pack_00345']
+                self.assertEqual(22, len(pack_health.cycles))
+                self.assertEqual('2018-05-13 10:08:43', min(pack_health.cycles))
+                self.assertNotIn('2018-05-13 10:32:43', pack_health.cycles)
@@ -0,0 +1,61 @@
+from tempfile import TemporaryDirectory
+from unittest import TestCase, skipUnless
+from extract_ride_data import ZeroLogFile
+from query_logs import LogColumns, LogQuery, ArrayBackend, NumpyBackend, numpy, NUMBER, TEXT
+from test_extract_ride_data import MBB_LOG_ENTRIES, write_mbb_log
+
+
+class TestLogQuery(TestCase):
+    backend = ArrayBackend()
+
+    def setUp(self):
+        with TemporaryDirectory() as directory:
+            log_file = ZeroLogFile(write_mbb_log(directory, MBB_LOG_ENTRIES), verbose=-1)
+        self.columns = LogColumns.from_log_file(log_file, backend=self.backend)
+
+    def entries_matching(self, expression, batch_size=4):
+        return [row['entry'] for row in LogQuery(expression, self.columns).rows(['entry'], batch_size=batch_size)]
+
+    def test_columns(self):
+        self.assertEqual(6, self.columns.length)
+        self.assertEqual(NUMBER, self.columns.kinds['Vpack'])
+        self.assertEqual(TEXT, self.columns.kinds['Mods'])
+        self.assertEqual({'entry': 3, 'Vpack': 93.271, 'MotTemp': 43.0, 'MinCell': None, 'component': 'MBB',
+                          'timestamp': '2018-05-13 10:10:35'},
+                         self.columns.row(2, ['entry', 'Vpack', 'MotTemp', 'MinCell', 'component', 'timestamp']))
+
+    def test_filters(self):
+        self.assertEqual([3], self.entries_matching("PackSOC < 20 and component == 'MBB' and MotTemp > 40"))
+        self.assertEqual([3, 5], self.entries_matching("PackSOC < 10"))
+        self.assertEqual([4], self.entries_matching("MinCell > 3000"))
+        self.assertEqual([4], self.entries_matching("MinCell / 1000 == 3.28"))
+        self.assertEqual([5, 6], self.entries_matching("col('PackTemp (h)') >= 37 and BattAmps < -50"))
+        self.assertEqual([1, 2], self.entries_matching("component in ['Controller', 'Battery']"))
+        self.assertEqual([5, 6], self.entries_matching("Mods == '01'"))
+        self.assertEqual([1, 2, 3, 4], self.entries_matching("timestamp < '2018-05-13 10:11'"))
+        self.assertEqual([2, 3], self.entries_matching("2 <= entry <= 3 or not 1 < 2"))
+        self.assertEqual([1, 2, 3, 4, 5, 6], self.entries_matching("event_type != 'LIMIT' or event_type == 'LIMIT'"))
+
+    def test_column_names(self):
+        # Only the names the expression compiles to columns count; text that merely mentions a column does not.
+        query = LogQuery("col('PackTemp (h)') >= 37 and BattAmps < -50 and Mods != 'Vpack' and BattAmps < 0",
+                         self.columns)
+        self.assertEqual(['PackTemp (h)', 'BattAmps', 'Mods'], query.column_names)
+
+    def test_invalid_queries(self):
+        for expression in ["PackSOC", "__import__('os')", "Unknown > 1", "component > 'A'", "PackSOC == 'x'",
+                           "PackSOC < 20 and", "component in Vpack"]:
+            with self.assertRaises(ValueError, msg=expression):
+                LogQuery(expression, self.columns)
+
+    def test_aggregates(self):
+        query = LogQuery("Vpack > 0", self.columns)
+        self.assertEqual({None: {'count': 3, 'max:Vpack': 101.313, 'min:PackSOC': 9.0}},
+                         query.aggregate([('count', None), ('max', 'Vpack'), ('min', 'PackSOC')], batch_size=2))
+        self.assertEqual({'RIDING': {'count': 1, 'mean:BattAmps': 1.0}, 'CHARGING': {'count': 2, 'mean:BattAmps': -74.5}},
+                         query.aggregate([('count', None), ('mean', 'BattAmps')], group_by='event_type'))
+
+
+@skipUnless(numpy, 'NumPy is not installed')
+class TestNumpyLogQuery(TestLogQuery):
+    backend = NumpyBackend() if numpy else None
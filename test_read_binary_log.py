@@ -0,0 +1,109 @@
+import os
+from datetime import datetime, timedelta
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+from read_binary_log import ZeroBinaryLogFile, write_binary_log, escape, unescape
+
+MBB_HEADER_VALUES = {
+    'serial_no': '2015_mbb_48e0f7_00720',
+    'vin': '538SD9Z37GCG06073',
+    'firmware_rev': 51,
+    'board_rev': 3,
+    'model': 'DSR',
+}
+
+START_TIME = datetime(2018, 5, 13, 10, 6, 43)
+
+# A synthetic MBB dump, assembled byte by byte rather than by write_binary_log, but to the same unverified
+# layouts: it is not from a bike, so it only checks the reader against the layouts it assumes.
+# Its ring buffer wraps, starts with the torn tail of an overwritten record, and has escaped framing bytes.
+MBB_FIXTURE_FILEPATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures',
+                                    'synthetic_MBB_2018-05-13.bin')
+
+MBB_RECORDS = [
+    (0x33, START_TIME, (1, 0, 93175, 93195, 93195, 86775, 95)),
+    (0x3d, START_TIME, (0,)),
+    (0x09, START_TIME, (1,)),
+    (0x2c, START_TIME + timedelta(seconds=5), (25, 24, 88, 93100, 40, 30, 1200, 55, 0b10, 60, 22, 46213)),
+    (0x39, START_TIME + timedelta(seconds=6), (120, 45, 3300, 26)),
+    (0x55, START_TIME + timedelta(seconds=7), (0x01, 0xb2, 0xfe)),
+    (0x09, START_TIME + timedelta(seconds=9), (0,)),
+    (0x33, START_TIME + timedelta(seconds=9), (0, 0, 93000, 0, 0, 0, 0)),
+    (0x2d, START_TIME + timedelta(minutes=20), (25, 24, 90, 95000, -80, 1, 1, 0)),
+]
+
+
+class TestReadBinaryLog(TestCase):
+    def test_escape(self):
+        record = bytes([0x01, 0xb2, 0xfe, 0xff])
+        self.assertEqual(bytes([0x01, 0xfe, 0x4d, 0xfe, 0x01, 0xff]), escape(record))
+        self.assertEqual(record, unescape(escape(record)))
+
+    def test_mbb_log(self):
+        with TemporaryDirectory() as directory:
+            log_filepath = os.path.join(directory, '538SD9Z37GCG06073_MBB_2018-05-13.bin')
+            write_binary_log(log_filepath, MBB_HEADER_VALUES, MBB_RECORDS, wrap_at=40)
+            log_file = ZeroBinaryLogFile(log_filepath)
+        self.assertEqual('MBB', log_file.header.log_source)
+        self.assertEqual('538SD9Z37GCG06073', log_file.header.mbb_metadata.vin)
+        self.assertEqual('51', log_file.header.mbb_metadata.firmware_rev)
+        self.assertEqual(len(MBB_RECORDS), log_file.header.log_entries_count_expected)
+        self.assertEqual(list(range(1, len(MBB_RECORDS) + 1)), [entry.entry for entry in log_file.entries])
+        self.assertEqual(['Module Closing Contactor', 'Battery module contactor closed', 'Key On', 'Riding',
+                          'Batt Dischg Cur Limited', '', 'Key Off', 'Module Opening Contactor', 'Charging'],
+                         [entry.event for entry in log_file.entries])
+        self.assertEqual(['STARTED', 'STARTED', 'STARTED', 'RIDING', 'RIDING', 'RIDING', 'RIDING', 'STOPPED',
+                          'CHARGING'], [entry.segment_activity for entry in log_file.entries])
+        riding_entry = log_file.entries[3]
+        self.assertEqual(START_TIME + timedelta(seconds=5), riding_entry.timestamp)
+        self.assertEqual('93.100V', riding_entry.conditions['Vpack'])
+        self.assertEqual('1200', riding_entry.conditions['MotRPM'])
+        self.assertEqual('current_limited', log_file.entries[4].special_condition)
+        self.assertEqual('UNKNOWN', log_file.entries[5].event_type)
+        self.assertIn('Vpack', log_file.tabular_header_labels)
+
+    def test_records_split_by_the_wrap_point(self):
+        with TemporaryDirectory() as directory:
+            log_filepath = os.path.join(directory, 'log_MBB.bin')
+            write_binary_log(log_filepath, MBB_HEADER_VALUES, MBB_RECORDS)
+            expected = [(entry.entry, entry.event, entry.conditions) for entry in ZeroBinaryLogFile(log_filepath).entries]
+            events_size = os.path.getsize(log_filepath) - 0x400 - 16
+            for wrap_at in range(1, events_size):
+                write_binary_log(log_filepath, MBB_HEADER_VALUES, MBB_RECORDS, wrap_at=wrap_at)
+                self.assertEqual(expected, [(entry.entry, entry.event, entry.conditions)
+                                            for entry in ZeroBinaryLogFile(log_filepath).entries], wrap_at)
+
+    def test_mbb_fixture(self):
+        log_file = ZeroBinaryLogFile(MBB_FIXTURE_FILEPATH)
+        self.assertEqual('MBB', log_file.header.log_source)
+        self.assertEqual('2015_mbb_000000_00000', log_file.header.mbb_metadata.serial_no)
+        self.assertEqual('538SD9Z37GCG06073', log_file.header.mbb_metadata.vin)
+        self.assertEqual(['Key On', 'Module Closing Contactor', 'Battery module contactor closed', 'Riding',
+                          'Batt Dischg Cur Limited', '', 'Key Off', 'Module Opening Contactor', 'Charging'],
+                         [entry.event for entry in log_file.entries])
+        self.assertEqual([START_TIME, START_TIME + timedelta(minutes=20)],
+                         [log_file.entries[0].timestamp, log_file.entries[-1].timestamp])
+        self.assertEqual({'vmod': '93.106V', 'maxsys': '93.195V', 'minsys': '93.175V', 'diff': '0.020V',
+                          'vcap': '86.775V', 'prechg': '95%', 'Module': '00'}, log_file.entries[1].conditions)
+        self.assertEqual(('46213km', '1200'), (log_file.entries[3].conditions['Odo'],
+                                               log_file.entries[3].conditions['MotRPM']))
+        self.assertEqual('UNKNOWN', log_file.entries[5].event_type)
+        self.assertEqual(['STOPPED', 'STARTED', 'STARTED', 'RIDING', 'RIDING', 'RIDING', 'RIDING', 'STOPPED',
+                          'CHARGING'], [entry.segment_activity for entry in log_file.entries])
+        self.assertEqual(('-80', 'Yes'), (log_file.entries[8].conditions['BattAmps'],
+                                          log_file.entries[8].conditions['MbbChgEn']))
+
+    def test_bms_log(self):
+        header_values = {'serial_no': '2015_bms_17a0b3_00421', 'pack_serial_no': '00345',
+                         'initial_date': datetime(2016, 5, 1, 9, 12, 40)}
+        records = [(0x03, START_TIME, (28, 88, 45, 3892, 3895, 3910, 12, 25, 27, 108970, 0)),
+                   (0x08, START_TIME, (0,))]
+        with TemporaryDirectory() as directory:
+            log_filepath = os.path.join(directory, '538SD9Z37GCG06073_BMS0_2018-05-13.bin')
+            write_binary_log(log_filepath, header_values, records, log_source='BMS')
+            log_file = ZeroBinaryLogFile(log_filepath)
+        self.assertEqual('BMS', log_file.header.log_source)
+        self.assertEqual(datetime(2016, 5, 1, 9, 12, 40), log_file.header.bms_metadata.initial_date)
+        self.assertEqual(['Discharge level', 'Contactor was Opened'], [entry.event for entry in log_file.entries])
+        self.assertEqual('88%', log_file.entries[0].conditions['SOC'])
+        self.assertEqual('28', log_file.entries[0].conditions['AH'])
@@ -0,0 +1,132 @@
+import time
+import asyncio
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+from serve_logs import ExtractionServer
+from test_extract_ride_data import MBB_LOG_HEADER, MBB_LOG_ENTRIES
+
+MBB_LOG_TEXT = MBB_LOG_HEADER + '\n'.join(MBB_LOG_ENTRIES) + '\n'
+
+
+def decode_chunked(body: bytes) -> bytes:
+    decoded = b''
+    while True:
+        size_line, _, body = body.partition(b'\r\n')
+        size = int(size_line, 16)
+        if size == 0:
+            return decoded
+        decoded += body[:size]
+        body = body[size + 2:]
+
+
+async def send_request(server_address, method, target, body=b''):
+    reader, writer = await asyncio.open_connection(*server_address)
+    writer.write('{} {} HTTP/1.1\r\nHost: localhost\r\nContent-Length: {}\r\n\r\n'.format(
+        method, target, len(body)).encode() + body)
+    response = b''
+    try:
+        chunk = await reader.read(4096)
+        while chunk:
+            response += chunk
+            chunk = await reader.read(4096)
+    except ConnectionError:
+        pass  # Dropped by the server; keep what was received.
+    writer.close()
+    return response
+
+
+def extract_then_fail(log_filepath, output_filepath, output_format, omit_units=False):
+    with open(output_filepath, 'w') as output_file:
+        output_file.write('entry,segment_id\n1,0\n')
+    time.sleep(0.05)
+    raise ValueError('Decoder crashed')
+
+
+class FailingExtractionServer(ExtractionServer):
+    extract_job = staticmethod(extract_then_fail)
+
+
+class TestExtractionServer(TestCase):
+    def request(self, server_address, method, target, body=b''):
+        return self.parse_response(self.loop.run_until_complete(send_request(server_address, method, target, body)))
+
+    @staticmethod
+    def parse_response(response):
+        head, _, body = response.partition(b'\r\n\r\n')
+        status = int(head.split()[1])
+        if b'Transfer-Encoding: chunked' in head:
+            body = decode_chunked(body)
+        return status, body
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.cache_dir = TemporaryDirectory()
+        self.server = ExtractionServer(self.cache_dir.name, max_upload_bytes=64 * 1024, max_workers=1,
+                                       max_concurrent=1, use_processes=False)
+        self.listener = self.loop.run_until_complete(self.server.start(port=0))
+        self.address = self.listener.sockets[0].getsockname()[:2]
+
+    def tearDown(self):
+        self.listener.close()
+        self.loop.run_until_complete(self.listener.wait_closed())
+        self.server.close()
+        self.loop.close()
+        self.cache_dir.cleanup()
+
+    def test_extract_and_cache(self):
+        status, body = self.request(self.address, 'POST', '/extract?format=csv', MBB_LOG_TEXT.encode())
+        self.assertEqual(200, status)
+        csv_lines = body.decode().splitlines()
+        self.assertTrue(csv_lines[0].startswith('entry,segment_id,segment_activity,timestamp'))
+        self.assertEqual(len(MBB_LOG_ENTRIES) + 1, len(csv_lines))
+        self.assertEqual(0, self.server.stats['cache_hits'])
+
+        status, cached_body = self.request(self.address, 'POST', '/extract?format=csv', MBB_LOG_TEXT.encode())
+        self.assertEqual(200, status)
+        self.assertEqual(body, cached_body)
+        self.assertEqual(1, self.server.stats['cache_hits'])
+        self.assertEqual(1, self.server.stats['extractions'])
+
+    def test_identical_uploads_waiting_for_a_slot(self):
+        other_log = (MBB_LOG_HEADER + '\n'.join(MBB_LOG_ENTRIES[:3]) + '\n').encode()
+
+        async def send_all():
+            # The first upload takes the only job slot; the identical ones behind it must extract once.
+            return await asyncio.gather(*[send_request(self.address, 'POST', '/extract?format=csv', body)
+                                          for body in [other_log, MBB_LOG_TEXT.encode(), MBB_LOG_TEXT.encode()]])
+        responses = [self.parse_response(response) for response in self.loop.run_until_complete(send_all())]
+        self.assertEqual([200, 200, 200], [status for status, _ in responses])
+        self.assertEqual(responses[1][1], responses[2][1])
+        self.assertEqual(len(MBB_LOG_ENTRIES) + 1, len(responses[2][1].decode().splitlines()))
+        self.assertEqual(2, self.server.stats['extractions'])
+        self.assertEqual(1, self.server.stats['cache_hits'])
+        self.assertEqual({}, self.server.jobs_in_progress)
+
+    def test_errors(self):
+        status, _ = self.request(self.address, 'POST', '/extract?format=csv', b'x' * (64 * 1024 + 1))
+        self.assertEqual(413, status)
+        status, _ = self.request(self.address, 'POST', '/extract?format=csv', b'not a log\n')
+        self.assertEqual(422, status)
+        status, _ = self.request(self.address, 'POST', '/extract?format=xml', MBB_LOG_TEXT.encode())
+        self.assertEqual(400, status)
+        status, _ = self.request(self.address, 'GET', '/extract')
+        self.assertEqual(405, status)
+
+    def test_worker_failing_mid_stream(self):
+        server = FailingExtractionServer(self.cache_dir.name, max_workers=1, use_processes=False, verbose=-1)
+        listener = self.loop.run_until_complete(server.start(port=0))
+        try:
+            response = self.loop.run_until_complete(send_request(listener.sockets[0].getsockname()[:2], 'POST',
+                                                                 '/extract?format=csv', MBB_LOG_TEXT.encode()))
+        finally:
+            listener.close()
+            self.loop.run_until_complete(listener.wait_closed())
+            server.close()
+        head, _, body = response.partition(b'\r\n\r\n')
+        self.assertTrue(head.startswith(b'HTTP/1.1 200 OK'))
+        self.assertEqual(1, head.count(b'HTTP/1.1'))
+        self.assertIn(b'1,0', body)
+        self.assertFalse(body.endswith(b'0\r\n\r\n'))
+        self.assertEqual(1, server.stats['errors'])
+        self.assertEqual(0, server.stats['extractions'])
+        self.assertEqual({}, server.jobs_in_progress)
@@ -0,0 +1,62 @@
+import os
+import json
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+from extract_ride_data import ZeroLogFile, JoinedLog
+from stage_profiler import StageProfiler
+from test_extract_ride_data import MBB_LOG_ENTRIES, write_mbb_log
+
+
+class TestStageProfiler(TestCase):
+    def test_profile_stages(self):
+        with TemporaryDirectory() as directory, StageProfiler() as profiler:
+            log_file = ZeroLogFile(write_mbb_log(directory, MBB_LOG_ENTRIES), profiler=profiler)
+            log_file.output_to_file(os.path.join(directory, 'log.csv'), 'csv', verbose=-1)
+            report_filepath = os.path.join(directory, 'profile.json')
+            profiler.save(report_filepath)
+            with open(report_filepath) as report_file:
+                report = json.load(report_file)
+        self.assertEqual(['read', 'header', 'decode', 'annotate', 'select', 'conditions_keys', 'write_csv'],
+                         list(report['stages']))
+        self.assertEqual(len(MBB_LOG_ENTRIES), report['stages']['decode']['entries'])
+        self.assertEqual(1, report['stages']['write_csv']['calls'])
+        self.assertGreater(report['stages']['decode']['allocated_bytes'], 0)
+        self.assertEqual({'MBB_RIDING': 1, 'MBB_LIMIT': 1, 'MBB_CHARGING': 2, 'Battery': 1, 'Controller': 1},
+                         {family: record['count'] for family, record in report['message_families'].items()})
+        self.assertEqual({'module_number': 1, 'current_limited': 1},
+                         {branch: record['count'] for branch, record in report['special_conditions'].items()})
+        for branch, record in report['special_conditions'].items():
+            self.assertLess(record['seconds'], report['message_families']['MBB_LIMIT' if branch == 'current_limited'
+                                                                          else 'Battery']['seconds'])
+
+    def test_without_allocation_tracing(self):
+        profiler = StageProfiler(trace_allocations=False)
+        with profiler, profiler.stage('work') as stage:
+            stage['entries'] = 3
+        self.assertEqual(3, profiler.stages['work']['entries'])
+        self.assertEqual(0, profiler.stages['work']['allocated_bytes'])
+
+    def test_nested_stages_keep_outer_peak(self):
+        with StageProfiler() as profiler:
+            with profiler.stage('outer'):
+                scratch = bytearray(4 * 1024 * 1024)
+                del scratch
+                with profiler.stage('inner'):
+                    pass
+        self.assertGreaterEqual(profiler.stages['outer']['peak_bytes'], 4 * 1024 * 1024)
+        self.assertLess(profiler.stages['inner']['peak_bytes'], 1024 * 1024)
+        self.assertEqual([], profiler.outer_peaks)
+
+    def test_joined_log_load(self):
+        with TemporaryDirectory() as directory:
+            primary_filepath = write_mbb_log(directory, MBB_LOG_ENTRIES, name='primary.txt')
+            secondary_filepath = write_mbb_log(directory, MBB_LOG_ENTRIES[:3], name='secondary.txt')
+            profiler = StageProfiler()
+            joined_log = JoinedLog.load(primary_filepath, {'other': secondary_filepath}, max_workers=2,
+                                        profiler=profiler, verbose=-1)
+        self.assertEqual(2, profiler.stages['decode']['calls'])
+        self.assertEqual(len(MBB_LOG_ENTRIES) + 3, profiler.stages['decode']['entries'])
+        self.assertGreater(profiler.stages['decode']['allocated_bytes'], 0)
+        self.assertEqual(len(MBB_LOG_ENTRIES) + 3,
+                         sum(record['count'] for record in profiler.message_families.values()))
+        self.assertIs(profiler, joined_log.secondary_logs['other'].profiler)
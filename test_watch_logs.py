@@ -0,0 +1,106 @@
+import os
+import time
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+from watch_logs import LogWatcher
+from test_extract_ride_data import write_mbb_log, MBB_LOG_ENTRIES
+
+
+class TestLogWatcher(TestCase):
+    def make_watcher(self, directory, **kwargs):
+        return LogWatcher([os.path.join(directory, 'incoming')], os.path.join(directory, 'out'), ['csv'],
+                          os.path.join(directory, 'state.sqlite'), max_workers=1, use_processes=False,
+                          verbose=-1, **kwargs)
+
+    def wait_for_workers(self, watcher):
+        deadline = time.time() + 10
+        while watcher.in_flight and time.time() < deadline:
+            time.sleep(0.01)
+
+    def test_waits_for_settled_files_and_skips_processed(self):
+        with TemporaryDirectory() as directory:
+            os.mkdir(os.path.join(directory, 'incoming'))
+            os.mkdir(os.path.join(directory, 'out'))
+            log_filepath = write_mbb_log(os.path.join(directory, 'incoming'), MBB_LOG_ENTRIES[:3])
+            watcher = self.make_watcher(directory)
+            self.assertEqual([], watcher.poll_once())
+            write_mbb_log(os.path.join(directory, 'incoming'), MBB_LOG_ENTRIES)
+            self.assertEqual([], watcher.poll_once())
+            self.assertEqual([log_filepath], watcher.poll_once())
+            watcher.close()
+            self.assertEqual(1, watcher.stats.files_processed)
+            self.assertEqual(len(MBB_LOG_ENTRIES), watcher.stats.entries_processed)
+            self.assertEqual(0, watcher.stats.queue_depth)
+            self.assertTrue(os.path.exists(os.path.join(directory, 'out', 'log.csv')))
+
+            watcher = self.make_watcher(directory)
+            self.assertEqual([], watcher.poll_once())
+            self.assertEqual([], watcher.poll_once())
+            watcher.close()
+
+    def test_failed_files_are_counted(self):
+        with TemporaryDirectory() as directory:
+            os.mkdir(os.path.join(directory, 'incoming'))
+            with open(os.path.join(directory, 'incoming', 'broken.txt'), 'w') as broken_file:
+                broken_file.write('not a log\n')
+            watcher = self.make_watcher(directory)
+            watcher.poll_once()
+            watcher.poll_once()
+            self.wait_for_workers(watcher)
+            self.assertEqual([], watcher.poll_once())
+            self.assertEqual([], watcher.poll_once())
+            watcher.close()
+            self.assertEqual(1, watcher.stats.files_failed)
+            self.assertEqual(0, watcher.stats.files_processed)
+
+    def test_failed_files_are_retried(self):
+        with TemporaryDirectory() as directory:
+            os.mkdir(os.path.join(directory, 'incoming'))
+            os.mkdir(os.path.join(directory, 'out'))
+            log_filepath = os.path.join(directory, 'incoming', 'log.txt')
+            with open(log_filepath, 'w') as broken_file:
+                broken_file.write('not a log\n')
+            watcher = self.make_watcher(directory, retry_delay=0)
+            watcher.poll_once()
+            self.assertEqual([log_filepath], watcher.poll_once())
+            self.wait_for_workers(watcher)
+            watcher.poll_once()
+            self.assertEqual([log_filepath], watcher.poll_once())
+            self.wait_for_workers(watcher)
+            self.assertEqual(2, watcher.stats.files_failed)
+
+            write_mbb_log(os.path.join(directory, 'incoming'), MBB_LOG_ENTRIES)
+            watcher.poll_once()
+            self.assertEqual([log_filepath], watcher.poll_once())
+            watcher.close()
+            self.assertEqual(1, watcher.stats.files_processed)
+            self.assertEqual({}, watcher.failures)
+
+    def test_outputs_of_several_directories(self):
+        with TemporaryDirectory() as directory:
+            watch_dirs = [os.path.join(directory, 'bike1', 'logs'), os.path.join(directory, 'bike2', 'logs')]
+            for watch_dir in watch_dirs:
+                os.makedirs(watch_dir)
+                write_mbb_log(watch_dir, MBB_LOG_ENTRIES)
+            watcher = LogWatcher(watch_dirs, os.path.join(directory, 'out'), ['csv'],
+                                 os.path.join(directory, 'state.sqlite'), max_workers=1, use_processes=False,
+                                 verbose=-1)
+            watcher.poll_once()
+            self.assertEqual(2, len(watcher.poll_once()))
+            watcher.close()
+            self.assertTrue(os.path.exists(os.path.join(directory, 'out', 'bike1', 'logs', 'log.csv')))
+            self.assertTrue(os.path.exists(os.path.join(directory, 'out', 'bike2', 'logs', 'log.csv')))
+
+    def test_ignores_own_files(self):
+        with TemporaryDirectory() as directory:
+            log_filepath = write_mbb_log(directory, MBB_LOG_ENTRIES)
+            watcher = LogWatcher([directory], None, ['csv', 'json'], os.path.join(directory, 'state.sqlite'),
+                                 pattern='*', max_workers=1, use_processes=False, verbose=-1)
+            watcher.poll_once()
+            self.assertEqual([log_filepath], watcher.poll_once())
+            watcher.close()
+            self.assertTrue(os.path.exists(os.path.join(directory, 'log.json')))
+            watcher = LogWatcher([directory], None, ['csv', 'json'], os.path.join(directory, 'state.sqlite'),
+                                 pattern='*', max_workers=1, use_processes=False, verbose=-1)
+            self.assertEqual([log_filepath], list(watcher.candidate_files()))
+            watcher.close()
@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+
+"""
+Watch folders for decoded Zero log files and extract each new one as it arrives.
+
+Directories are polled for files matching a pattern. A file is queued once its size and
+modification time stop changing between polls, so logs still being copied are left alone.
+Queued logs go to a bounded pool of workers that run the same ZeroLogFile/output_to_file path
+as extract_ride_data.py. A small SQLite database records which files were processed, so they
+are skipped when the daemon restarts. Files that fail are retried, waiting twice as long after
+each failure, and at once if they change.
+"""
+
+import os
+import json
+import time
+import sqlite3
+import fnmatch
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, Future
+from typing import List, Dict, Set, Tuple, Optional
+
+from extract_ride_data import ZeroLogFile, strip_compression_suffix
+
+FileSignature = Tuple[int, float]
+
+DEFAULT_RETRY_DELAY = 60.0
+MAX_RETRY_DELAY = 3600.0
+
+
+def extract_log_file(log_filepath: str, output_dir: str, output_formats: List[str],
+                     omit_units=False) -> int:
+    """Extract one log into each output format, returning how many entries it had."""
+    log_file = ZeroLogFile(log_filepath, verbose=-1)
+    os.makedirs(output_dir, exist_ok=True)
+    log_filename = strip_compression_suffix(os.path.basename(log_filepath))
+    base_filepath = os.path.join(output_dir, os.path.splitext(log_filename)[0])
+    for output_format in output_formats:
+        log_file.output_to_file(base_filepath + '.' + output_format, output_format,
+                                omit_units=omit_units, verbose=-1)
+    return len(log_file.entries)
+
+
+class ProcessedFilesDB:
+    """Remember which log files were processed, by path, size and modification time."""
+
+    def __init__(self, db_filepath: str):
+        self.connection = sqlite3.connect(db_filepath, check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock:
+            self.connection.execute('''CREATE TABLE IF NOT EXISTS processed_files (
+                path TEXT PRIMARY KEY, size INTEGER, mtime REAL,
+                status TEXT, entries INTEGER, error TEXT, processed_at REAL)''')
+            self.connection.commit()
+
+    def is_processed(self, log_filepath: str, signature: FileSignature) -> bool:
+        """Whether this version of the file was already processed successfully."""
+        with self.lock:
+            row = self.connection.execute("SELECT size, mtime FROM processed_files WHERE path = ? AND status = 'done'",
+                                          (log_filepath,)).fetchone()
+        return row is not None and tuple(row) == tuple(signature)
+
+    def record(self, log_filepath: str, signature: FileSignature, status: str,
+               entries=None, error=None):
+        """Record the outcome of processing a file."""
+        with self.lock:
+            self.connection.execute('INSERT OR REPLACE INTO processed_files VALUES (?, ?, ?, ?, ?, ?, ?)',
+                                    (log_filepath, signature[0], signature[1], status,
+                                     entries, error, time.time()))
+            self.connection.commit()
+
+    def close(self):
+        """Close the database."""
+        with self.lock:
+            self.connection.close()
+
+
+class WatchStats:
+    """Counters describing the daemon's backlog and throughput."""
+    started_at: float
+    files_queued: int = 0
+    files_processed: int = 0
+    files_failed: int = 0
+    entries_processed: int = 0
+    busy_seconds: float = 0.0
+
+    def __init__(self):
+        self.started_at = time.time()
+        self.lock = threading.Lock()
+
+    @property
+    def queue_depth(self) -> int:
+        """Files queued but not yet finished."""
+        return self.files_queued - self.files_processed - self.files_failed
+
+    def to_json(self) -> Dict[str, float]:
+        """Convert to JSON-serializable data structure."""
+        with self.lock:
+            elapsed = max(time.time() - self.started_at, 1e-9)
+            return {
+                'queue_depth': self.queue_depth,
+                'files_queued': self.files_queued,
+                'files_processed': self.files_processed,
+                'files_failed': self.files_failed,
+                'entries_processed': self.entries_processed,
+                'files_per_minute': self.files_processed * 60 / elapsed,
+                'entries_per_second': self.entries_processed / elapsed,
+                'entries_per_busy_second': self.entries_processed / self.busy_seconds if self.busy_seconds else 0.0,
+                'uptime_seconds': elapsed
+            }
+
+
+class LogWatcher:
+    """Poll directories for settled log files and extract them in a bounded worker pool.
+    Workers finish on other threads, so the files in flight and the failures are shared under a lock."""
+    pending_signatures: Dict[str, FileSignature]
+    in_flight: Set[str]
+    # By path: the signature of the version that failed, how many times in a row, and when to retry it.
+    failures: Dict[str, Tuple[FileSignature, int, float]]
+
+    def __init__(self, watch_dirs: List[str], output_dir: Optional[str], output_formats: List[str],
+                 state_db_filepath: str, pattern='*.txt', max_workers=2, max_queued=None,
+                 retry_delay=DEFAULT_RETRY_DELAY, omit_units=False, use_processes=True, verbose=0):
+        self.watch_dirs = watch_dirs
+        self.output_dir = output_dir
+        # Outputs of logs from several watched directories are kept apart under their paths below this one.
+        self.common_watch_dir = os.path.commonpath([os.path.abspath(watch_dir) for watch_dir in watch_dirs])
+        self.state_db_filepath = os.path.abspath(state_db_filepath)
+        self.output_formats = output_formats
+        self.pattern = pattern
+        self.omit_units = omit_units
+        self.verbose = verbose
+        self.state_db = ProcessedFilesDB(state_db_filepath)
+        self.stats = WatchStats()
+        self.pending_signatures = {}
+        self.retry_delay = retry_delay
+        self.lock = threading.Lock()
+        self.in_flight = set()
+        self.failures = {}
+        self.queue_slots = threading.BoundedSemaphore(max_queued or max_workers * 2)
+        executor_class = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+        self.executor = executor_class(max_workers=max_workers)
+
+    def candidate_files(self) -> Dict[str, FileSignature]:
+        """Files in the watched directories matching the pattern, with their current signature."""
+        candidates = {}
+        for watch_dir in self.watch_dirs:
+            for entry in os.scandir(watch_dir):
+                if entry.is_file() and fnmatch.fnmatch(entry.name, self.pattern) and not self.is_own_file(entry.path):
+                    stat = entry.stat()
+                    candidates[entry.path] = (stat.st_size, stat.st_mtime)
+        return candidates
+
+    def is_own_file(self, filepath: str) -> bool:
+        """Whether the file is one the watcher writes, like an output next to its log or the state database."""
+        return filepath.endswith(tuple('.' + output_format for output_format in self.output_formats)) or \
+            os.path.abspath(filepath).startswith(self.state_db_filepath)
+
+    def output_dir_for(self, log_filepath: str) -> str:
+        """Where the outputs of a log go: next to it, or under the output directory at the path of its watched
+        directory below the common parent of all of them, so logs of the same name do not overwrite each other."""
+        log_dir = os.path.dirname(log_filepath)
+        if not self.output_dir:
+            return log_dir
+        return os.path.normpath(os.path.join(self.output_dir,
+                                             os.path.relpath(os.path.abspath(log_dir), self.common_watch_dir)))
+
+    def poll_once(self, block=True) -> List[str]:
+        """Queue files whose signature has not changed since the previous poll.
+        Returns the files queued; when not blocking, files beyond the queue bound wait for a later poll."""
+        queued = []
+        candidates = self.candidate_files()
+        with self.lock:
+            in_flight = set(self.in_flight)
+            failures = dict(self.failures)
+        for log_filepath, signature in candidates.items():
+            if log_filepath in in_flight or self.state_db.is_processed(log_filepath, signature):
+                self.pending_signatures.pop(log_filepath, None)
+                continue
+            failure = failures.get(log_filepath)
+            if failure and failure[0] == signature and time.time() < failure[2]:
+                # Failed as it is; wait before retrying, unless it changes.
+                continue
+            if self.pending_signatures.get(log_filepath) != signature:
+                # New or still growing; check again on the next poll.
+                self.pending_signatures[log_filepath] = signature
+                continue
+            if not self.queue_slots.acquire(blocking=block):
+                break
+            del self.pending_signatures[log_filepath]
+            self.submit(log_filepath, signature)
+            queued.append(log_filepath)
+        for log_filepath in set(self.pending_signatures) - set(candidates):
+            del self.pending_signatures[log_filepath]
+        return queued
+
+    def submit(self, log_filepath: str, signature: FileSignature):
+        """Hand a settled log file to the worker pool."""
+        if self.verbose > 0:
+            print('Queueing log: {}'.format(log_filepath))
+        output_dir = self.output_dir_for(log_filepath)
+        with self.lock:
+            self.in_flight.add(log_filepath)
+        with self.stats.lock:
+            self.stats.files_queued += 1
+        started_at = time.time()
+        future = self.executor.submit(extract_log_file, log_filepath, output_dir,
+                                      self.output_formats, self.omit_units)
+        future.add_done_callback(lambda done: self.finished(log_filepath, signature, started_at, done))
+
+    def finished(self, log_filepath: str, signature: FileSignature, started_at: float, future: Future):
+        """Record the outcome of a worker and free its queue slot."""
+        try:
+            error = future.exception()
+            with self.stats.lock:
+                self.stats.busy_seconds += time.time() - started_at
+                if error is None:
+                    self.stats.files_processed += 1
+                    self.stats.entries_processed += future.result()
+                else:
+                    self.stats.files_failed += 1
+            if error is None:
+                self.state_db.record(log_filepath, signature, 'done', entries=future.result())
+                if self.verbose >= 0:
+                    print('Extracted {} entries from: {}'.format(future.result(), log_filepath))
+            else:
+                # Recorded for inspection, but not as processed: the file is retried.
+                self.state_db.record(log_filepath, signature, 'failed', error=repr(error))
+                retry_delay = self.note_failure(log_filepath, signature)
+                print('Failed to extract {}: {!r}; retrying in {:.0f}s'.format(log_filepath, error, retry_delay))
+        finally:
+            with self.lock:
+                self.in_flight.discard(log_filepath)
+                if error is None:
+                    self.failures.pop(log_filepath, None)
+            self.queue_slots.release()
+
+    def note_failure(self, log_filepath: str, signature: FileSignature) -> float:
+        """Count a failure of this version of the file, and return how long to wait before retrying it."""
+        with self.lock:
+            previous = self.failures.get(log_filepath)
+            attempts = previous[1] + 1 if previous and previous[0] == signature else 1
+            retry_delay = min(self.retry_delay * 2 ** (attempts - 1), MAX_RETRY_DELAY)
+            self.failures[log_filepath] = (signature, attempts, time.time() + retry_delay)
+        return retry_delay
+
+    def run(self, poll_interval=5.0, stats_interval=60.0, stats_filepath=None):
+        """Poll until interrupted, reporting stats every so often."""
+        next_stats_at = time.time() + stats_interval
+        try:
+            while True:
+                self.poll_once()
+                if time.time() >= next_stats_at:
+                    self.report_stats(stats_filepath)
+                    next_stats_at = time.time() + stats_interval
+                time.sleep(poll_interval)
+        except KeyboardInterrupt:
+            print('Stopping; waiting for {} queued logs'.format(self.stats.queue_depth))
+        finally:
+            self.close()
+            self.report_stats(stats_filepath)
+
+    def report_stats(self, stats_filepath=None):
+        """Print the counters, and write them to a file for other tools to read."""
+        stats = self.stats.to_json()
+        if self.verbose >= 0:
+            print('Queue depth {queue_depth}, {files_processed} logs processed, {files_failed} failed,'
+                  ' {entries_per_second:.1f} entries/s'.format(**stats))
+        if stats_filepath:
+            with open(stats_filepath, 'w') as stats_file:
+                json.dump(stats, stats_file, indent=2)
+
+    def close(self):
+        """Wait for the queued logs and release resources."""
+        self.executor.shutdown(wait=True)
+        self.state_db.close()
+
+
+if __name__ == "__main__":
+    import sys
+    import signal
+    import argparse
+
+    ARGS_PARSER = argparse.ArgumentParser()
+    ARGS_PARSER.add_argument("watch_dirs", nargs='+',
+                             help="the directories to watch for parsed log files")
+    ARGS_PARSER.add_argument("--format", action='append', dest='formats',
+                             choices=['csv', 'tsv', 'json', 'jsonl', 'sqlite'],
+                             help="an output format to emit; may be repeated (default: csv and json)")
+    ARGS_PARSER.add_argument("--outdir",
+                             help="where to emit outputs (default: next to each log)")
+    ARGS_PARSER.add_argument("--pattern", default='*.txt',
+                             help="which file names in the watched directories are logs")
+    ARGS_PARSER.add_argument("--state-db", dest='state_db', default='watch_logs_state.sqlite',
+                             help="the database of already processed files")
+    ARGS_PARSER.add_argument("--workers", type=int, default=os.cpu_count() or 2,
+                             help="how many logs to extract at once")
+    ARGS_PARSER.add_argument("--max-queued", type=int, dest='max_queued',
+                             help="how many logs may be queued or in progress (default: twice the workers)")
+    ARGS_PARSER.add_argument("--poll-interval", type=float, default=5.0, dest='poll_interval',
+                             help="seconds between directory scans; a log must be unchanged for one interval")
+    ARGS_PARSER.add_argument("--retry-delay", type=float, default=DEFAULT_RETRY_DELAY, dest='retry_delay',
+                             help="seconds to wait before retrying a log that failed, doubled after each failure")
+    ARGS_PARSER.add_argument("--stats-interval", type=float, default=60.0, dest='stats_interval',
+                             help="seconds between reports of the queue depth and throughput")
+    ARGS_PARSER.add_argument("--stats-file", dest='stats_file',
+                             help="a JSON file to keep updated with the counters")
+    ARGS_PARSER.add_argument("--omit-units",
+                             action='store_true', dest='omit_units',
+                             help="omit units from the data values")
+    ARGS_PARSER.add_argument("--verbose", "-v",
+                             action='count', default=0,
+                             help="show more processing details")
+
+    CLI_ARGS = ARGS_PARSER.parse_args()
+    for WATCH_DIR in CLI_ARGS.watch_dirs:
+        if not os.path.isdir(WATCH_DIR):
+            print("Directory does not exist: ", WATCH_DIR)
+            sys.exit(1)
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    WATCHER = LogWatcher(CLI_ARGS.watch_dirs, CLI_ARGS.outdir, CLI_ARGS.formats or ['csv', 'json'],
+                         CLI_ARGS.state_db, pattern=CLI_ARGS.pattern, max_workers=CLI_ARGS.workers,
+                         max_queued=CLI_ARGS.max_queued, retry_delay=CLI_ARGS.retry_delay,
+                         omit_units=CLI_ARGS.omit_units,
+                         verbose=CLI_ARGS.verbose)
+    print('Watching for logs in: {}'.format(', '.join(CLI_ARGS.watch_dirs)))
+    WATCHER.run(poll_interval=CLI_ARGS.poll_interval, stats_interval=CLI_ARGS.stats_interval,
+                stats_filepath=CLI_ARGS.stats_file)